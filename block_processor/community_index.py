@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+# Import python libraries
+import os
+import sys
+import json
+import shutil
+import argparse
+
+# Import custom python libraries
+try:
+    from pyrainbowterm import *
+except ImportError:
+    print('Can not import pyrainbowterm!', log_type='error')
+    print('Try: pip install pyrainbowterm', log_type='hint')
+    sys.exit(1)
+
+try:
+    import numpy as np
+except ImportError as e:
+    print('Can not import python numpy library! ERROR: {}'.format(e), log_type='error')
+    sys.exit(1)
+
+# Import file_operations
+import file_operations
+
+# Source code meta data
+__author__ = 'Dalwar Hossain'
+__email__ = 'dalwar.hossain@protonmail.com'
+
+# Arrays of an index directory: {name: description}
+INDEX_ARRAYS = {
+    'nodes': 'sorted node ids',
+    'node_communities': 'community of every node of nodes',
+    'communities': 'sorted community ids',
+    'offsets': 'slice bounds of every community in members',
+    'members': 'nodes grouped by community (sorted inside every community)',
+}
+
+# Written last, an index is complete when its meta file exists
+META_FILE = 'meta.json'
+
+
+# Default index directory of a community file
+def index_directory(community_file=None):
+    """
+    This function generates the index directory name of a community file (<community file>.index)
+    :param community_file: Community (.npz/.pkl) file path
+    :return: index directory path
+    """
+    # Return
+    return community_file.rsplit('.', 1)[0] + '.index'
+
+
+# Build a community index
+def build_index(nodes=None, membership=None, index_dir=None):
+    """
+    This function writes the membership as a directory of .npy arrays (see INDEX_ARRAYS) that are memory mapped by
+    open_index(). The arrays are written to a temporary directory that replaces index_dir once complete, errors
+    are raised (IOError/OSError) so a long running caller (community_service.py) can keep its current index
+    :param nodes: numpy array of nodes
+    :param membership: numpy array of community ids of the nodes
+    :param index_dir: Index directory path
+    :return: <> file object <>
+    """
+    nodes = np.asarray(nodes)
+    nodes = nodes.astype(str) if nodes.dtype == object else nodes
+    membership = np.asarray(membership, dtype=np.int64)
+    node_order = np.argsort(nodes, kind='mergesort')
+    member_order = np.lexsort((nodes, membership))
+    communities, offsets = np.unique(membership[member_order], return_index=True)
+    arrays = {
+        'nodes': nodes[node_order],
+        'node_communities': membership[node_order],
+        'communities': communities,
+        'offsets': np.append(offsets, len(membership)).astype(np.int64),
+        'members': nodes[member_order],
+    }
+    meta = {'nodes': len(nodes), 'communities': len(communities), 'node_type': str(nodes.dtype)}
+
+    temp_dir = index_dir.rstrip(os.sep) + '.tmp'
+    print('Creating community index: {}'.format(index_dir), log_type='info')
+    try:
+        if os.path.isdir(temp_dir):
+            shutil.rmtree(temp_dir)
+        os.makedirs(temp_dir)
+        for name, array in arrays.items():
+            np.save(os.path.join(temp_dir, name + '.npy'), array)
+        with open(os.path.join(temp_dir, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+
+        # Swap the complete index in place of the old one
+        if os.path.isdir(index_dir):
+            shutil.rmtree(index_dir)
+        os.rename(temp_dir, index_dir)
+    except Exception:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+
+# Open a community index
+def open_index(index_dir=None):
+    """
+    This function memory maps the arrays of an index directory, nothing is read until it is queried. Errors are
+    raised (IOError/OSError/ValueError), see build_index()
+    :param index_dir: Index directory path
+    :return: python dictionary of memory mapped arrays (and the meta data under 'meta')
+    """
+    with open(os.path.join(index_dir, META_FILE)) as f:
+        index = {'meta': json.load(f)}
+    for name in INDEX_ARRAYS:
+        index[name] = np.load(os.path.join(index_dir, name + '.npy'), mmap_mode='r')
+
+    # Return
+    return index
+
+
+# Convert query values to the node type of an index
+def as_index_type(index=None, values=None, name='nodes'):
+    """
+    This function converts query values (e.g. strings from the command line) to the type of an index array
+    :param index: Index returned by open_index()
+    :param values: Query values
+    :param name: Name of the index array the values are looked up in
+    :return: numpy array of query values, numpy boolean array (False for values that can not be converted)
+    """
+    values = np.asarray(values)
+    valid = np.ones(len(values), dtype=bool)
+    dtype = index[name].dtype
+    if dtype.kind in 'iu' and values.dtype.kind not in 'iu':
+        try:
+            values = values.astype(np.int64)
+        except (ValueError, OverflowError, TypeError):
+            # Convert one by one, values that are not integers can not be in the index
+            converted = np.zeros(len(values), dtype=np.int64)
+            for i, value in enumerate(values.tolist()):
+                try:
+                    converted[i] = int(value)
+                except (ValueError, OverflowError, TypeError):
+                    valid[i] = False
+            values = converted
+    elif dtype.kind == 'U' and values.dtype.kind != 'U':
+        values = values.astype(str)
+
+    # Return
+    return values, valid
+
+
+# Look up the communities of nodes
+def lookup_nodes(index=None, query_nodes=None):
+    """
+    This function finds the community of every query node with a binary search (O(log n) per node)
+    :param index: Index returned by open_index()
+    :param query_nodes: Nodes to look up
+    :return: numpy array of community ids (-1 for nodes that are not in the index)
+    """
+    query_nodes, valid = as_index_type(index, query_nodes, 'nodes')
+    nodes = index['nodes']
+    position = np.searchsorted(nodes, query_nodes)
+    found = valid & (position < len(nodes))
+    found[found] = nodes[position[found]] == query_nodes[found]
+    communities = np.full(len(query_nodes), -1, dtype=np.int64)
+    communities[found] = index['node_communities'][position[found]]
+
+    # Return
+    return communities
+
+
+# Members of a community
+def community_members(index=None, community=None):
+    """
+    This function returns the members of a community with a binary search in the community table
+    :param index: Index returned by open_index()
+    :param community: Community id
+    :return: numpy array of nodes (empty for unknown communities)
+    """
+    communities = index['communities']
+    position = int(np.searchsorted(communities, community))
+    if position == len(communities) or communities[position] != community:
+        return index['members'][:0]
+
+    # Return
+    return index['members'][index['offsets'][position]:index['offsets'][position + 1]]
+
+
+# Command Center
+def command_center(community_file=None, index_dir=None, query_nodes=None, community=None):
+    """
+    This function controls the other functions
+    :param community_file: Community (.npz/.pkl) file to build the index from
+    :param index_dir: Index directory path (default: <community file>.index)
+    :param query_nodes: Nodes to look up
+    :param community: Community id whose members are listed
+    :return: <>
+    """
+    if community_file:
+        index_dir = index_dir or index_directory(community_file)
+        nodes, membership = file_operations.read_community_file(community_file)
+        try:
+            build_index(nodes, membership, index_dir)
+        except Exception as e:
+            print('Can not create community index! ERROR: {}'.format(e), log_type='error')
+            sys.exit(1)
+    try:
+        index = open_index(index_dir)
+    except Exception as e:
+        print('Can not open community index! ERROR: {}'.format(e), log_type='error')
+        sys.exit(1)
+    try:
+        node_communities = lookup_nodes(index, query_nodes).tolist() if query_nodes else []
+        members = community_members(index, community).tolist() if community is not None else []
+    except (ValueError, OverflowError, TypeError) as e:
+        print('Can not query community index! ERROR: {}'.format(e), log_type='error')
+        sys.exit(1)
+    for node, node_community in zip(query_nodes or [], node_communities):
+        print('{}\t{}'.format(node, node_community if node_community >= 0 else 'NA'))
+    for node in members:
+        print(node)
+
+
+# Standard boilerplate for running this source code file as a standalone segment
+if __name__ == '__main__':
+    """
+    Parse arguments and follow through to mission control
+    """
+    # Create parser
+    parser = argparse.ArgumentParser(prog='community_index.py',
+                                     usage='python %(prog)s -c <community_file> | -x <index_dir> <queries>',
+                                     description='Build and query a memory mapped community membership index',
+                                     add_help=True)
+
+    parser.add_argument('-c', '--community-file', action='store', dest='community_file', required=False,
+                        help='Community (.npz/.pkl) file to build the index from. E.g. /home/user/data/Louvain_x.pkl')
+    parser.add_argument('-x', '--index', action='store', dest='index', required=False,
+                        help='Index directory. Default is <community file>.index')
+    parser.add_argument('-n', '--nodes', action='store', dest='nodes', required=False, nargs='+',
+                        help='Nodes to look up (prints <node> <community>, NA for unknown nodes)')
+    parser.add_argument('-m', '--members', action='store', dest='members', required=False, type=int,
+                        help='Community id whose members are printed')
+
+    # Parse arguments
+    args = parser.parse_args()
+    if not args.community_file and not args.index:
+        parser.error('one of the arguments -c/--community-file -x/--index is required')
+
+    # Command Center
+    command_center(community_file=args.community_file, index_dir=args.index, query_nodes=args.nodes,
+                   community=args.members)
@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+# Import python libraries
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+
+# Import custom python libraries
+try:
+    from pyrainbowterm import *
+except ImportError:
+    print('Can not import pyrainbowterm!', log_type='error')
+    print('Try: pip install pyrainbowterm', log_type='hint')
+    sys.exit(1)
+
+try:
+    import asyncio
+    from urllib.parse import urlsplit, parse_qs
+except ImportError as e:
+    print('Can not import python asyncio library (python 3 is required)! ERROR: {}'.format(e), log_type='error')
+    sys.exit(1)
+
+try:
+    import numpy as np
+except ImportError as e:
+    print('Can not import python numpy library! ERROR: {}'.format(e), log_type='error')
+    sys.exit(1)
+
+# Import file_operations
+import file_operations
+
+# Import community index
+import community_index
+
+# Source code meta data
+__author__ = 'Dalwar Hossain'
+__email__ = 'dalwar.hossain@protonmail.com'
+
+# HTTP status lines of the service
+STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 503: 'Service Unavailable'}
+
+
+# Newest result file
+def latest_result(community_file=None, settle_time=2.0, failed=None):
+    """
+    This function resolves a community file or a glob pattern of community files to the newest complete file. Files
+    modified in the last settle_time seconds may still be written and are left for a later check, files that
+    failed to load (same modification time) are skipped
+    :param community_file: Community (.npz/.pkl) file path or glob pattern (e.g. "/data/runs/*/Louvain_x.npz")
+    :param settle_time: Seconds a file must stay unchanged before it is indexed
+    :param failed: python dictionary {file: modification time} of files that failed to load
+    :return: newest community file path (None if nothing matches)
+    """
+    failed = failed or {}
+    candidates = glob.glob(community_file) if glob.has_magic(community_file) else [community_file]
+    now = time.time()
+    modified = {}
+    for candidate in candidates:
+        try:
+            modified[candidate] = os.path.getmtime(candidate)
+        except OSError:
+            continue
+        if not os.path.isfile(candidate) or now - modified[candidate] < settle_time or \
+                failed.get(candidate) == modified[candidate]:
+            del modified[candidate]
+
+    # Return
+    return max(modified, key=modified.get) if modified else None
+
+
+# Community size statistics of an index
+def index_stats(index=None):
+    """
+    This function summarizes the community sizes of an index
+    :param index: Index returned by community_index.open_index()
+    :return: python dictionary of statistics
+    """
+    sizes = np.diff(np.asarray(index['offsets']))
+    stats = {
+        'nodes': int(index['meta']['nodes']),
+        'communities': int(index['meta']['communities']),
+        'size_distribution': {
+            'min': int(sizes.min()) if len(sizes) else 0,
+            'max': int(sizes.max()) if len(sizes) else 0,
+            'mean': float(sizes.mean()) if len(sizes) else 0.0,
+            'median': float(np.median(sizes)) if len(sizes) else 0.0,
+            'singletons': int((sizes == 1).sum()),
+        },
+    }
+
+    # Return
+    return stats
+
+
+# Load (or reload) the served index
+def refresh(state=None):
+    """
+    This function brings the served index up to date: a newer community file is indexed first, a changed index
+    (meta file) is memory mapped again and swapped in. Requests keep the index they started with. A result file
+    or index that can not be loaded is reported and the current index stays in service
+    :param state: python dictionary of the service state (community_file, index_dir, index, ...)
+    :return: Boolean, True if a new index was swapped in
+    """
+    # Index the newest result file when it is newer than its index
+    if state['community_file']:
+        failed = state.setdefault('failed', {})
+        result_file = latest_result(state['community_file'], state.get('settle_time', 2.0), failed)
+        if result_file is None:
+            return False
+        index_dir = state['fixed_index_dir'] or community_index.index_directory(result_file)
+        meta_file = os.path.join(index_dir, community_index.META_FILE)
+        result_time = os.path.getmtime(result_file)
+        if not os.path.isfile(meta_file) or os.path.getmtime(meta_file) < result_time:
+            print('New result file: {}'.format(result_file), log_type='info')
+            # read_community_file() exits on a broken file, that must not stop the service
+            try:
+                nodes, membership = file_operations.read_community_file(result_file)
+                community_index.build_index(nodes, membership, index_dir)
+            except (Exception, SystemExit) as e:
+                failed[result_file] = result_time
+                print('Can not index result file {}, still serving {}! ERROR: {}'.format(
+                    result_file, state.get('loaded_dir'), e), log_type='warn')
+                return False
+        state['result_file'] = result_file
+        state['index_dir'] = index_dir
+
+    # Map the index again when it changed
+    meta_file = os.path.join(state['index_dir'], community_index.META_FILE)
+    if not os.path.isfile(meta_file):
+        return False
+    meta_time = os.path.getmtime(meta_file)
+    if meta_time == state.get('meta_time') and state['index_dir'] == state.get('loaded_dir'):
+        return False
+    try:
+        index = community_index.open_index(state['index_dir'])
+    except Exception as e:
+        print('Can not open community index {}, still serving {}! ERROR: {}'.format(
+            state['index_dir'], state.get('loaded_dir'), e), log_type='warn')
+        return False
+    state.update(index=index, stats=index_stats(index), meta_time=meta_time, loaded_dir=state['index_dir'],
+                 loaded_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+    print('Serving community index: {} ({} nodes, {} communities)'.format(
+        state['index_dir'], index['meta']['nodes'], index['meta']['communities']), log_type='info')
+
+    # Return
+    return True
+
+
+# Answer one query
+def dispatch(state=None, method=None, target=None, body=None):
+    """
+    This function answers one request against the current index
+    GET/POST /lookup?node=<node>&node=...   (POST body: {"nodes": [...]})    node -> community (null if unknown)
+    GET /members?community=<id>[&offset=<n>&limit=<n>]                       community -> members
+    GET/POST /stats[?community=<id>&...]    (POST body: {"communities": [...]}) index and community sizes
+    :param state: python dictionary of the service state
+    :param method: HTTP method
+    :param target: Request target (path and query string)
+    :param body: Request body (bytes)
+    :return: HTTP status code, python dictionary (json payload)
+    """
+    index = state.get('index')
+    if index is None:
+        return 503, {'error': 'no community index loaded yet'}
+    if method not in ('GET', 'POST'):
+        return 405, {'error': 'only GET and POST are supported'}
+    url = urlsplit(target)
+    query = parse_qs(url.query)
+    payload = json.loads(body.decode('utf-8')) if body else {}
+
+    try:
+        if url.path == '/lookup':
+            nodes = query.get('node', []) + list(payload.get('nodes', []))
+            communities = community_index.lookup_nodes(index, nodes).tolist() if nodes else []
+            return 200, {'nodes': nodes, 'communities': [c if c >= 0 else None for c in communities]}
+        if url.path == '/members':
+            community = int(query['community'][0]) if 'community' in query else int(payload['community'])
+            members = community_index.community_members(index, community)
+            offset = int(query.get('offset', [payload.get('offset', 0)])[0])
+            limit = query.get('limit', [payload.get('limit')])[0]
+            stop = len(members) if limit is None else min(offset + int(limit), len(members))
+            return 200, {'community': community, 'size': len(members),
+                         'members': members[offset:stop].tolist()}
+        if url.path == '/stats':
+            communities = [int(c) for c in query.get('community', []) + list(payload.get('communities', []))]
+            stats = dict(state['stats'], result_file=state.get('result_file'), index_dir=state['loaded_dir'],
+                         loaded_at=state['loaded_at'])
+            if communities and len(index['communities']):
+                table = index['communities']
+                position = np.minimum(np.searchsorted(table, communities), len(table) - 1)
+                known = np.asarray(table)[position] == communities
+                sizes = np.where(known, np.asarray(index['offsets'])[position + 1] -
+                                 np.asarray(index['offsets'])[position], 0)
+                stats['community_sizes'] = dict(zip([str(c) for c in communities], sizes.tolist()))
+            return 200, stats
+    except (KeyError, ValueError, TypeError, AttributeError) as e:
+        return 400, {'error': 'bad query: {}'.format(e)}
+
+    # Return
+    return 404, {'error': 'unknown path {}, use /lookup, /members or /stats'.format(url.path)}
+
+
+# Serve one connection
+async def handle_connection(state, reader, writer):
+    """
+    This function reads HTTP/1.1 requests (keep-alive) from one connection and answers them. Queries run in the
+    default thread pool, so a large batch never blocks the other connections
+    :param state: python dictionary of the service state
+    :param reader: asyncio StreamReader
+    :param writer: asyncio StreamWriter
+    :return: NULL
+    """
+    loop = asyncio.get_event_loop()
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            try:
+                method, target, version = request_line.decode('latin-1').split()
+            except ValueError:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+            try:
+                content_length = int(headers.get('content-length', 0))
+            except ValueError:
+                content_length = -1
+            if content_length < 0:
+                # The body can not be framed, answer and close the connection
+                status, payload = 400, {'error': 'bad Content-Length: {}'.format(headers['content-length'])}
+                keep_alive = False
+            else:
+                body = await reader.readexactly(content_length)
+                try:
+                    status, payload = await loop.run_in_executor(None, dispatch, state, method, target, body)
+                except ValueError as e:
+                    status, payload = 400, {'error': 'bad request body: {}'.format(e)}
+            data = json.dumps(payload).encode('utf-8')
+            writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                         'Connection: {}\r\n\r\n'.format(status, STATUS[status], len(data),
+                                                         'keep-alive' if keep_alive else 'close').encode('latin-1'))
+            writer.write(data)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+# Watch for new results
+async def watch_results(state, interval=5.0):
+    """
+    This function checks for a new result file (or index) every interval seconds and swaps it in
+    :param state: python dictionary of the service state
+    :param interval: Seconds between two checks
+    :return: NULL
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await loop.run_in_executor(None, refresh, state)
+        except (Exception, SystemExit) as e:
+            print('Can not reload community index! ERROR: {}'.format(e), log_type='warn')
+
+
+# Command Center
+def command_center(community_file=None, index_dir=None, host='127.0.0.1', port=8765, socket_path=None,
+                   reload_interval=5.0, settle_time=2.0):
+    """
+    This function controls the other functions
+    :param community_file: Community (.npz/.pkl) file or glob pattern of community files, the newest one is served
+    :param index_dir: Index directory (default: <community file>.index)
+    :param host: Host name or address of the HTTP service
+    :param port: Port of the HTTP service
+    :param socket_path: If provided, the service listens on this unix socket instead of host/port
+    :param reload_interval: Seconds between two checks for new results
+    :param settle_time: Seconds a result file must stay unchanged before it is indexed
+    :return: <>
+    """
+    print('Initializing.....', log_type='info')
+    state = {'community_file': community_file, 'fixed_index_dir': index_dir, 'index_dir': index_dir,
+             'settle_time': settle_time}
+    refresh(state)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    # Bind the state to every connection
+    def connection_handler(reader, writer):
+        return handle_connection(state, reader, writer)
+
+    if socket_path:
+        server = loop.run_until_complete(asyncio.start_unix_server(connection_handler, path=socket_path))
+        print('Listening on unix socket: {}'.format(socket_path), log_type='info')
+    else:
+        server = loop.run_until_complete(asyncio.start_server(connection_handler, host=host, port=port))
+        print('Listening on: http://{}:{}'.format(host, port), log_type='info')
+    watcher = loop.create_task(watch_results(state, reload_interval))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        print('Stopping.....', log_type='info')
+    finally:
+        watcher.cancel()
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+
+# Standard boilerplate for running this source code file as a standalone segment
+if __name__ == '__main__':
+    """
+    Parse arguments and follow through to mission control
+    """
+    # Initial message
+    file_operations.initial_message(os.path.basename(__file__), 'community query service')
+
+    # Create parser
+    parser = argparse.ArgumentParser(prog='community_service.py',
+                                     usage='python %(prog)s -c <community_file> | -x <index_dir> <options>',
+                                     description='Query service (HTTP/unix socket) over a memory mapped community '
+                                                 'index: /lookup, /members and /stats',
+                                     add_help=True)
+
+    parser.add_argument('-c', '--community-file', action='store', dest='community_file', required=False,
+                        help='Community (.npz/.pkl) file or quoted glob pattern of community files, the newest is '
+                             'indexed and served. E.g. "/home/user/data/runs/*/Louvain_x.npz"')
+    parser.add_argument('-x', '--index', action='store', dest='index', required=False,
+                        help='Index directory (see community_index.py). Default is <community file>.index')
+    parser.add_argument('--host', action='store', dest='host', required=False,
+                        help='Host name or address to listen on. Default is 127.0.0.1')
+    parser.add_argument('--port', action='store', dest='port', required=False, type=int,
+                        help='Port to listen on. Default is 8765')
+    parser.add_argument('--socket', action='store', dest='socket', required=False,
+                        help='Unix socket path to listen on instead of host/port')
+    parser.add_argument('--reload-interval', action='store', dest='reload_interval', required=False, type=float,
+                        help='Seconds between two checks for a new result file or index. Default is 5')
+    parser.add_argument('--settle-time', action='store', dest='settle_time', required=False, type=float,
+                        help='Seconds a result file must stay unchanged before it is indexed. Default is 2')
+
+    # Parse arguments
+    args = parser.parse_args()
+    if not args.community_file and not args.index:
+        parser.error('one of the arguments -c/--community-file -x/--index is required')
+
+    # Double checking the arguments
+    if args.host:
+        _host = args.host
+    else:
+        _host = '127.0.0.1'
+    if args.port:
+        _port = args.port
+    else:
+        _port = 8765
+    if args.reload_interval:
+        _reload_interval = args.reload_interval
+    else:
+        _reload_interval = 5.0
+    if args.settle_time is not None:
+        _settle_time = args.settle_time
+    else:
+        _settle_time = 2.0
+
+    # Command Center
+    command_center(community_file=args.community_file, index_dir=args.index, host=_host, port=_port,
+                   socket_path=args.socket, reload_interval=_reload_interval, settle_time=_settle_time)
@@ -6,8 +6,17 @@ from __future__ import print_function
 # Import python libraries
 import os
 import sys
+import bz2
+import glob
+import gzip
+import errno
 import datetime
+import threading
 from itertools import islice
+try:
+    import lzma
+except ImportError:
+    lzma = None
 
 # Import custom python libraries
 try:
@@ -22,6 +31,192 @@ except ImportError:
 __author__ = 'Dalwar Hossain'
 __email__ = 'dalwar.hossain@protonmail.com'
 
+# Leading (magic) bytes of the supported compressed formats
+COMPRESSION_MAGIC = {b'\x1f\x8b': 'gzip', b'BZh': 'bz2', b'\xfd7zXZ\x00': 'xz'}
+
+# Input file name of the standard input
+STDIN = '-'
+
+
+# Detect compressed input
+def detect_compression(input_file=None):
+    """
+    This function detects a compressed file by its leading (magic) bytes, whatever its extension is
+    :param input_file: Input file path
+    :return: 'gzip', 'bz2', 'xz' or None for plain files (and the standard input)
+    """
+    if input_file == STDIN:
+        return None
+    with open(input_file, 'rb') as f:
+        magic = f.read(6)
+    for magic_bytes, compression in COMPRESSION_MAGIC.items():
+        if magic.startswith(magic_bytes):
+            return compression
+
+    # Return
+    return None
+
+
+# Open a compressed file
+def open_compressed(input_file=None, compression=None):
+    """
+    This function opens a compressed file for reading decompressed bytes
+    :param input_file: Input file path
+    :param compression: 'gzip', 'bz2' or 'xz' (see detect_compression())
+    :return: binary file object
+    """
+    if compression == 'gzip':
+        return gzip.GzipFile(input_file, 'rb')
+    elif compression == 'bz2':
+        return bz2.BZ2File(input_file, 'rb')
+    elif lzma is not None:
+        return lzma.LZMAFile(input_file, 'rb')
+    else:
+        print('Can not import python lzma library for .xz input!', log_type='error')
+        print('Try: pip install backports.lzma', log_type='hint')
+        sys.exit(1)
+
+
+# Buffered head of the standard input (read once, replayed by open_input())
+_stdin_head = None
+
+
+# Read the head of the standard input
+def stdin_head(n_lines=5):
+    """
+    This function reads the first lines of the standard input once and keeps them for the sanity check and the
+    parser (stdin can not be rewound)
+    :param n_lines: Number of lines to buffer
+    :return: bytes of the buffered lines
+    """
+    global _stdin_head
+    if _stdin_head is None:
+        stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+        _stdin_head = b''.join(islice(iter(stdin.readline, b''), n_lines))
+
+    # Return
+    return _stdin_head
+
+
+# Input that can only be read as a stream
+def is_streamed(input_file=None):
+    """
+    This function checks if an input has to be streamed into the parser (standard input, shards or compressed files)
+    :param input_file: Input file path, directory/glob pattern of shards or STDIN ('-')
+    :return: Boolean
+    """
+    # Return
+    return input_file == STDIN or is_sharded(input_file) or detect_compression(input_file) is not None
+
+
+# Input given as several shards
+def is_sharded(input_file=None):
+    """
+    This function checks if the input is a directory or a glob pattern of shards (e.g. part-*)
+    :param input_file: Input file path, directory or glob pattern
+    :return: Boolean
+    """
+    # Return
+    return os.path.isdir(input_file) or glob.has_magic(input_file)
+
+
+# List the shards of an input
+def expand_input_files(input_file=None):
+    """
+    This function lists the files of a sharded input: every (non hidden) file of a directory or every file matching
+    a glob pattern, in sorted order. Plain input files are returned as they are.
+    :param input_file: Input file path, directory or glob pattern
+    :return: list of file paths
+    """
+    if not is_sharded(input_file):
+        return [input_file]
+    if os.path.isdir(input_file):
+        input_files = [os.path.join(input_file, name) for name in os.listdir(input_file) if not name.startswith('.')]
+    else:
+        input_files = glob.glob(input_file)
+    input_files = sorted(f for f in input_files if os.path.isfile(f))
+    if not input_files:
+        print('No input files found in: {}'.format(input_file), log_type='error')
+        sys.exit(1)
+
+    # Return
+    return input_files
+
+
+# Copy a stream into a pipe
+def pump_stream(source=None, write_descriptor=None, head=b'', chunk_size=1 << 20):
+    """
+    This function copies the head and then the rest of a source chunk by chunk into the write end of a pipe (runs in
+    a background thread, decompression and reads release the GIL while the reader parses)
+    :param source: Binary file object to copy (closed when done)
+    :param write_descriptor: Write end of the pipe (closed when done)
+    :param head: Bytes written before the source (e.g. the buffered head of stdin)
+    :param chunk_size: Number of bytes written at once
+    :return: NULL
+    """
+    pump = threading.current_thread()
+    try:
+        with os.fdopen(write_descriptor, 'wb') as sink:
+            sink.write(head)
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                sink.write(chunk)
+    except Exception as e:
+        # The reader closing its end early is not an error
+        if getattr(e, 'errno', None) != errno.EPIPE:
+            pump.error = e
+    finally:
+        source.close()
+
+
+# Open input file, compressed or not
+def open_input(input_file=None):
+    """
+    This function opens an input file for reading. Compressed files (detected by magic bytes) and the standard input
+    (STDIN, '-') are copied by a background thread into a pipe, nothing is written to disk.
+    Call finish_input() with both return values when done.
+    :param input_file: Input file path or STDIN ('-')
+    :return: binary file object, streaming thread (None for plain files)
+    """
+    if input_file == STDIN:
+        print('Streaming standard input.....', log_type='info')
+        head = stdin_head()
+        source = getattr(sys.stdin, 'buffer', sys.stdin)
+    else:
+        compression = detect_compression(input_file)
+        if compression is None:
+            return open(input_file, 'rb'), None
+        print('Streaming {} compressed input.....'.format(compression), log_type='info')
+        head = b''
+        source = open_compressed(input_file, compression)
+
+    read_descriptor, write_descriptor = os.pipe()
+    pump = threading.Thread(target=pump_stream, args=(source, write_descriptor, head))
+    pump.daemon = True
+    pump.error = None
+    pump.start()
+
+    # Return
+    return os.fdopen(read_descriptor, 'rb'), pump
+
+
+# Close input file opened with open_input()
+def finish_input(stream=None, pump=None):
+    """
+    This function closes an input stream and stops with an error if reading (decompressing) the input failed
+    :param stream: File object returned by open_input()
+    :param pump: Streaming thread returned by open_input()
+    :return: NULL
+    """
+    stream.close()
+    if pump is not None:
+        pump.join()
+        if pump.error is not None:
+            print('Can not read input stream! ERROR: {}'.format(pump.error), log_type='error')
+            sys.exit(1)
+
 
 # Check if the file has header or not
 def file_sniffer(input_file=None):
@@ -36,26 +231,30 @@ def file_sniffer(input_file=None):
         print('Can not import python csv library!', log_type='error')
         sys.exit(1)
 
-    # Open the file and take a sniff
-    with open(input_file) as f:
-        first_five_lines = list(islice(f, 5))
-        file_head = ''.join(map(str, first_five_lines))
-        try:
-            dialect = csv.Sniffer().sniff(file_head)
-            _headers = csv.Sniffer().has_header(file_head)
-            delimiter = dialect.delimiter
-        except Exception as e:
-            print('Can not detect delimiter or headers! ERROR: {}'.format(e), log_type='error')
-            print('Please check input file!!', log_type='error')
-        # Sniff into the file and see if there is a header or not
-        if _headers:
-            headers = file_head.split('\n')[0].split(delimiter)
-            n_cols = len(headers)
-            skip_rows = 1
-        else:
-            headers = None
-            n_cols = len(file_head.split('\n')[0].split(delimiter))
-            skip_rows = 0
+    # Open the file and take a sniff (the head of the standard input is kept for the parser)
+    compression = detect_compression(input_file)
+    if input_file == STDIN:
+        first_five_lines = stdin_head().decode('utf-8').splitlines(True)
+    else:
+        with open_compressed(input_file, compression) if compression else open(input_file, 'rb') as f:
+            first_five_lines = [line.decode('utf-8') for line in islice(f, 5)]
+    file_head = ''.join(first_five_lines)
+    try:
+        dialect = csv.Sniffer().sniff(file_head)
+        _headers = csv.Sniffer().has_header(file_head)
+        delimiter = dialect.delimiter
+    except Exception as e:
+        print('Can not detect delimiter or headers! ERROR: {}'.format(e), log_type='error')
+        print('Please check input file!!', log_type='error')
+    # Sniff into the file and see if there is a header or not
+    if _headers:
+        headers = file_head.split('\n')[0].split(delimiter)
+        n_cols = len(headers)
+        skip_rows = 1
+    else:
+        headers = None
+        n_cols = len(file_head.split('\n')[0].split(delimiter))
+        skip_rows = 0
 
     # Return
     return delimiter, headers, n_cols, skip_rows
@@ -121,35 +320,36 @@ def check_delimiter(detected_delimiter=None, provided_delimiter=None):
 
 
 # Check Columns
-def check_columns(n_cols=None, weighted=None):
+def check_columns(n_cols=None, weighted=None, node_columns=2):
     """
     This function checks the number of columns detected from the input file
     also checks that it matches with the weighted argument. For example:
     A normal unweighted graph will have two column and weighted graph will have
-    three columns.
+    three columns. Memory (trigram/state/multiplex) networks have more node columns.
     ------------------------------------
     =================
     == Attention!! ==
     =================
-    If weighted and column == 3 =>1
+    If weighted and column == node columns + 1 =>1
     else => 0
-    If unweighted and column == 2 => 1
+    If unweighted and column == node columns => 1
     else => 0
     -------------------------------------
     :param n_cols: Number of columns detected from the input file
     :param weighted: Is the weighted argument provided yes or no
+    :param node_columns: Number of node columns of a link (2 for simple edge lists)
     :return: <>
     """
     # Check the number of columns in the file
     print('Detected columns: {}'.format(n_cols), log_type='info')
     weight_col = is_weighted(weighted)
     if weight_col:
-        if n_cols == 3:
+        if n_cols == node_columns + 1:
             column_status = 1
         else:
             column_status = 0
     else:
-        if n_cols == 2:
+        if n_cols == node_columns:
             column_status = 1
         else:
             column_status = 0
@@ -228,12 +428,13 @@ def generate_sanity_status(header_status=None, delimiter_status=None, column_sta
 
 
 # Sanity Check for file operations
-def sanity_check(input_file=None, delimiter=None, weighted=None):
+def sanity_check(input_file=None, delimiter=None, weighted=None, node_columns=2):
     """
     This function checks the sanity of the input and returns a status with file is weighted or not
     :param input_file: Input file full path
     :param delimiter: Column separator in the input file
     :param weighted: Does the file contain edge weights or not
+    :param node_columns: Number of node columns of a link (2 for simple edge lists)
     :return: sanity status
     """
     # Get file information (Header, delimiter, number of columns etc.)
@@ -246,7 +447,7 @@ def sanity_check(input_file=None, delimiter=None, weighted=None):
     delimiter_status = check_delimiter(detected_delimiter, delimiter)
 
     # Number of columns?
-    column_status = check_columns(n_cols, weighted)
+    column_status = check_columns(n_cols, weighted, node_columns)
 
     # Generate sanity status
     sanity_status = generate_sanity_status(header_status, delimiter_status, column_status)
@@ -255,6 +456,29 @@ def sanity_check(input_file=None, delimiter=None, weighted=None):
     return sanity_status
 
 
+# Sanity check of sharded input
+def sanity_check_shards(input_files=None, delimiter=None, weighted=None, node_columns=2, sample_size=3):
+    """
+    This function runs the sanity check on a sample of the shards (first, last and evenly spaced ones in between)
+    :param input_files: list of shard file paths
+    :param delimiter: Column separator in the input files
+    :param weighted: Do the files contain edge weights or not
+    :param node_columns: Number of node columns of a link (2 for simple edge lists)
+    :param sample_size: Number of shards to check
+    :return: sanity status
+    """
+    n_samples = min(sample_size, len(input_files))
+    sample = sorted(set(int(round(i * (len(input_files) - 1) / max(n_samples - 1, 1))) for i in range(n_samples)))
+    print('Checking {} of {} shards.....'.format(len(sample), len(input_files)), log_type='info')
+    sanity_status = 1
+    for i in sample:
+        print('Shard: {}'.format(input_files[i]), log_type='info')
+        sanity_status = sanity_status and sanity_check(input_files[i], delimiter, weighted, node_columns)
+
+    # Return
+    return sanity_status
+
+
 # Create initial message
 def initial_message(script=None, algorithm=None):
     """
@@ -272,18 +496,30 @@ def initial_message(script=None, algorithm=None):
 
 
 # Get directory path for input/output data
-def get_dir_path(input_file=None):
+def get_dir_path(input_file=None, output_dir=None):
     """
     This function extracts the directory path of input file and creates a new file name for the output file
     :param input_file: A complete file path for input dataset
+    :param output_dir: Explicit output directory (required when reading the standard input)
     :return: A directory path and a file name
     """
-    # Get input file's directory
-    input_dir = os.path.dirname(input_file)
-    if os.path.isdir(input_dir):
+    # Explicit output directory
+    if output_dir:
+        if not os.path.isdir(output_dir):
+            print('Output directory does not exist: {}'.format(output_dir), log_type='error')
+            sys.exit(1)
+
+        # Return output path
+        return output_dir
+
+    # Get input file's directory (the parent of a shard directory)
+    input_dir = os.path.dirname(os.path.normpath(input_file))
+    if input_file != STDIN and os.path.isdir(input_dir):
         output_dir = input_dir
     else:
         print('Can not determine output directory!', log_type='error')
+        if input_file == STDIN:
+            print('Please provide an output directory (--output-dir) when reading from standard input', log_type='hint')
         sys.exit(1)
 
     # Return output path
@@ -291,22 +527,29 @@ def get_dir_path(input_file=None):
 
 
 # Generate output file name
-def generate_output_filename(input_file=None, prefix=None):
+def generate_output_filename(input_file=None, prefix=None, output_dir=None):
     """
     This function generates appropriate output file name
     :param input_file: A file path to input file
     :param prefix: Prefix of output file
+    :param output_dir: Explicit output directory instead of the directory of the input file
     :return: output filename full path
     """
     splitter = '_'
-    # Get file name
-    input_file_name = os.path.basename(input_file)
+    # Get file name (shards are named after their directory)
+    if input_file == STDIN:
+        input_file_name = 'stdin.txt'
+    elif is_sharded(input_file):
+        shard_dir = input_file if os.path.isdir(input_file) else os.path.dirname(input_file)
+        input_file_name = os.path.basename(os.path.normpath(os.path.abspath(shard_dir))) + '.txt'
+    else:
+        input_file_name = os.path.basename(input_file)
     # Create new file name
     base_file_name, base_file_extension = os.path.splitext(input_file_name)
     output_file_name = prefix + splitter + base_file_name + base_file_extension
 
     # Get output directory
-    output_directory = get_dir_path(input_file)
+    output_directory = get_dir_path(input_file, output_dir)
 
     # Output file full path
     output_file = os.path.join(output_directory, output_file_name)
@@ -315,14 +558,176 @@ def generate_output_filename(input_file=None, prefix=None):
     return output_file
 
 
+# Flatten detected communities into membership arrays
+def communities_to_arrays(communities=None):
+    """
+    This function converts a sequence of communities (frozensets, lists, SNAP TCnCom etc.) into two flat arrays
+    :param communities: An iterable of communities, each community is an iterable of nodes
+    :return: numpy array of nodes, numpy array of community ids (same order as nodes)
+    """
+    # Import numpy
+    try:
+        import numpy as np
+    except ImportError as e:
+        print('Can not import python numpy library! ERROR: {}'.format(e), log_type='error')
+        sys.exit(1)
+
+    from itertools import chain
+
+    # Community sizes decide how many times each community id is repeated
+    sizes = np.fromiter((c.Len() if hasattr(c, 'Len') else len(c) for c in communities), dtype=np.int64)
+    nodes = np.fromiter(chain.from_iterable(communities), dtype=np.int64, count=int(sizes.sum()))
+    membership = np.repeat(np.arange(len(sizes), dtype=np.int64), sizes)
+
+    # Return
+    return nodes, membership
+
+
+# Convert a community dictionary into membership arrays
+def dict_to_arrays(dict_communities=None):
+    """
+    This function converts a python dictionary of {node: community} into two flat arrays
+    :param dict_communities: A python dictionary with communities assigned to nodes
+    :return: numpy array of nodes, numpy array of community ids (same order as nodes)
+    """
+    # Import numpy
+    try:
+        import numpy as np
+    except ImportError as e:
+        print('Can not import python numpy library! ERROR: {}'.format(e), log_type='error')
+        sys.exit(1)
+
+    nodes = np.fromiter(dict_communities.keys(), dtype=np.int64, count=len(dict_communities))
+    membership = np.fromiter(dict_communities.values(), dtype=np.int64, count=len(dict_communities))
+
+    # Return
+    return nodes, membership
+
+
+# Read a community file
+def read_community_file(community_file=None):
+    """
+    This function reads the communities saved by create_community_file(), the membership arrays (.npz) are preferred
+    over the pickled dictionary (.pkl) when both exist. Nodes in several modules (memory networks) keep their
+    smallest community id, every reader compares partitions with one community per node
+    :param community_file: Community file path (.npz, .pkl, or the .grp next to them)
+    :return: numpy array of nodes, numpy array of community ids
+    """
+    # Import numpy
+    try:
+        import numpy as np
+    except ImportError as e:
+        print('Can not import python numpy library! ERROR: {}'.format(e), log_type='error')
+        sys.exit(1)
+
+    base_name, extension = community_file.rsplit('.', 1) if '.' in os.path.basename(community_file) \
+        else (community_file, '')
+    array_file = base_name + '.npz'
+    if extension == 'npz' or (extension != 'pkl' and os.path.isfile(array_file)):
+        try:
+            with np.load(array_file) as arrays:
+                nodes = arrays['nodes']
+                membership = arrays['membership'].astype(np.int64)
+        except Exception as e:
+            print('Can not read community file! ERROR: {}'.format(e), log_type='error')
+            sys.exit(1)
+
+        # Return
+        return single_membership(nodes, membership)
+
+    if sys.version_info[0] == 2:
+        import cPickle as pickle
+    if sys.version_info[0] == 3:
+        import pickle
+
+    pickled_file = base_name + '.pkl'
+    try:
+        with open(pickled_file, 'rb') as f:
+            dict_communities = pickle.load(f)
+    except Exception as e:
+        print('Can not read community file! ERROR: {}'.format(e), log_type='error')
+        sys.exit(1)
+    nodes = np.array(list(dict_communities.keys()))
+    modules = list(dict_communities.values())
+    if modules and isinstance(modules[0], list):
+        nodes = np.repeat(nodes, [len(node_modules) for node_modules in modules])
+        membership = np.array([module for node_modules in modules for module in node_modules], dtype=np.int64)
+    else:
+        membership = np.fromiter(modules, dtype=np.int64, count=len(modules))
+
+    # Return
+    return single_membership(nodes, membership)
+
+
+# One community per node
+def single_membership(nodes=None, membership=None):
+    """
+    This function keeps one community (the smallest id) of every node that is in several modules
+    :param nodes: numpy array of nodes
+    :param membership: numpy array of community ids of the nodes
+    :return: numpy array of nodes, numpy array of community ids
+    """
+    # Import numpy
+    try:
+        import numpy as np
+    except ImportError as e:
+        print('Can not import python numpy library! ERROR: {}'.format(e), log_type='error')
+        sys.exit(1)
+
+    order = np.lexsort((membership, nodes))
+    sorted_nodes = nodes[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = sorted_nodes[1:] != sorted_nodes[:-1]
+    if first.all():
+        return nodes, membership
+    print('{} nodes are in several modules, keeping the smallest community id of every node'.format(
+        len(np.unique(sorted_nodes[~first]))), log_type='warn')
+
+    # Return
+    return sorted_nodes[first], membership[order][first]
+
+
 # Create a community file as output file
-def create_community_file(dict_communities=None, output_file=None):
+def create_community_file(dict_communities=None, output_file=None, nodes=None, membership=None, node_ids=None):
     """
     This function creates the output file
     :param dict_communities: A python dictionary with communities assigned to nodes
-    :param output_file: name and location of the output files (.grp) and (.pkl)
+    :param output_file: name and location of the output files (.grp), (.pkl) and (.npz)
+    :param nodes: numpy array of nodes (used instead of dict_communities)
+    :param membership: numpy array of community ids of the nodes (used instead of dict_communities)
+    :param node_ids: Original node identifiers of interned (dense 0..n-1) nodes, see graph_composer.intern_nodes()
     :return: <> file object <>
     """
+    # Import numpy and pandas
+    try:
+        import numpy as np
+        import pandas as pd
+    except ImportError as e:
+        print('Can not import python numpy/pandas library! ERROR: {}'.format(e), log_type='error')
+        sys.exit(1)
+
+    # Work with flat arrays, whichever way the communities were provided
+    if nodes is None or membership is None:
+        nodes, membership = dict_to_arrays(dict_communities)
+    else:
+        nodes = np.asarray(nodes)
+        membership = np.asarray(membership)
+        dict_communities = None
+
+    # Map interned nodes back to their original identifiers
+    if node_ids is not None:
+        nodes = np.asarray(node_ids)[nodes]
+        dict_communities = None
+    if dict_communities is None:
+        # Memory networks can put a node in several modules, the dictionary then maps every node to its modules
+        overlapping = len(pd.unique(nodes)) < len(nodes)
+        if overlapping:
+            print('Nodes in several modules, the (.pkl) dictionary maps every node to a list of modules',
+                  log_type='warn')
+            dict_communities = pd.Series(membership).groupby(nodes, sort=False).apply(list).to_dict()
+        else:
+            dict_communities = dict(zip(nodes.tolist(), membership.tolist()))
+
     # Create pickled extension for saving data for further use
     pickled_file = output_file.rsplit('.', 1)[0] + '.pkl'
 
@@ -337,31 +742,25 @@ def create_community_file(dict_communities=None, output_file=None):
 
     try:
         print('Creating pickled jar of (.pkl) data.....', log_type='info')
-        with open(pickled_file, 'w') as pickled_file:
-            pickle.dump(dict_communities, pickled_file)
+        with open(pickled_file, 'wb') as pickled_file:
+            pickle.dump(dict_communities, pickled_file, protocol=pickle.HIGHEST_PROTOCOL)
     except Exception as e:
         print('Can not create pickled data!!! ERROR: {}'.format(e), log_type='error')
 
-    # import json
-    #
-    # communities = json.dumps(dict_communities, sort_keys=True, indent=4)
-    #
-    # print('Creating community file.....', log_type='info')
-    # with open(output_file, 'w') as f:
-    #     f.write(communities)
-
-    # Import pandas
+    # Keep the membership arrays as well, they load much faster than the pickled dictionary
     try:
-        import pandas as pd
-    except ImportError as e:
-        print('Can not import python pandas library! ERROR: {}'.format(e), log_type='error')
-        sys.exit(1)
-
-    # Create a pandas data frame from the dictionary
-    communities = pd.DataFrame(dict_communities.items(), columns=['node', 'cluster'], dtype=int)
-
-    # Generate list of nodes that belongs to same community
-    groups = communities.groupby('cluster')['node'].apply(list)
+        print('Creating membership arrays (.npz) file.....', log_type='info')
+        np.savez(output_file.rsplit('.', 1)[0] + '.npz', nodes=nodes.astype(str) if nodes.dtype == object else nodes,
+                 membership=membership)
+    except Exception as e:
+        print('Can not create membership arrays! ERROR: {}'.format(e), log_type='error')
+
+    # Generate list of nodes that belongs to same community (sort once, split at community boundaries)
+    order = np.argsort(membership, kind='mergesort')
+    sorted_membership = membership[order]
+    clusters, starts = np.unique(sorted_membership, return_index=True)
+    groups = pd.Series([group.tolist() for group in np.split(nodes[order], starts[1:])] if len(clusters) else [],
+                       index=clusters, dtype=object)
 
     # Write to output file
     try:
@@ -4,8 +4,16 @@
 from __future__ import print_function
 
 # Import python libraries
+import os
 import sys
+import mmap
 import argparse
+import multiprocessing
+from collections import deque
+try:
+    from itertools import imap as lazy_map
+except ImportError:
+    lazy_map = map
 import networkx as nx
 
 # Import custom python libraries
@@ -16,6 +24,13 @@ except ImportError:
     print('Try: pip install pyrainbowterm', log_type='hint')
     sys.exit(1)
 
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError as e:
+    print('Can not import python numpy/pandas library! ERROR: {}'.format(e), log_type='error')
+    sys.exit(1)
+
 # Import file_operations
 import file_operations
 
@@ -29,14 +44,20 @@ __email__ = 'dalwar.hossain@protonmail.com'
 
 # Compose graph with stanford SNAP python snap.py
 # @profile  # Uncomment to profile this function for memory usage with 'mprof'
-def compose_snap_graph(input_file=None, delimiter=None, weighted=None):
+def compose_snap_graph(input_file=None, delimiter=None, weighted=None, duplicates=None):
     """
     This function creates a snap graph from provided file
     :param input_file:  Input file path
     :param delimiter: Column separator in the file
     :param weighted: Simple yes/no if the input file is weighted or not
-    :return: snap graph
+    :param duplicates: If provided, self loops and duplicate edges are removed with numpy first (sum/max/first)
+    :return: snap graph (standard input and compressed files are streamed)
     """
+    # Standard input, compressed files and duplicate handling go through the edge arrays
+    if duplicates or file_operations.is_streamed(input_file):
+        return compose_snap_graph_from_arrays(compose_edge_arrays(input_file, delimiter, weighted,
+                                                                  duplicates=duplicates))
+
     # Check sanity status of input
     sanity_status = file_operations.sanity_check(input_file, delimiter, weighted)
 
@@ -61,14 +82,20 @@ def compose_snap_graph(input_file=None, delimiter=None, weighted=None):
 
 # Compose graph with networkx library
 # @profile  # Uncomment to profile this function for memory usage with 'mprof'
-def compose_ntx_graph(input_file=None, delimiter=None, weighted=None):
+def compose_ntx_graph(input_file=None, delimiter=None, weighted=None, duplicates=None):
     """
     This function creates a networkx graph from provided file
     :param input_file: Input file path
     :param delimiter: separator for the column of the input file
     :param weighted: Simple yes/no if the input file is weighted or not
-    :return: networkx graph
+    :param duplicates: If provided, self loops and duplicate edges are removed with numpy first (sum/max/first)
+    :return: networkx graph (standard input and compressed files are streamed)
     """
+    # Standard input, compressed files and duplicate handling go through the edge arrays
+    if duplicates or file_operations.is_streamed(input_file):
+        return compose_ntx_graph_from_arrays(compose_edge_arrays(input_file, delimiter, weighted,
+                                                                 duplicates=duplicates))
+
     # Check sanity status of input
     sanity_status = file_operations.sanity_check(input_file, delimiter, weighted)
 
@@ -99,6 +126,1220 @@ def compose_ntx_graph(input_file=None, delimiter=None, weighted=None):
         sys.exit(1)
 
 
+# Save edge arrays in binary format
+def save_edge_arrays(output_file=None, sources=None, targets=None, weights=None, parse_options=None):
+    """
+    This function saves edge arrays in the binary (.npz) edge format that compose_edge_arrays() accepts
+    :param output_file: Output file path (.npz)
+    :param sources: numpy array of source nodes
+    :param targets: numpy array of target nodes
+    :param weights: numpy array of edge weights (None for unweighted graphs)
+    :param parse_options: If provided, the options the text edge list was parsed with (see edge_parse_options())
+    :return: <> file object <>
+    """
+    arrays = {'sources': sources, 'targets': targets}
+    if weights is not None:
+        arrays['weights'] = weights
+    if parse_options is not None:
+        arrays['parse_options'] = np.array(parse_options)
+    try:
+        print('Creating binary edge (.npz) file.....', log_type='info')
+        with open(output_file, 'wb') as f:
+            np.savez(f, **arrays)
+    except Exception as e:
+        print('Can not create binary edge file! ERROR: {}'.format(e), log_type='error')
+
+
+# Load edge arrays from binary format
+def load_edge_arrays(input_file=None):
+    """
+    This function loads edge arrays saved with save_edge_arrays()
+    :param input_file: Binary edge file path (.npz)
+    :return: sources, targets, weights (None for unweighted graphs) as numpy arrays
+    """
+    with np.load(input_file) as arrays:
+        sources = arrays['sources']
+        targets = arrays['targets']
+        weights = arrays['weights'] if 'weights' in arrays.files else None
+
+    # Return
+    return sources, targets, weights
+
+
+# Parse options of a text edge list
+def edge_parse_options(delimiter=None, weighted=None):
+    """
+    This function describes the options a text edge list is parsed with, a cached binary edge file is only reused
+    for the same options
+    :param delimiter: Column separator in the file
+    :param weighted: Simple yes/no if the file is weighted or not
+    :return: options string
+    """
+    # Return
+    return 'delimiter={!r} weighted={}'.format(delimiter, file_operations.is_weighted(weighted))
+
+
+# Parse options of a cached binary edge file
+def cached_parse_options(cache_file=None):
+    """
+    This function reads the parse options saved with a cached binary edge file
+    :param cache_file: Binary edge file path (.npz)
+    :return: options string (None for files without options or unreadable files)
+    """
+    try:
+        with np.load(cache_file) as arrays:
+            options = str(arrays['parse_options']) if 'parse_options' in arrays.files else None
+    except Exception:
+        options = None
+
+    # Return
+    return options
+
+
+# Group undirected edges by their endpoints
+def group_edges(sources=None, targets=None):
+    """
+    This function sorts undirected edges by their (min, max) endpoint pair. Pairs of non-negative node ids below
+    2^32 are packed into one uint64 key (one sort), other ids fall back to a lexicographic sort.
+    :param sources: numpy array of source nodes
+    :param targets: numpy array of target nodes
+    :return: stable sort order of the edges, start of every group in that order, min and max endpoint of every edge
+    """
+    low = np.minimum(sources, targets)
+    high = np.maximum(sources, targets)
+    if not len(low):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), low, high
+
+    if low.min() >= 0 and high.max() < 2 ** 32:
+        keys = (low.astype(np.uint64) << np.uint64(32)) | high.astype(np.uint64)
+        order = np.argsort(keys, kind='mergesort')
+        sorted_keys = keys[order]
+        is_start = np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))
+    else:
+        order = np.lexsort((high, low))
+        sorted_low = low[order]
+        sorted_high = high[order]
+        is_start = np.concatenate(([True], (sorted_low[1:] != sorted_low[:-1]) |
+                                   (sorted_high[1:] != sorted_high[:-1])))
+
+    # Return
+    return order, np.flatnonzero(is_start), low, high
+
+
+# Drop self loops and merge duplicate edges
+def deduplicate_edges(edges=None, duplicates='sum'):
+    """
+    This function drops self loops and merges duplicate (same endpoints, any direction) edges
+    :param edges: Edge arrays (sources, targets, weights)
+    :param duplicates: Weight of a merged edge, 'sum', 'max' or 'first' (weight of the first occurrence in the file)
+    :return: Edge arrays (sources, targets, weights) with every edge as (min, max)
+    """
+    sources, targets, weights = edges
+    loop = sources == targets
+    if loop.any():
+        sources = sources[~loop]
+        targets = targets[~loop]
+        weights = weights[~loop] if weights is not None else None
+
+    order, starts, low, high = group_edges(sources, targets)
+    first = order[starts]
+    if weights is not None:
+        if duplicates == 'sum' and len(starts):
+            weights = np.add.reduceat(weights[order], starts)
+        elif duplicates == 'max' and len(starts):
+            weights = np.maximum.reduceat(weights[order], starts)
+        else:
+            weights = weights[first]
+    print('Dropped {} self loops, merged {} duplicate edges.....'.format(int(loop.sum()), len(low) - len(starts)),
+          log_type='info')
+
+    # Return
+    return low[first], high[first], weights
+
+
+# Compose edge arrays from the input file
+# @profile  # Uncomment to profile this function for memory usage with 'mprof'
+def compose_edge_arrays(input_file=None, delimiter=None, weighted=None, cache=False, node_columns=2, duplicates=None):
+    """
+    This function reads an edge list into numpy arrays, the shared representation for every algorithm
+    :param input_file: Input file path (text edge list, gzip/bz2/xz compressed or not, binary .npz edge file),
+                       directory/glob pattern of shards or STDIN ('-')
+    :param delimiter: Column separator in the file
+    :param weighted: Simple yes/no if the input file is weighted or not
+    :param cache: Boolean, keep a binary (.npz) copy next to the input file and reuse it on later runs
+    :param node_columns: Number of node columns of a link, e.g. 3 for trigrams (binary files hold 2)
+    :param duplicates: None to keep the edges as they are, otherwise drop self loops and merge duplicate edges
+                       keeping the 'sum', 'max' or 'first' weight
+    :return: one numpy array per node column (sources, targets for edge lists) and weights (None for unweighted)
+    """
+    # Binary edge files are already parsed, a cache is reused when it is newer and parsed with the same options
+    cache_file = os.path.splitext(input_file)[0] + '.npz'
+    cache = cache and node_columns == 2 and input_file != file_operations.STDIN and \
+        not file_operations.is_sharded(input_file)
+    if input_file.endswith('.npz'):
+        print('Loading binary edge file.....', log_type='info')
+        edges = load_edge_arrays(input_file)
+    elif cache and os.path.isfile(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(input_file) and \
+            cached_parse_options(cache_file) == edge_parse_options(delimiter, weighted):
+        print('Loading cached binary edge file: {}'.format(cache_file), log_type='info')
+        edges = load_edge_arrays(cache_file)
+    else:
+        edges = read_edge_arrays(input_file, delimiter, weighted, node_columns)
+        if cache:
+            save_edge_arrays(cache_file, *edges, parse_options=edge_parse_options(delimiter, weighted))
+
+    if duplicates and len(edges) == 3:
+        edges = deduplicate_edges(edges, duplicates)
+
+    # Return
+    return edges
+
+
+# Map arbitrary node identifiers to dense integers
+def intern_nodes(edges=None):
+    """
+    This function maps the node identifiers of all node columns to dense integers 0..n-1 with one hash based
+    pass (pandas factorize). The identifier table is kept once and only used again when writing the output.
+    :param edges: Node column arrays and weights, e.g. (sources, targets, weights)
+    :return: Edge arrays with dense nodes, numpy array of original identifiers (index = dense node)
+    """
+    columns = edges[:-1]
+    codes, node_ids = pd.factorize(np.concatenate(columns))
+    codes = codes.astype(np.int64)
+    offsets = np.cumsum([0] + [len(column) for column in columns])
+    dense_columns = tuple(codes[offsets[i]:offsets[i + 1]] for i in range(len(columns)))
+    print('Interned {} node identifiers.....'.format(len(node_ids)), log_type='info')
+
+    # Return
+    return dense_columns + (edges[-1],), np.asarray(node_ids)
+
+
+# Compose edge arrays with interned node identifiers
+def compose_interned_edge_arrays(input_file=None, delimiter=None, weighted=None, node_columns=2, duplicates=None):
+    """
+    This function reads an edge list with arbitrary (string or sparse integer) node identifiers into edge arrays
+    with dense integer nodes
+    :param input_file: Input file path (text edge list or binary .npz edge file)
+    :param delimiter: Column separator in the file
+    :param weighted: Simple yes/no if the input file is weighted or not
+    :param node_columns: Number of node columns of a link, e.g. 3 for trigrams (binary files hold 2)
+    :param duplicates: None to keep the edges as they are, otherwise drop self loops and merge duplicate edges
+                       keeping the 'sum', 'max' or 'first' weight
+    :return: Edge arrays (sources, targets, weights) with dense nodes, numpy array of original node identifiers
+    """
+    if input_file.endswith('.npz'):
+        print('Loading binary edge file.....', log_type='info')
+        edges = load_edge_arrays(input_file)
+    else:
+        edges = read_edge_arrays(input_file, delimiter, weighted, node_columns, node_type=str)
+    edges, node_ids = intern_nodes(edges)
+
+    if duplicates and len(edges) == 3:
+        edges = deduplicate_edges(edges, duplicates)
+
+    # Return
+    return edges, node_ids
+
+
+# Parse integer columns of a text buffer
+def parse_integer_buffer(text=None, n_cols=2, delimiter=None):
+    """
+    This function parses bytes of non-negative integers separated by a one byte delimiter/whitespace, one record per
+    line, in a single numpy call (no python objects per line or per number)
+    :param text: bytes (e.g. a newline aligned slice of a memory map)
+    :param n_cols: Number of columns of every line
+    :param delimiter: Column separator (one character) or None for whitespace
+    :return: numpy int64 array of shape (lines, n_cols), None if the buffer holds anything else
+    """
+    # Only digits and separators, anything else (signs, decimals, comments, headers) goes to pandas
+    allowed = np.zeros(256, dtype=bool)
+    allowed[ord('0'):ord('9') + 1] = True
+    allowed[[ord(c) for c in ' \t\r\n']] = True
+    if delimiter:
+        allowed[ord(delimiter)] = True
+    buffer = np.frombuffer(text, dtype=np.uint8)
+    if not len(buffer) or not allowed[buffer].all():
+        return None
+
+    # numpy's text parser treats a space separator as any run of whitespace, newlines included
+    if delimiter and not delimiter.isspace():
+        text = text.replace(delimiter.encode(), b' ')
+    numbers = np.fromstring(text, dtype=np.int64, sep=' ')
+
+    # Every line must hold n_cols numbers (blank lines fall back to pandas as well): the first and the last number of
+    # every line have to sit between the surrounding newlines
+    newlines = np.flatnonzero(buffer == ord('\n'))
+    lines = len(newlines) + (buffer[-1] != ord('\n'))
+    if len(numbers) != lines * n_cols:
+        return None
+    is_digit = buffer <= ord('9')
+    is_digit &= buffer >= ord('0')
+    number_starts = np.flatnonzero(is_digit[1:] & ~is_digit[:-1]) + 1
+    if is_digit[0]:
+        number_starts = np.concatenate(([0], number_starts))
+    first_numbers = number_starts[::n_cols]
+    last_numbers = number_starts[n_cols - 1::n_cols]
+    if len(number_starts) != len(numbers) or (first_numbers[1:] < newlines[:lines - 1]).any() or \
+            (last_numbers[:len(newlines)] > newlines).any():
+        return None
+
+    # Return
+    return numbers.reshape(-1, n_cols)
+
+
+# Read integer edge lists through a memory map
+def read_mapped_integer_edges(input_file=None, n_cols=2, delimiter=None, chunk_size=1 << 24):
+    """
+    This function memory maps a plain text edge list and parses newline aligned chunks of the mapped file with numpy
+    (see parse_integer_buffer()), the file is never iterated line by line
+    :param input_file: Input file path (plain text)
+    :param n_cols: Number of columns of every line
+    :param delimiter: Column separator (one character) or None for whitespace
+    :param chunk_size: Approximate number of bytes parsed at once
+    :return: numpy int64 array of shape (lines, n_cols), None if the file can not be parsed this way
+    """
+    if not os.path.getsize(input_file):
+        return None
+    with open(input_file, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            blocks = []
+            position = 0
+            while position < len(mapped):
+                end = mapped.find(b'\n', min(position + chunk_size, len(mapped)) - 1)
+                end = len(mapped) if end == -1 else end + 1
+                block = parse_integer_buffer(mapped[position:end], n_cols, delimiter)
+                if block is None:
+                    return None
+                blocks.append(block)
+                position = end
+        finally:
+            mapped.close()
+
+    # Return
+    return np.concatenate(blocks)
+
+
+# Read edge arrays from a text edge list
+def read_edge_arrays(input_file=None, delimiter=None, weighted=None, node_columns=2, node_type=np.int64, check=True):
+    """
+    This function parses a text edge list into numpy arrays (see compose_edge_arrays())
+    :param input_file: Input file path, directory/glob pattern of shards or STDIN ('-')
+    :param delimiter: Column separator in the file
+    :param weighted: Simple yes/no if the input file is weighted or not
+    :param node_columns: Number of node columns of a link, e.g. 3 for trigrams
+    :param node_type: Type of the node columns (str for arbitrary node identifiers)
+    :param check: Boolean, run the sanity check first
+    :return: one numpy array per node column and weights (None for unweighted)
+    """
+    if file_operations.is_sharded(input_file):
+        return read_sharded_edge_arrays(input_file, delimiter, weighted, node_columns, node_type)
+
+    # Check sanity status of input
+    sanity_status = file_operations.sanity_check(input_file, delimiter, weighted, node_columns) if check else 1
+
+    # Get data for weighted graph
+    file_is_weighted = file_operations.is_weighted(weighted)
+
+    if sanity_status == 1:
+        if check:
+            print('Creating edge arrays.....', log_type='info')
+        n_cols = node_columns + 1 if file_is_weighted else node_columns
+        column_types = dict((i, node_type) for i in range(node_columns))
+        column_types[node_columns] = np.float64
+        # Plain integer files are parsed straight from a memory map
+        if node_type is np.int64 and (delimiter is None or len(delimiter) == 1) and \
+                not file_operations.is_streamed(input_file):
+            columns = read_mapped_integer_edges(input_file, n_cols, delimiter)
+            if columns is not None:
+                weights = columns[:, node_columns].astype(np.float64) if file_is_weighted else None
+
+                # Return
+                return tuple(columns[:, i].copy() for i in range(node_columns)) + (weights,)
+
+        # Compressed input is decompressed into the parser on the fly
+        stream, pump = file_operations.open_input(input_file)
+        try:
+            edges = pd.read_csv(stream, sep=delimiter if delimiter else r'\s+', header=None, comment='#',
+                                usecols=range(n_cols), dtype={i: column_types[i] for i in range(n_cols)})
+        except Exception as e:
+            print('Can not create edge arrays. ERROR: {}'.format(e), color='red', log_type='error')
+            sys.exit(1)
+        finally:
+            file_operations.finish_input(stream, pump)
+        columns = tuple(edges[i].values for i in range(node_columns))
+        weights = edges[node_columns].values if file_is_weighted else None
+
+        # Return
+        return columns + (weights,)
+    else:
+        print('Sanity check failed!', log_type='error', color='red')
+        sys.exit(1)
+
+
+# Read one shard
+def read_shard(shard_arguments):
+    """
+    This function parses one shard of a sharded input (used by the worker processes). A shard that can not be
+    parsed raises ValueError, a worker that exits would leave the pool waiting for its result forever
+    :param shard_arguments: A tuple of (input file, delimiter, weighted, node columns, node type)
+    :return: one numpy array per node column and weights (None for unweighted)
+    """
+    input_file, delimiter, weighted, node_columns, node_type = shard_arguments
+    try:
+        edge_arrays = read_edge_arrays(input_file, delimiter, weighted, node_columns, node_type, check=False)
+    except SystemExit:
+        raise ValueError('Can not create edge arrays from shard: {}'.format(input_file))
+
+    # Return
+    return edge_arrays
+
+
+# Read a sharded edge list
+def read_sharded_edge_arrays(input_file=None, delimiter=None, weighted=None, node_columns=2, node_type=np.int64,
+                             workers=None):
+    """
+    This function parses the shards (part files) of a directory or glob pattern in parallel worker processes and
+    concatenates them into one set of edge arrays, a sample of the shards is sanity checked
+    :param input_file: Directory or glob pattern of the shards
+    :param delimiter: Column separator in the files
+    :param weighted: Simple yes/no if the files are weighted or not
+    :param node_columns: Number of node columns of a link, e.g. 3 for trigrams
+    :param node_type: Type of the node columns (str for arbitrary node identifiers)
+    :param workers: Number of worker processes (default: one per CPU, at most one per shard)
+    :return: one numpy array per node column and weights (None for unweighted)
+    """
+    input_files = file_operations.expand_input_files(input_file)
+    if file_operations.sanity_check_shards(input_files, delimiter, weighted, node_columns) != 1:
+        print('Sanity check failed!', log_type='error', color='red')
+        sys.exit(1)
+
+    workers = min(workers or multiprocessing.cpu_count(), len(input_files))
+    print('Creating edge arrays from {} shards in {} worker processes.....'.format(len(input_files), workers),
+          log_type='info')
+    shard_arguments = [(f, delimiter, weighted, node_columns, node_type) for f in input_files]
+    try:
+        if workers > 1:
+            pool = multiprocessing.Pool(processes=workers)
+            try:
+                shards = pool.map(read_shard, shard_arguments, chunksize=1)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            shards = [read_shard(arguments) for arguments in shard_arguments]
+    except Exception as e:
+        print('{}'.format(e), log_type='error', color='red')
+        sys.exit(1)
+
+    # One array per column
+    columns = tuple(np.concatenate([shard[i] for shard in shards]) for i in range(node_columns))
+    weights = np.concatenate([shard[node_columns] for shard in shards]) if shards[0][node_columns] is not None \
+        else None
+
+    # Return
+    return columns + (weights,)
+
+
+# Compose networkx graph from edge arrays
+def compose_ntx_graph_from_arrays(edges=None):
+    """
+    This function creates a networkx graph from edge arrays
+    :param edges: Edge arrays (sources, targets, weights)
+    :return: networkx graph
+    """
+    sources, targets, weights = edges
+    ntx_graph = nx.Graph()
+    if weights is None:
+        ntx_graph.add_edges_from(zip(sources.tolist(), targets.tolist()))
+    else:
+        ntx_graph.add_weighted_edges_from(zip(sources.tolist(), targets.tolist(), weights.tolist()))
+
+    # Return
+    return ntx_graph
+
+
+# Compose SNAP graph from edge arrays
+def compose_snap_graph_from_arrays(edges=None):
+    """
+    This function creates an undirected SNAP graph from edge arrays (weights are ignored, like snap.LoadEdgeList)
+    :param edges: Edge arrays (sources, targets, weights)
+    :return: snap graph
+    """
+    sources, targets, _ = edges
+    snap_graph = snap.TUNGraph.New()
+    # Drain lazy maps of the native methods, no python level loop per node/edge
+    deque(lazy_map(snap_graph.AddNode, np.unique(np.concatenate((sources, targets))).tolist()), maxlen=0)
+    deque(lazy_map(snap_graph.AddEdge, sources.tolist(), targets.tolist()), maxlen=0)
+
+    # Return
+    return snap_graph
+
+
+# Label connected components
+def label_components(sources=None, targets=None):
+    """
+    This function labels the connected components of a graph with a vectorized union-find (hooking and pointer
+    jumping over the edge arrays)
+    :param sources: numpy array of source nodes
+    :param targets: numpy array of target nodes
+    :return: numpy array of nodes, component id of every node, dense (0..n-1) indices of sources and targets
+    """
+    # Dense node indices
+    nodes, dense = np.unique(np.concatenate((sources, targets)), return_inverse=True)
+    dense = dense.ravel()
+    source_index = dense[:len(sources)]
+    target_index = dense[len(sources):]
+
+    # Every node starts as its own root, roots only move to smaller indices (no cycles)
+    labels = np.arange(len(nodes))
+    while True:
+        # Pointer jumping until every node points to its root
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+        source_roots = labels[source_index]
+        target_roots = labels[target_index]
+        unmerged = source_roots != target_roots
+        if not unmerged.any():
+            break
+        # Hook the larger root of every unmerged edge under the smaller one
+        low = np.minimum(source_roots[unmerged], target_roots[unmerged])
+        high = np.maximum(source_roots[unmerged], target_roots[unmerged])
+        np.minimum.at(labels, high, low)
+
+    # Renumber components 0..k-1
+    _, components = np.unique(labels, return_inverse=True)
+
+    # Return
+    return nodes, components.ravel(), source_index, target_index
+
+
+# Run community detection of one component
+def find_component_communities(component_arguments):
+    """
+    This function runs a community detection function on one component (used by the worker processes). A detection
+    function that exits raises ValueError instead, a worker that exits would leave the pool waiting for its result
+    forever (see run_component_pool())
+    :param component_arguments: A tuple of (detection function, edge arrays with dense local node indices)
+    :return: numpy arrays of local nodes and their communities
+    """
+    find_communities, edges = component_arguments
+    try:
+        communities = find_communities(edges)
+    except SystemExit:
+        raise ValueError('Can not detect communities of a component with {} edges!'.format(len(edges[0])))
+
+    # Return
+    return communities
+
+
+# Detect communities of several components
+def run_component_pool(sub_problems=None, workers=1):
+    """
+    This function runs find_component_communities() on every sub problem, in a pool of worker processes if more than
+    one worker is requested. A failed detection is reported in the parent process, which exits
+    :param sub_problems: python list of (detection function, edge arrays) tuples
+    :param workers: Number of worker processes
+    :return: python list of (numpy array of local nodes, numpy array of communities), one per sub problem
+    """
+    try:
+        if workers > 1 and len(sub_problems) > 1:
+            pool = multiprocessing.Pool(processes=workers)
+            try:
+                results = pool.map(find_component_communities, sub_problems, chunksize=1)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            results = [find_component_communities(sub_problem) for sub_problem in sub_problems]
+    except Exception as e:
+        print('{}'.format(e), log_type='error', color='red')
+        sys.exit(1)
+
+    # Return
+    return results
+
+
+# Community detection per connected component
+def component_communities(edges=None, find_communities=None, min_component_size=10, workers=1):
+    """
+    This function splits the graph into connected components, runs the detection function on every large
+    component (in parallel worker processes) and assigns every small component to a single community
+    :param edges: Edge arrays (sources, targets, weights)
+    :param find_communities: Module level function taking edge arrays, returning arrays of nodes and communities
+    :param min_component_size: Components with fewer nodes are assigned a community without running the algorithm
+    :param workers: Number of worker processes
+    :return: numpy array of nodes, numpy array of community ids
+    """
+    sources, targets, weights = edges
+    print('Labelling connected components.....', log_type='info')
+    nodes, components, source_index, target_index = label_components(sources, targets)
+    sizes = np.bincount(components)
+    large = np.flatnonzero(sizes >= min_component_size)
+    print('Found {} components, {} with at least {} nodes'.format(len(sizes), len(large), min_component_size),
+          log_type='info')
+
+    # Group edges by component (communities never cross components)
+    edge_components = components[source_index]
+    edge_order = np.argsort(edge_components, kind='mergesort')
+    edge_offsets = np.searchsorted(edge_components[edge_order], np.arange(len(sizes) + 1))
+
+    # Sub problems with dense local node indices, largest first
+    node_tables = []
+    sub_problems = []
+    for component in large[np.argsort(-sizes[large], kind='mergesort')]:
+        component_edges = edge_order[edge_offsets[component]:edge_offsets[component + 1]]
+        node_table, local = np.unique(np.concatenate((source_index[component_edges],
+                                                      target_index[component_edges])), return_inverse=True)
+        local = local.ravel()
+        component_weights = weights[component_edges] if weights is not None else None
+        node_tables.append(node_table)
+        sub_problems.append((find_communities, (local[:len(component_edges)], local[len(component_edges):],
+                                                component_weights)))
+
+    # Run the detection on the large components
+    if workers > 1 and len(sub_problems) > 1:
+        print('Detecting communities of {} components in {} worker processes.....'.format(len(sub_problems), workers),
+              log_type='info')
+    results = run_component_pool(sub_problems, workers)
+
+    # Merge the results with offset community ids
+    membership = np.empty(len(nodes), dtype=np.int64)
+    offset = 0
+    for node_table, (local_nodes, local_membership) in zip(node_tables, results):
+        _, local_membership = np.unique(local_membership, return_inverse=True)
+        membership[node_table[local_nodes]] = local_membership.ravel() + offset
+        offset += local_membership.max() + 1 if len(local_membership) else 0
+
+    # Every small component is one community
+    is_small = sizes < min_component_size
+    small_ids = np.cumsum(is_small) - 1 + offset
+    small_nodes = is_small[components]
+    membership[small_nodes] = small_ids[components[small_nodes]]
+
+    # Return
+    return nodes, membership
+
+
+# Merge parallel edges
+def merge_parallel_edges(sources=None, targets=None, weights=None):
+    """
+    This function merges parallel (same endpoints, any direction) edges, summing their weights
+    :param sources: numpy array of source nodes
+    :param targets: numpy array of target nodes
+    :param weights: numpy array of edge weights (None for unweighted graphs)
+    :return: sources, targets, weights of the merged edges
+    """
+    order, starts, low, high = group_edges(sources, targets)
+    first = order[starts]
+    if weights is not None:
+        weights = np.add.reduceat(weights[order], starts) if len(starts) else weights[:0]
+
+    # Return
+    return low[first], high[first], weights
+
+
+# Point every node to its root
+def jump_to_roots(parent=None):
+    """
+    This function follows parent pointers (pointer jumping) until every node points to its root
+    :param parent: numpy array of parent indices (roots point to themselves)
+    :return: numpy array of root indices
+    """
+    while True:
+        jumped = parent[parent]
+        if np.array_equal(jumped, parent):
+            break
+        parent = jumped
+
+    # Return
+    return parent
+
+
+# Fold pendant nodes and degree-2 chains
+def fold_pendant_nodes(edges=None, fold_chains=False):
+    """
+    This function folds degree-1 (pendant) nodes into their neighbor, repeatedly, so whole pendant trees collapse into
+    the node they hang from. With fold_chains, nodes of degree-2 chains are folded into each other as well.
+    The weight of the edges inside a folded tree or chain (and of the input's self-loops) is kept as a self-loop of
+    the node it was folded into, so node strengths and the total weight do not change (unweighted edges count 1).
+    Components that would fold into a single node (trees, cycles) are left unfolded.
+    :param edges: Edge arrays (sources, targets, weights)
+    :param fold_chains: Boolean, also fold chains of degree-2 nodes
+    :return: reduced edge arrays, numpy array of all nodes, index (into nodes) of the node every node was folded into
+    """
+    sources, targets, weights = edges
+    nodes, dense = np.unique(np.concatenate((sources, targets)), return_inverse=True)
+    dense = dense.ravel()
+    source_index = dense[:len(sources)]
+    target_index = dense[len(sources):]
+    parent = np.arange(len(nodes))
+
+    # Pendant nodes, one round per layer of the pendant trees
+    alive = np.flatnonzero(source_index != target_index)
+    while True:
+        alive_sources = source_index[alive]
+        alive_targets = target_index[alive]
+        degree = np.bincount(alive_sources, minlength=len(nodes)) + np.bincount(alive_targets, minlength=len(nodes))
+        source_is_leaf = degree[alive_sources] == 1
+        target_is_leaf = degree[alive_targets] == 1
+        touches_leaf = source_is_leaf | target_is_leaf
+        if not touches_leaf.any():
+            break
+        only_source = source_is_leaf & ~target_is_leaf
+        only_target = target_is_leaf & ~source_is_leaf
+        parent[alive_sources[only_source]] = alive_targets[only_source]
+        parent[alive_targets[only_target]] = alive_sources[only_target]
+        # An isolated edge folds into its smaller end
+        both = source_is_leaf & target_is_leaf
+        parent[np.maximum(alive_sources[both], alive_targets[both])] = np.minimum(alive_sources[both],
+                                                                                 alive_targets[both])
+        alive = alive[~touches_leaf]
+    print('Folded {} pendant nodes.....'.format(int((parent != np.arange(len(nodes))).sum())), log_type='info')
+
+    # Degree-2 chains, every chain node points to its smallest chain neighbor
+    reduced_sources = source_index[alive]
+    reduced_targets = target_index[alive]
+    reduced_weights = weights[alive] if weights is not None else None
+    while fold_chains:
+        roots = jump_to_roots(parent)
+        reduced_sources, reduced_targets, reduced_weights = merge_parallel_edges(roots[reduced_sources],
+                                                                                 roots[reduced_targets],
+                                                                                 reduced_weights)
+        loop = reduced_sources == reduced_targets
+        reduced_sources = reduced_sources[~loop]
+        reduced_targets = reduced_targets[~loop]
+        reduced_weights = reduced_weights[~loop] if reduced_weights is not None else None
+        degree = np.bincount(reduced_sources, minlength=len(nodes)) + np.bincount(reduced_targets,
+                                                                                  minlength=len(nodes))
+        chain_edge = (degree[reduced_sources] == 2) & (degree[reduced_targets] == 2)
+        if not chain_edge.any():
+            break
+        chain_sources = np.concatenate((reduced_sources[chain_edge], reduced_targets[chain_edge]))
+        chain_targets = np.concatenate((reduced_targets[chain_edge], reduced_sources[chain_edge]))
+        smallest = np.arange(len(nodes))
+        smallest[chain_sources] = len(nodes)
+        np.minimum.at(smallest, chain_sources, chain_targets)
+        # Two chain nodes pointing at each other: the smaller one stays a root
+        stays_root = (smallest[smallest[chain_sources]] == chain_sources) & (chain_sources < smallest[chain_sources])
+        smallest[chain_sources[stays_root]] = chain_sources[stays_root]
+        chain_nodes = np.unique(chain_sources)
+        parent[chain_nodes] = smallest[chain_nodes]
+        print('Folding {} degree-2 chain nodes.....'.format(int((smallest[chain_nodes] != chain_nodes).sum())),
+              log_type='info')
+
+    # Every edge moves to the roots of its ends, edges inside a folded tree or chain become self-loops of the root
+    roots = jump_to_roots(parent)
+    all_weights = weights if weights is not None else np.ones(len(sources))
+    reduced_sources, reduced_targets, reduced_weights = merge_parallel_edges(roots[source_index],
+                                                                             roots[target_index], all_weights)
+
+    # Components folded into a single node are left to the detection
+    linked = np.zeros(len(nodes), dtype=bool)
+    between_roots = reduced_sources != reduced_targets
+    linked[reduced_sources[between_roots]] = True
+    linked[reduced_targets[between_roots]] = True
+    collapsed = ~linked[roots]
+    if collapsed.any():
+        print('Keeping {} nodes of tree (or cycle) components unfolded.....'.format(int(collapsed.sum())),
+              log_type='info')
+        roots[collapsed] = np.flatnonzero(collapsed)
+        reduced_sources, reduced_targets, reduced_weights = merge_parallel_edges(roots[source_index],
+                                                                                 roots[target_index], all_weights)
+
+    # Reduced graph with original node ids
+    reduced_edges = (nodes[reduced_sources], nodes[reduced_targets], reduced_weights)
+    print('Reduced graph from {} to {} nodes.....'.format(len(nodes), int((roots == np.arange(len(nodes))).sum())),
+          log_type='info')
+
+    # Return
+    return reduced_edges, nodes, roots
+
+
+# Expand the communities of a reduced graph
+def expand_membership(nodes=None, roots=None, reduced_nodes=None, reduced_membership=None):
+    """
+    This function gives every node the community of the node it was folded into (see fold_pendant_nodes())
+    Roots that were left without edges become communities of their own.
+    :param nodes: numpy array of all nodes
+    :param roots: index (into nodes) of the node every node was folded into
+    :param reduced_nodes: numpy array of nodes of the reduced graph
+    :param reduced_membership: numpy array of community ids of the reduced graph nodes
+    :return: numpy array of nodes, numpy array of community ids
+    """
+    root_membership = np.full(len(nodes), -1, dtype=np.int64)
+    root_membership[np.searchsorted(nodes, reduced_nodes)] = reduced_membership
+
+    # Roots without any edge left (e.g. collapsed trees)
+    lonely = np.flatnonzero((root_membership == -1) & (roots == np.arange(len(nodes))))
+    first_id = reduced_membership.max() + 1 if len(reduced_membership) else 0
+    root_membership[lonely] = np.arange(first_id, first_id + len(lonely))
+
+    # Return
+    return nodes, root_membership[roots]
+
+
+# Core numbers (k-core decomposition)
+def core_numbers(sources=None, targets=None):
+    """
+    This function computes the core number of every node with vectorized batch peeling: at level k all nodes with
+    degree <= k are removed together and their neighbors' degrees updated with one bincount per batch
+    :param sources: numpy array of source nodes
+    :param targets: numpy array of target nodes
+    :return: numpy array of nodes, numpy array of their core numbers
+    """
+    nodes, dense = np.unique(np.concatenate((sources, targets)), return_inverse=True)
+    dense = dense.ravel()
+    source_index, target_index, _ = merge_parallel_edges(dense[:len(sources)], dense[len(sources):])
+    simple = source_index != target_index
+    source_index = source_index[simple]
+    target_index = target_index[simple]
+
+    degree = np.bincount(source_index, minlength=len(nodes)) + np.bincount(target_index, minlength=len(nodes))
+    core = np.zeros(len(nodes), dtype=np.int64)
+    alive = np.ones(len(nodes), dtype=bool)
+    k = 0
+    while alive.any():
+        k = max(k, degree[alive].min())
+        while True:
+            peel = alive & (degree <= k)
+            if not peel.any():
+                break
+            core[peel] = k
+            alive[peel] = False
+            # Edges losing an endpoint lower the degree of the other (alive) endpoint
+            source_alive = alive[source_index]
+            target_alive = alive[target_index]
+            dead = ~(source_alive & target_alive)
+            degree -= np.bincount(source_index[dead & source_alive], minlength=len(nodes))
+            degree -= np.bincount(target_index[dead & target_alive], minlength=len(nodes))
+            source_index = source_index[~dead]
+            target_index = target_index[~dead]
+
+    # Return
+    return nodes, core
+
+
+# Attach peeled nodes to the communities of their neighbors
+def attach_to_neighbors(edges=None, nodes=None, membership=None):
+    """
+    This function gives every node without a community the most common community among its neighbors, one array
+    pass per distance from the already assigned nodes. Groups that never reach a community become communities
+    of their own.
+    :param edges: Edge arrays (sources, targets, weights) of the full graph
+    :param nodes: numpy array of all nodes (sorted)
+    :param membership: numpy array of community ids, -1 for nodes without a community
+    :return: numpy array of community ids
+    """
+    sources, targets, _ = edges
+    source_index = np.searchsorted(nodes, sources)
+    target_index = np.searchsorted(nodes, targets)
+    membership = membership.copy()
+    while True:
+        # Both directions: (unassigned node, community of assigned neighbor)
+        pending = np.concatenate((source_index, target_index))
+        neighbor = np.concatenate((target_index, source_index))
+        reach = (membership[pending] == -1) & (membership[neighbor] != -1)
+        if not reach.any():
+            break
+        pairs, counts = np.unique(np.stack((pending[reach], membership[neighbor[reach]]), axis=1), axis=0,
+                                  return_counts=True)
+        # Majority community per node: sort by node, then count, keep the last of every node
+        order = np.lexsort((counts, pairs[:, 0]))
+        last = np.append(pairs[order, 0][1:] != pairs[order, 0][:-1], True)
+        membership[pairs[order, 0][last]] = pairs[order, 1][last]
+
+    # Left over groups (no path to any community)
+    left_over = membership == -1
+    if left_over.any():
+        left_edges = left_over[source_index] & left_over[target_index]
+        first_id = membership.max() + 1
+        if left_edges.any():
+            group_nodes, groups, _, _ = label_components(source_index[left_edges], target_index[left_edges])
+            membership[group_nodes] = groups + first_id
+            first_id += groups.max() + 1
+        single = np.flatnonzero(membership == -1)
+        membership[single] = np.arange(first_id, first_id + len(single))
+
+    # Return
+    return membership
+
+
+# Community detection on the k-core
+def kcore_communities(edges=None, find_communities=None, k=2, core_file=None, node_ids=None, **detection_options):
+    """
+    This function runs the detection on the k-core only and attaches the peeled nodes afterwards
+    :param edges: Edge arrays (sources, targets, weights)
+    :param find_communities: Module level function taking edge arrays, returning arrays of nodes and communities
+    :param k: Minimum core number of the nodes the detection runs on
+    :param core_file: If provided, the core number of every node is saved to this file
+    :param node_ids: Original identifiers of interned nodes, used in the core file
+    :param detection_options: Options passed to detect_communities() for the k-core
+    :return: numpy array of nodes, numpy array of community ids
+    """
+    sources, targets, weights = edges
+    print('Computing core numbers.....', log_type='info')
+    nodes, core = core_numbers(sources, targets)
+    print('{} of {} nodes are in the {}-core'.format(int((core >= k).sum()), len(nodes), k), log_type='info')
+    if core_file:
+        print('Creating core number (.core) file.....', log_type='info')
+        core_nodes = node_ids[nodes] if node_ids is not None else nodes
+        pd.DataFrame({'node': core_nodes, 'core': core}).to_csv(core_file, sep=' ', header=False, index=False)
+
+    # Detect communities of the k-core
+    in_core = core[np.searchsorted(nodes, sources)] >= k
+    in_core &= core[np.searchsorted(nodes, targets)] >= k
+    membership = np.full(len(nodes), -1, dtype=np.int64)
+    if in_core.any():
+        core_edges = (sources[in_core], targets[in_core], weights[in_core] if weights is not None else None)
+        core_nodes, core_membership = detect_communities(core_edges, find_communities, **detection_options)
+        membership[np.searchsorted(nodes, core_nodes)] = core_membership
+
+    # Attach the peeled nodes
+    membership = attach_to_neighbors(edges, nodes, membership)
+
+    # Return
+    return nodes, membership
+
+
+# Community detection on edge arrays with the optional reduction stages
+def detect_communities(edges=None, find_communities=None, components=False, min_component_size=10, workers=1,
+                       fold=None, kcore=None, core_file=None, node_ids=None):
+    """
+    This function runs a community detection function on edge arrays with the optional stages around it
+    :param edges: Edge arrays (sources, targets, weights)
+    :param find_communities: Module level function taking edge arrays, returning arrays of nodes and communities
+    :param components: Boolean, detect communities per connected component
+    :param min_component_size: Smaller components become one community without running the algorithm
+    :param workers: Number of worker processes for per component detection
+    :param fold: None, 'pendants' or 'chains' (pendants and degree-2 chains) to fold before detection
+    :param kcore: If provided, detect communities on the k-core only and attach the peeled nodes afterwards
+    :param core_file: If provided (with kcore), the core number of every node is saved to this file
+    :param node_ids: Original identifiers of interned nodes, used in the core file
+    :return: numpy array of nodes, numpy array of community ids
+    """
+    # Run the rest of the stages on the k-core only
+    if kcore:
+        return kcore_communities(edges, find_communities, kcore, core_file, node_ids, components=components,
+                                 min_component_size=min_component_size, workers=workers, fold=fold)
+
+    # Shrink the working graph
+    if fold:
+        original_edges = edges
+        edges, all_nodes, roots = fold_pendant_nodes(edges, fold_chains=fold == 'chains')
+
+    # Detect communities
+    if components:
+        nodes, membership = component_communities(edges, find_communities, min_component_size, workers)
+    else:
+        nodes, membership = find_communities(edges)
+
+    # Re-expand the folded nodes, the partition must keep its modularity on the original graph
+    if fold:
+        folded_modularity = edge_modularity(edges, nodes, membership)
+        nodes, membership = expand_membership(all_nodes, roots, nodes, membership)
+        original_modularity = edge_modularity(original_edges, nodes, membership)
+        print('Modularity on the folded graph: {:.6f}, on the original graph: {:.6f}'.format(
+            folded_modularity, original_modularity), log_type='info')
+        if original_modularity < folded_modularity - 1e-9:
+            print('Folding lowered the modularity on the original graph!', log_type='warn')
+
+    # Return
+    return nodes, membership
+
+
+# Communities of the edge endpoints
+def edge_communities(edges=None, nodes=None, membership=None):
+    """
+    This function remaps both endpoints of every edge through the membership array
+    :param edges: Edge arrays (sources, targets, weights)
+    :param nodes: numpy array of nodes
+    :param membership: numpy array of community ids of the nodes
+    :return: numpy array of source communities, numpy array of target communities
+    """
+    sources, targets, _ = edges
+    order = np.argsort(nodes, kind='mergesort')
+    sorted_nodes = np.asarray(nodes)[order]
+    sorted_membership = np.asarray(membership, dtype=np.int64)[order]
+
+    # Return
+    return sorted_membership[np.searchsorted(sorted_nodes, sources)], \
+        sorted_membership[np.searchsorted(sorted_nodes, targets)]
+
+
+# Modularity of a partition
+def edge_modularity(edges=None, nodes=None, membership=None):
+    """
+    This function computes the modularity of a partition from the edge arrays (self-loops count once inside their
+    community and twice in its volume)
+    :param edges: Edge arrays (sources, targets, weights)
+    :param nodes: numpy array of nodes
+    :param membership: numpy array of community ids of the nodes
+    :return: modularity
+    """
+    weights = edges[2] if edges[2] is not None else np.ones(len(edges[0]))
+    source_communities, target_communities = edge_communities(edges, nodes, membership)
+    _, community_index = np.unique(np.concatenate((source_communities, target_communities)), return_inverse=True)
+    community_index = community_index.ravel()
+    total_weight = float(weights.sum())
+    if total_weight == 0:
+        return 0.0
+    intra = source_communities == target_communities
+    volume = np.bincount(community_index, weights=np.concatenate((weights, weights)))
+    internal = np.bincount(community_index[:len(weights)][intra], weights=weights[intra], minlength=len(volume))
+
+    # Return
+    return float((internal / total_weight - (volume / (2 * total_weight)) ** 2).sum())
+
+
+# Quotient (community level) graph
+def quotient_edges(edges=None, nodes=None, membership=None):
+    """
+    This function aggregates a graph to its communities: edge endpoints are remapped through the membership array and
+    parallel community edges are merged, summing their weights (edge counts for unweighted graphs). The weight inside
+    a community is kept as a self loop of the community
+    :param edges: Edge arrays (sources, targets, weights)
+    :param nodes: numpy array of nodes
+    :param membership: numpy array of community ids of the nodes
+    :return: sources, targets, weights of the quotient graph (nodes are community ids)
+    """
+    community_sources, community_targets = edge_communities(edges, nodes, membership)
+    weights = np.ones(len(community_sources)) if edges[2] is None else edges[2].astype(np.float64)
+    quotient = merge_parallel_edges(community_sources, community_targets, weights)
+    print('Quotient graph: {} communities, {} community edges'.format(len(np.unique(membership)),
+                                                                      len(quotient[0])), log_type='info')
+
+    # Return
+    return quotient
+
+
+# Induced subgraphs of all communities
+def community_subgraphs(edges=None, nodes=None, membership=None):
+    """
+    This function keeps the intra community edges and sorts them (and the nodes) by community, so the induced
+    subgraph of a community is one slice of the arrays
+    :param edges: Edge arrays (sources, targets, weights)
+    :param nodes: numpy array of nodes
+    :param membership: numpy array of community ids of the nodes
+    :return: python dictionary of arrays: communities, offsets (edge slice bounds of every community), sources,
+             targets, weights (if weighted), nodes and node_offsets (node slice bounds of every community)
+    """
+    sources, targets, weights = edges
+    community_sources, community_targets = edge_communities(edges, nodes, membership)
+    intra = np.flatnonzero(community_sources == community_targets)
+    intra = intra[np.argsort(community_sources[intra], kind='mergesort')]
+    node_order = np.argsort(membership, kind='mergesort')
+    sorted_membership = np.asarray(membership)[node_order]
+    communities = np.unique(sorted_membership)
+
+    subgraphs = {
+        'communities': communities,
+        'offsets': np.append(np.searchsorted(community_sources[intra], communities), len(intra)),
+        'sources': sources[intra],
+        'targets': targets[intra],
+        'nodes': np.asarray(nodes)[node_order],
+        'node_offsets': np.append(np.searchsorted(sorted_membership, communities), len(node_order)),
+    }
+    if weights is not None:
+        subgraphs['weights'] = weights[intra]
+
+    # Return
+    return subgraphs
+
+
+# Write the subgraphs of a batch of communities
+def write_subgraph_batch(batch_arguments):
+    """
+    This function writes one binary edge (.npz) file per community of a batch (used by the worker processes)
+    :param batch_arguments: A tuple of (output directory, community ids, edge offsets relative to the batch, sources,
+                            targets, weights)
+    :return: Number of files written
+    """
+    output_directory, communities, offsets, sources, targets, weights = batch_arguments
+    for i, community in enumerate(communities):
+        edge_slice = slice(offsets[i], offsets[i + 1])
+        arrays = {'sources': sources[edge_slice], 'targets': targets[edge_slice]}
+        if weights is not None:
+            arrays['weights'] = weights[edge_slice]
+        with open(os.path.join(output_directory, 'community_{}.npz'.format(community)), 'wb') as f:
+            np.savez(f, **arrays)
+
+    # Return
+    return len(communities)
+
+
+# Export the induced subgraphs of all communities
+def export_community_subgraphs(output_file=None, edges=None, nodes=None, membership=None, mode='indexed', workers=1,
+                               node_ids=None, batch_size=1000):
+    """
+    This function exports the induced subgraph of every community, either as one indexed binary file
+    (<output>_subgraphs.npz, see community_subgraphs()) or as one binary edge file per community
+    (<output>_subgraphs/community_<id>.npz) written by a pool of worker processes
+    :param output_file: name and location of the output files, the extension is replaced
+    :param edges: Edge arrays (sources, targets, weights)
+    :param nodes: numpy array of nodes
+    :param membership: numpy array of community ids of the nodes
+    :param mode: 'indexed' or 'files'
+    :param workers: Number of worker processes (files mode)
+    :param node_ids: Original identifiers of interned nodes, written instead of the dense nodes
+    :param batch_size: Number of communities written per worker task
+    :return: <> file object <>
+    """
+    subgraphs = community_subgraphs(edges, nodes, membership)
+    if node_ids is not None:
+        node_ids = np.asarray(node_ids)
+        node_ids = node_ids.astype(str) if node_ids.dtype == object else node_ids
+        for name in ['sources', 'targets', 'nodes']:
+            subgraphs[name] = node_ids[subgraphs[name]]
+    base_name = output_file.rsplit('.', 1)[0] + '_subgraphs'
+    print('Induced subgraphs: {} communities, {} intra community edges'.format(len(subgraphs['communities']),
+                                                                               len(subgraphs['sources'])),
+          log_type='info')
+
+    if mode == 'indexed':
+        try:
+            print('Creating indexed subgraph (.npz) file.....', log_type='info')
+            with open(base_name + '.npz', 'wb') as f:
+                np.savez(f, **subgraphs)
+        except Exception as e:
+            print('Can not create subgraph file! ERROR: {}'.format(e), log_type='error')
+            sys.exit(1)
+    else:
+        try:
+            os.makedirs(base_name)
+        except OSError:
+            if not os.path.isdir(base_name):
+                print('Can not create subgraph directory: {}'.format(base_name), log_type='error')
+                sys.exit(1)
+
+        # Contiguous batches of communities, every batch only carries its own slice of the edges
+        communities = subgraphs['communities']
+        offsets = subgraphs['offsets']
+        weights = subgraphs.get('weights')
+        batches = []
+        for start in range(0, len(communities), batch_size):
+            stop = min(start + batch_size, len(communities))
+            edge_slice = slice(offsets[start], offsets[stop])
+            batches.append((base_name, communities[start:stop], offsets[start:stop + 1] - offsets[start],
+                            subgraphs['sources'][edge_slice], subgraphs['targets'][edge_slice],
+                            weights[edge_slice] if weights is not None else None))
+        print('Creating {} subgraph (.npz) files in {}.....'.format(len(communities), base_name), log_type='info')
+        if workers > 1 and len(batches) > 1:
+            pool = multiprocessing.Pool(processes=workers)
+            try:
+                pool.map(write_subgraph_batch, batches, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for batch in batches:
+                write_subgraph_batch(batch)
+
+
+# Recursive refinement of oversized communities
+def refine_communities(edges=None, nodes=None, membership=None, find_communities=None, max_size=None, workers=1,
+                       max_depth=3):
+    """
+    This function re-runs a community detection function on the induced subgraph of every community with more than
+    max_size nodes, level by level. The oversized communities of a level are detected concurrently in a pool of
+    worker processes, communities that do not split (or reach max_depth) are kept as they are
+    :param edges: Edge arrays (sources, targets, weights)
+    :param nodes: numpy array of nodes
+    :param membership: numpy array of community ids of the nodes
+    :param find_communities: Module level function taking edge arrays, returning arrays of nodes and communities
+    :param max_size: Communities with more nodes are refined
+    :param workers: Number of worker processes
+    :param max_depth: Maximum number of refinement levels
+    :return: numpy array of nodes, numpy array of (finest) community ids, numpy array of community ids per level
+             (one column per level, -1 where a node was not refined at that level)
+    """
+    sources, targets, weights = edges
+    nodes = np.asarray(nodes)
+    n_nodes = len(nodes)
+
+    # Work on node indices, the subgraph slices then are node index tables
+    order = np.argsort(nodes, kind='mergesort')
+    index_edges = (order[np.searchsorted(nodes[order], sources)], order[np.searchsorted(nodes[order], targets)],
+                   weights)
+    current = np.asarray(membership, dtype=np.int64).copy()
+    levels = [current.copy()]
+    settled = np.empty(0, dtype=np.int64)
+    for depth in range(1, max_depth + 1):
+        communities, sizes = np.unique(current, return_counts=True)
+        oversized = communities[(sizes > max_size) & ~np.isin(communities, settled)]
+        if not len(oversized):
+            break
+
+        # One sub problem per oversized community, with dense local node indices
+        subgraphs = community_subgraphs(index_edges, np.arange(n_nodes), current)
+        offsets = subgraphs['offsets']
+        node_offsets = subgraphs['node_offsets']
+        node_tables = []
+        sub_problems = []
+        for i in np.flatnonzero(np.isin(subgraphs['communities'], oversized)):
+            node_table = np.sort(subgraphs['nodes'][node_offsets[i]:node_offsets[i + 1]])
+            edge_slice = slice(offsets[i], offsets[i + 1])
+            node_tables.append(node_table)
+            sub_problems.append((find_communities, (np.searchsorted(node_table, subgraphs['sources'][edge_slice]),
+                                                    np.searchsorted(node_table, subgraphs['targets'][edge_slice]),
+                                                    subgraphs['weights'][edge_slice] if weights is not None
+                                                    else None)))
+        print('Refinement level {}: detecting communities of {} communities with more than {} nodes.....'.format(
+            depth, len(sub_problems), max_size), log_type='info')
+        results = run_component_pool(sub_problems, workers)
+
+        # New ids after the current ones, nodes left without edges in a subgraph become communities of their own
+        level = np.full(n_nodes, -1, dtype=np.int64)
+        next_id = int(current.max()) + 1
+        splits = 0
+        for node_table, (local_nodes, local_membership) in zip(node_tables, results):
+            local_ids, local_membership = np.unique(local_membership, return_inverse=True)
+            local_level = np.full(len(node_table), -1, dtype=np.int64)
+            local_level[np.asarray(local_nodes, dtype=np.int64)] = local_membership.ravel()
+            lonely = np.flatnonzero(local_level == -1)
+            local_level[lonely] = np.arange(len(local_ids), len(local_ids) + len(lonely))
+            if local_level.max() == 0:
+                settled = np.append(settled, current[node_table[0]])
+                continue
+            level[node_table] = local_level + next_id
+            next_id += int(local_level.max()) + 1
+            splits += 1
+        print('Refinement level {}: {} communities split'.format(depth, splits), log_type='info')
+        if not splits:
+            break
+        levels.append(level)
+        current = np.where(level >= 0, level, current)
+
+    # Return
+    return nodes, current, np.column_stack(levels)
+
+
+# Save the community levels of a refined partition
+def save_community_levels(output_file=None, nodes=None, levels=None, node_ids=None):
+    """
+    This function saves the levels returned by refine_communities() in the module path layout of Infomap
+    (<output>.paths.npy, rows of <node> <community at level 0> <community at level 1> ...), so that
+    native_converter.path_membership() gives the membership at any depth
+    :param output_file: name and location of the output files, the extension is replaced
+    :param nodes: numpy array of nodes (dense nodes of interned graphs)
+    :param levels: numpy array of community ids per level
+    :param node_ids: Original identifiers of interned nodes, saved next to the paths (.ids)
+    :return: <> file object <>
+    """
+    base_name = output_file.rsplit('.', 1)[0]
+    try:
+        print('Creating community level (.paths.npy) file.....', log_type='info')
+        np.save(base_name + '.paths.npy', np.column_stack((np.asarray(nodes, dtype=np.int64), levels)))
+        if node_ids is not None:
+            print('Creating node identifier (.ids) file.....', log_type='info')
+            pd.Series(node_ids).to_csv(base_name + '.ids', header=False, index=False)
+    except Exception as e:
+        print('Can not create community level file! ERROR: {}'.format(e), log_type='error')
+
+
 # Command Center
 def command_center(input_file=None, delimiter=None, weighted=None):
     """
@@ -8,6 +8,7 @@ import os
 import sys
 import textwrap
 import argparse
+import numpy as np
 try:
     from pyrainbowterm import *
 except ImportError:
@@ -24,6 +25,12 @@ import graph_composer
 # import file_operations
 import file_operations
 
+# Import partition metrics
+import partition_metrics
+
+# Import partition comparison
+import partition_comparison
+
 # Source code meta data
 __author__ = 'Dalwar Hossain'
 __email__ = 'dalwar.hossain@protonmail.com'
@@ -31,44 +38,169 @@ __email__ = 'dalwar.hossain@protonmail.com'
 
 # Clauset-Newman-Moore community detection
 # @profile  # Uncomment to profile this function for memory usage with 'mprof'
-def fast_greedy_find_communities(ntx_graph):
+def fast_greedy_find_communities(ntx_graph, weight=None):
     """
     This function detects community structures in a graph using Clauset-Newman-Moore algorithm
     :param ntx_graph: A graph created with networkx
+    :param weight: Edge attribute used as weight (None for the unweighted algorithm)
     :return: Total number of community, a python dictionary with detected communities, modularity of the network
     """
     print('Finding communities with fast-greedy (Clauset-Newman-Moore) algorithm.....', log_type='info')
-    communities = modularity_max.greedy_modularity_communities(ntx_graph, weight=None)
+    communities = modularity_max.greedy_modularity_communities(ntx_graph, weight=weight)
 
     # Return
     return communities
 
 
+# Find communities from edge arrays
+def fast_greedy_communities_from_arrays(edges):
+    """
+    This function finds communities of a graph given as edge arrays (used for per component detection). The weights
+    are used, run_fast_greedy() passes unweighted edges so only folded edges (see graph_composer.fold_pendant_nodes())
+    carry a weight, the number of input edges they stand for
+    :param edges: Edge arrays (sources, targets, weights)
+    :return: numpy arrays of nodes and their communities
+    """
+    ntx_graph = graph_composer.compose_ntx_graph_from_arrays(edges)
+
+    # Return
+    return file_operations.communities_to_arrays(fast_greedy_find_communities(ntx_graph, weight='weight'))
+
+
+# Create a function to run fast greedy algorithm
+def run_fast_greedy(input_file=None, delimiter=None, weighted=None, output=None, components=None,
+                    min_component_size=10, workers=1, fold=None, kcore=None, duplicates=None, intern_ids=None,
+                    output_dir=None, metrics=None, previous=None, quotient=None, subgraphs=None,
+                    refine=None, refine_depth=3):
+    """
+    This function finds community structures in graphs using fast greedy (CNM) algorithm
+    :param input_file: Input file with edges of the graph
+    :param delimiter: Field separator
+    :param weighted: are the edges weighted?
+    :param output: whether output file will be created or not (boolean - yes/no)
+    :param components: whether communities are detected per connected component (boolean - yes/no)
+    :param min_component_size: Smaller components become one community without running the algorithm
+    :param workers: Number of worker processes for per component detection
+    :param fold: None, 'pendants' or 'chains' (pendants and degree-2 chains) to fold before detection
+    :param kcore: If provided, detect communities on the k-core only, attach the peeled nodes and save core numbers
+    :param duplicates: If provided, drop self loops and merge duplicate edges keeping the sum/max/first weight
+    :param intern_ids: Boolean, yes/no if node identifiers are arbitrary (e.g. strings) and mapped to dense integers
+    :param output_dir: Output directory, required when the input is the standard input (-)
+    :param metrics: Boolean, yes/no if partition quality metrics are reported (and saved as .metrics/.cmetrics)
+    :param previous: Community (.npz/.pkl) file of a previous run, matching communities keep its ids
+    :param quotient: Boolean, yes/no if the community level graph is saved as a binary edge file (.npz)
+    :param subgraphs: None, 'indexed' (one indexed .npz file) or 'files' (one .npz file per community) to
+                      export the induced subgraph of every community
+    :param refine: If provided, communities with more nodes are detected again on their induced subgraph
+    :param refine_depth: Maximum number of refinement levels
+    :return: <> file object <>
+    """
+    per_component = components == 'Yes' or components == 'Y' or components == 'y' or components == 'yes'
+    use_interning = intern_ids == 'Yes' or intern_ids == 'Y' or intern_ids == 'y' or intern_ids == 'yes'
+    node_ids = None
+    report_metrics = metrics == 'Yes' or metrics == 'Y' or metrics == 'y' or metrics == 'yes'
+    save_quotient = quotient == 'Yes' or quotient == 'Y' or quotient == 'y' or quotient == 'yes'
+    if per_component or fold or kcore or use_interning or report_metrics or save_quotient or subgraphs or refine:
+        # Detect communities on edge arrays with the optional stages
+        if use_interning:
+            edges, node_ids = graph_composer.compose_interned_edge_arrays(input_file, delimiter, weighted,
+                                                                          duplicates=duplicates)
+        else:
+            edges = graph_composer.compose_edge_arrays(input_file, delimiter, weighted, duplicates=duplicates)
+        if kcore:
+            core_file = file_operations.generate_output_filename(input_file, prefix='fast_greedy',
+                                                                 output_dir=output_dir)
+            core_file = core_file.rsplit('.', 1)[0] + '.core'
+        else:
+            core_file = None
+        # Fast greedy ignores the input weights
+        unweighted_edges = edges[:-1] + (None,)
+        nodes, membership = graph_composer.detect_communities(unweighted_edges, fast_greedy_communities_from_arrays,
+                                                              per_component, min_component_size, workers, fold,
+                                                              kcore, core_file, node_ids)
+    else:
+        # Create networkx graph
+        ntx_graph = graph_composer.compose_ntx_graph(input_file, delimiter, weighted, duplicates)
+        # Detect communities
+        fast_greedy_communities_list = fast_greedy_find_communities(ntx_graph)
+
+        # Create flat arrays (node -> community) of detected communities
+        nodes, membership = file_operations.communities_to_arrays(fast_greedy_communities_list)
+
+    # Detect communities again inside the oversized communities
+    if refine:
+        nodes, membership, levels = graph_composer.refine_communities(unweighted_edges, nodes, membership,
+                                                                      fast_greedy_communities_from_arrays, refine,
+                                                                      workers, refine_depth)
+
+    # Reuse the community ids of a previous run
+    if previous:
+        membership = partition_comparison.relabel_to_previous(nodes, membership, previous, node_ids)
+
+    # Partition quality metrics
+    if report_metrics:
+        quality = partition_metrics.partition_metrics(edges, nodes, membership)
+        partition_metrics.print_metrics(quality)
+
+    # Create output files (.grp and .pkl)
+    create_output = output is None or output == 'Yes' or output == 'Y' or output == 'y' or output == 'yes'
+    if create_output or save_quotient or subgraphs or refine:
+        output_file = file_operations.generate_output_filename(input_file, prefix='fast_greedy',
+                                                               output_dir=output_dir)
+    if create_output:
+        file_operations.create_community_file(output_file=output_file, nodes=nodes, membership=membership,
+                                              node_ids=node_ids)
+        if report_metrics:
+            partition_metrics.write_metrics(quality, output_file)
+    else:
+        pass
+
+    # Requested outputs are written even without the community files
+    if save_quotient:
+        graph_composer.save_edge_arrays(output_file.rsplit('.', 1)[0] + '_quotient.npz',
+                                        *graph_composer.quotient_edges(edges, nodes, membership))
+    if subgraphs:
+        graph_composer.export_community_subgraphs(output_file, edges, nodes, membership, subgraphs, workers,
+                                                  node_ids)
+    if refine:
+        graph_composer.save_community_levels(output_file, nodes, levels, node_ids)
+
+    print('Total communities found with fast greedy (CNM) algorithm: ', color='green', log_type='info', end='')
+    print('{}'.format(len(np.unique(membership))), color='cyan', text_format='bold')
+
+
 # Command Center
-def command_center(input_file=None, delimiter=None, weighted=None):
+def command_center(input_file=None, delimiter=None, weighted=None, output=None, components=None,
+                   min_component_size=10, workers=1, fold=None, kcore=None, duplicates=None, intern_ids=None,
+                   output_dir=None, metrics=None, previous=None, quotient=None, subgraphs=None,
+                   refine=None, refine_depth=3):
     """
     This function controls the other functions
     :param input_file: Input file with edges of the graph
     :param delimiter: Field separator
     :param weighted: are the edges weighted?
+    :param output: whether output file will be created or not (boolean - yes/no)
+    :param components: whether communities are detected per connected component (boolean - yes/no)
+    :param min_component_size: Smaller components become one community without running the algorithm
+    :param workers: Number of worker processes for per component detection
+    :param fold: None, 'pendants' or 'chains' (pendants and degree-2 chains) to fold before detection
+    :param kcore: If provided, detect communities on the k-core only, attach the peeled nodes and save core numbers
+    :param duplicates: If provided, drop self loops and merge duplicate edges keeping the sum/max/first weight
+    :param intern_ids: Boolean, yes/no if node identifiers are arbitrary (e.g. strings) and mapped to dense integers
+    :param output_dir: Output directory, required when the input is the standard input (-)
+    :param metrics: Boolean, yes/no if partition quality metrics are reported (and saved as .metrics/.cmetrics)
+    :param previous: Community (.npz/.pkl) file of a previous run, matching communities keep its ids
+    :param quotient: Boolean, yes/no if the community level graph is saved as a binary edge file (.npz)
+    :param subgraphs: None, 'indexed' (one indexed .npz file) or 'files' (one .npz file per community) to
+                      export the induced subgraph of every community
+    :param refine: If provided, communities with more nodes are detected again on their induced subgraph
+    :param refine_depth: Maximum number of refinement levels
     :return: <>
     """
     print('Initializing.....', log_type='info')
-    # Create SNAP graph
-    ntx_graph = graph_composer.compose_ntx_graph(input_file, delimiter, weighted)
-    # Detect communities
-    fast_greedy_communities_list = fast_greedy_find_communities(ntx_graph)
-
-    # Create a dictionary of detected communities
-    fast_greedy_communities = {}
-    community_id = 1
-    for community in fast_greedy_communities_list:
-        for node in community:
-            fast_greedy_communities[node] = community_id
-        community_id += 1
-
-    print('Total communities found with fast greedy (CNM) algorithm: ', color='green', log_type='info', end='')
-    print('{}'.format(len(fast_greedy_communities_list)), color='cyan', text_format='bold')
+    run_fast_greedy(input_file, delimiter, weighted, output, components, min_component_size, workers, fold, kcore,
+                    duplicates, intern_ids, output_dir, metrics, previous, quotient, subgraphs,
+                    refine, refine_depth)
 
 
 if __name__ == '__main__':
@@ -91,15 +223,59 @@ if __name__ == '__main__':
                                      add_help=True)
 
     parser.add_argument('-i', '--input-file', action='store', dest='input', required=True,
-                        help='Input file absolute path. E.g. /home/user/data/input/file_name.txt/.csv/.dat etc.')
+                        help='Input file absolute path. E.g. /home/user/data/input/file_name.txt/.csv/.dat etc. '
+                             'Use - to read from standard input (needs --output-dir). A directory or a quoted glob '
+                             'pattern (e.g. "/data/parts/part-*") reads all shards')
     parser.add_argument('-d', '--delimiter', action='store', dest='delimiter', required=False,
                         help='Separator for the input and output file. E.g. (,)/(";" need to be quoted)/tab/space.'
                              'Default is comma (,)')
     parser.add_argument('-w', '--weighted', action='store', dest='weighted', required=False,
                         help='Boolean - yes/no if the file has weight column')
+    parser.add_argument('-o', '--output', action='store', dest='output', required=False,
+                        help='Boolean - yes/no (To create output file or not)')
+    parser.add_argument('--components', action='store', dest='components', required=False,
+                        help='Boolean - yes/no (Detect communities per connected component)')
+    parser.add_argument('--min-component-size', action='store', dest='min_component_size', required=False,
+                        type=int, help='Smaller components become one community without running the algorithm. '
+                                       'Default is 10')
+    parser.add_argument('--workers', action='store', dest='workers', required=False, type=int,
+                        help='Number of worker processes for per component detection. Default is 1')
+    parser.add_argument('--fold', action='store', dest='fold', required=False, choices=['pendants', 'chains'],
+                        help='Fold pendant nodes (pendants) or pendant nodes and degree-2 chains (chains) into their '
+                             'neighbors before detection and re-expand the communities afterwards')
+    parser.add_argument('--kcore', action='store', dest='kcore', required=False, type=int,
+                        help='Detect communities on the k-core only, attach the other nodes to the community of '
+                             'their majority neighbor and save core numbers (.core)')
+    parser.add_argument('--duplicates', action='store', dest='duplicates', required=False,
+                        choices=['sum', 'max', 'first'],
+                        help='Drop self loops and merge duplicate edges, keeping the sum, max or first weight')
+    parser.add_argument('--intern-ids', action='store', dest='intern_ids', required=False,
+                        help='Boolean - yes/no (Node ids are arbitrary, e.g. strings, map them to dense integers)')
+    parser.add_argument('--output-dir', action='store', dest='output_dir', required=False,
+                        help='Output directory. Default is the directory of the input file')
+    parser.add_argument('--metrics', action='store', dest='metrics', required=False,
+                        help='Boolean - yes/no (Report modularity, coverage, performance and conductance)')
+    parser.add_argument('--previous', action='store', dest='previous', required=False,
+                        help='Community (.npz/.pkl) file of a previous run. Communities take the id of the previous '
+                             'community they overlap most, so ids stay stable across runs')
+    parser.add_argument('--quotient', action='store', dest='quotient', required=False,
+                        help='Boolean - yes/no (Save the community level graph with summed weights as a binary '
+                             'edge file, <output>_quotient.npz)')
+    parser.add_argument('--subgraphs', action='store', dest='subgraphs', required=False, choices=['indexed', 'files'],
+                        help='Export the induced subgraph of every community, as one indexed binary file '
+                             '(<output>_subgraphs.npz) or as one binary edge file per community '
+                             '(<output>_subgraphs/community_<id>.npz, written by --workers processes)')
+    parser.add_argument('--refine', action='store', dest='refine', required=False, type=int,
+                        help='Detect communities again on the induced subgraph of every community with more '
+                             'nodes than this, level by level in --workers processes. Community levels are saved '
+                             '(.paths.npy)')
+    parser.add_argument('--refine-depth', action='store', dest='refine_depth', required=False, type=int,
+                        help='Maximum number of refinement levels. Default is 3')
 
     # Parse arguments
     args = parser.parse_args()
+    if args.input == file_operations.STDIN and not args.output_dir:
+        parser.error('the argument --output-dir is required when reading from standard input (-i -)')
 
     # Double checking the arguments
     if args.delimiter:
@@ -112,6 +288,33 @@ if __name__ == '__main__':
     else:
         print('No weighted parameter provided! Using default (No).....', log_type='info')
         _weighted = 'No'
+    if args.output:
+        _output = args.output
+    else:
+        print('No output parameter provided! Using default (Yes).....', log_type='info')
+        _output = 'Yes'
+    if args.components:
+        _components = args.components
+    else:
+        _components = 'No'
+    if args.min_component_size:
+        _min_component_size = args.min_component_size
+    else:
+        _min_component_size = 10
+    if args.workers:
+        _workers = args.workers
+    else:
+        _workers = 1
+    if args.refine_depth:
+        _refine_depth = args.refine_depth
+    else:
+        _refine_depth = 3
 
     # Command Center
-    command_center(input_file=args.input, delimiter=_delimiter, weighted=_weighted)
+    command_center(input_file=args.input, delimiter=_delimiter, weighted=_weighted, output=_output,
+                   components=_components, min_component_size=_min_component_size, workers=_workers,
+                   fold=args.fold, kcore=args.kcore,
+                   duplicates=args.duplicates, intern_ids=args.intern_ids,
+                   output_dir=args.output_dir, metrics=args.metrics, previous=args.previous,
+                   quotient=args.quotient, subgraphs=args.subgraphs, refine=args.refine,
+                   refine_depth=_refine_depth)
@@ -7,8 +7,18 @@ from __future__ import print_function
 import os
 import sys
 import textwrap
+import tempfile
 import argparse
+import multiprocessing
+from collections import deque
+from functools import partial
+try:
+    from itertools import imap as lazy_map
+except ImportError:
+    lazy_map = map
 # Import custom python library
+import numpy as np
+import pandas as pd
 import networkx as nx
 try:
     from pyrainbowterm import *
@@ -26,10 +36,30 @@ import graph_composer
 # Import file_operations
 import file_operations
 
+# Import partition metrics
+import partition_metrics
+
+# Import partition comparison
+import partition_comparison
+
+# Import native_converter
+import native_converter
+
 # Source code meta data
 __author__ = 'Dalwar Hossain'
 __email__ = 'dalwar.hossain@protonmail.com'
 
+# Edge arrays (or link list file) of the current graph in a trial worker, set once per worker by share_edges()
+_shared_edges = None
+
+# Input types: {type: (infomap input format, node columns per link, native MemInfomap function)}
+INPUT_TYPES = {
+    'links': ('link-list', 2, 'Infomap_addLink'),
+    'trigram': ('3gram', 3, 'MemInfomap_addTrigram'),
+    'states': ('states', 4, 'MemInfomap_addStateLink'),
+    'multiplex': ('multiplex', 4, 'MemInfomap_addMultiplexLink'),
+}
+
 
 # Run Infomap algorithm
 # @profile  # Uncomment to profile this function for memory usage with 'mprof'
@@ -44,45 +74,286 @@ def run_algorithm(infomap_wrapper):
     return tree
 
 
+# Add links to an Infomap network in bulk
+def infomap_add_links(infomap_wrapper, edges, input_type='links', chunk_size=1000000):
+    """
+    This function pushes link arrays into an Infomap/MemInfomap wrapper without a python level loop per link
+    :param infomap_wrapper: infomap.Infomap object (infomap.MemInfomap for memory input types)
+    :param edges: Link arrays, one array per node column followed by weights (None for unweighted graphs)
+    :param input_type: links/trigram/states/multiplex (see INPUT_TYPES)
+    :param chunk_size: Number of links converted to native python numbers at once
+    :return: <>
+    """
+    # Call the native function directly, skipping the proxy method
+    add_link = partial(getattr(infomap._infomap, INPUT_TYPES[input_type][2]), infomap_wrapper)
+    node_columns = edges[:-1]
+    weights = edges[-1]
+    for start in range(0, len(node_columns[0]), chunk_size):
+        end = start + chunk_size
+        chunk_columns = [column[start:end].tolist() for column in node_columns]
+        if weights is None:
+            chunk_weights = [1.0] * len(chunk_columns[0])
+        else:
+            chunk_weights = weights[start:end].tolist()
+        # Drain the lazy map without keeping the results
+        deque(lazy_map(add_link, *(chunk_columns + [chunk_weights])), maxlen=0)
+
+
+# Write link arrays as a link list file
+def write_link_file(edges=None, output_dir=None):
+    """
+    This function writes link arrays once as a temporary link list file (<source> <target> <weight>) that Infomap
+    parses natively (readInputData) instead of one addLink call per link
+    :param edges: Edge arrays (sources, targets, weights)
+    :param output_dir: Directory of the temporary file (default: the system temporary directory)
+    :return: link list file path (removed by the caller)
+    """
+    sources, targets, weights = edges
+    handle, link_file = tempfile.mkstemp(suffix='.txt', dir=output_dir)
+    os.close(handle)
+    try:
+        print('Creating Infomap link list file.....', log_type='info')
+        pd.DataFrame({0: sources, 1: targets, 2: np.ones(len(sources)) if weights is None else weights},
+                     columns=[0, 1, 2]).to_csv(link_file, sep=' ', header=False, index=False)
+    except Exception as e:
+        os.remove(link_file)
+        print('Can not create Infomap link list file! ERROR: {}'.format(e), log_type='error')
+        sys.exit(1)
+
+    # Return
+    return link_file
+
+
+# Create an Infomap wrapper with the network
+def build_infomap(options, edges, input_type='links'):
+    """
+    This function creates the Infomap wrapper matching the input type and fills it with the links. Link networks are
+    read natively from a link list file (see write_link_file()), memory networks are added link by link
+    :param options: Infomap options
+    :param edges: Link arrays, one array per node column followed by weights, or a link list file path (links only)
+    :param input_type: links/trigram/states/multiplex (see INPUT_TYPES)
+    :return: infomap.Infomap or infomap.MemInfomap object
+    """
+    if input_type == 'links':
+        infomap_wrapper = infomap.Infomap(options + ' --input-format ' + INPUT_TYPES[input_type][0])
+        if isinstance(edges, tuple):
+            link_file = write_link_file(edges)
+            try:
+                print('Building Infomap network ({}) from a link list file.....'.format(input_type), log_type='info')
+                infomap_wrapper.readInputData(link_file)
+            finally:
+                os.remove(link_file)
+        else:
+            print('Building Infomap network ({}) from a link list file.....'.format(input_type), log_type='info')
+            infomap_wrapper.readInputData(edges)
+    else:
+        # Memory networks keep their higher order links instead of a pre-expanded first order graph
+        infomap_wrapper = infomap.MemInfomap(options + ' --input-format ' + INPUT_TYPES[input_type][0])
+        print('Building Infomap network ({}) from link arrays.....'.format(input_type), log_type='info')
+        infomap_add_links(infomap_wrapper, edges, input_type)
+
+    # Return
+    return infomap_wrapper
+
+
+# Save an Infomap tree
+def save_infomap_tree(tree, tree_file):
+    """
+    This function saves the full hierarchical Infomap tree in Infomap's binary (streamable) format
+    :param tree: Infomap HierarchicalNetwork
+    :param tree_file: Output file path (.bftree)
+    :return: Boolean, True if the tree file was written
+    """
+    try:
+        tree.writeStreamableTree(tree_file, False)
+    except Exception as e:
+        print('Can not save Infomap tree! ERROR: {}'.format(e), log_type='error')
+        return False
+
+    # Return
+    return os.path.isfile(tree_file)
+
+
+# Load an Infomap tree
+def load_infomap_tree(tree_file):
+    """
+    This function loads a tree saved with save_infomap_tree()
+    :param tree_file: Binary tree file path (.bftree)
+    :return: Infomap HierarchicalNetwork
+    """
+    print('Loading Infomap tree: {}'.format(tree_file), log_type='info')
+    try:
+        # Flags are parsed by infomap.init(), which returns the Config
+        tree = infomap.HierarchicalNetwork(infomap.init('-z'))
+        tree.readStreamableTree(tree_file)
+    except Exception as e:
+        print('Can not load Infomap tree! ERROR: {}'.format(e), log_type='error')
+        sys.exit(1)
+    print('Loaded {} leaf nodes in {} module levels with code length: {}'.format(tree.numLeafNodes(),
+                                                                               tree.maxDepth() - 1,
+                                                                               tree.codelength()), log_type='info')
+
+    # Return
+    return tree
+
+
+# Save the requested per-tree outputs
+def save_tree_outputs(tree, tree_file=None, paths_file=None, suffix=''):
+    """
+    This function writes the outputs that need the Infomap tree itself (binary tree and/or module paths)
+    :param tree: Infomap HierarchicalNetwork
+    :param tree_file: Binary tree file path (.bftree) or None
+    :param paths_file: Module path file path (.npy) or None
+    :param suffix: Suffix added to the file names (used by trial workers)
+    :return: python dictionary of {requested file: written file}, files that could not be written are left out
+    """
+    written_files = {}
+    if tree_file and save_infomap_tree(tree, tree_file + suffix):
+        written_files[tree_file] = tree_file + suffix
+    if paths_file:
+        try:
+            native_converter.write_infomap_paths(tree, paths_file + suffix)
+            written_files[paths_file] = paths_file + suffix
+        except Exception as e:
+            print('Can not save module paths! ERROR: {}'.format(e), log_type='error')
+            if os.path.isfile(paths_file + suffix):
+                os.remove(paths_file + suffix)
+
+    # Return
+    return written_files
+
+
+# Share the edge arrays with a trial worker
+def share_edges(edges=None):
+    """
+    This function stores the edge arrays of the current graph in a trial worker (pool initializer). Forked workers
+    receive them without a copy, spawned workers receive one pickled copy each instead of one per trial. Link
+    networks share the path of their link list file instead (see write_link_file())
+    :param edges: Edge arrays of the graph or link list file path
+    :return: NULL
+    """
+    global _shared_edges
+    _shared_edges = edges
+
+
+# Run one seeded Infomap trial
+def infomap_trial(trial_arguments):
+    """
+    This function runs a single Infomap trial on the shared edge arrays (used by the worker processes)
+    :param trial_arguments: A tuple of (infomap options, seed of the random number generator, tree file or None,
+                            module path file or None, input type)
+    :return: code length, number of top modules, numpy arrays of nodes and their communities, files of the trial
+    """
+    options, seed, tree_file, paths_file, input_type = trial_arguments
+
+    # Every worker gets its own Config seed, trials are independent
+    infomap_wrapper = build_infomap(options + ' -N 1 --seed ' + str(seed), _shared_edges, input_type)
+
+    tree = run_algorithm(infomap_wrapper)
+    nodes, membership = native_converter.infomap_membership(tree, 1, zero_based=True)
+
+    # Trees can not travel between processes, every trial saves its own outputs
+    trial_files = save_tree_outputs(tree, tree_file, paths_file, suffix='.{}'.format(seed))
+
+    # Return
+    return tree.codelength(), tree.numTopModules(), nodes, membership, trial_files
+
+
 # Find communities
 # @profile  # Uncomment to profile this function for memory usage with 'mprof'
-def infomap_find_communities(input_file, n_trials):
+def infomap_find_communities(edges, n_trials, workers=1, seed=123, tree_file=None, hierarchical=False,
+                             paths_file=None, input_type='links'):
     """
     Partition network with the Infomap algorithm.
     Annotates nodes with 'community' id and return number of communities found.
-    :param input_file: Input file with data
+    Memory networks (trigram/states/multiplex) can place a node in several modules.
+    :param edges: Edge arrays (sources, targets, weights) of the graph, more node columns for memory networks
     :param n_trials: Number of trials options for infomap
-    :rtype: Total number of communities, python dictionary of detected communities
+    :param workers: Number of worker processes, each running independent trials
+    :param seed: Seed of the first trial, trial k uses seed + k
+    :param tree_file: If provided, the full Infomap tree of the best trial is saved to this file
+    :param hierarchical: Boolean, find multi-level modules instead of a two-level partition
+    :param paths_file: If provided, the module path of every node of the best trial is saved to this file
+    :param input_type: links/trigram/states/multiplex (see INPUT_TYPES)
+    :rtype: Total number of communities, numpy arrays of nodes and their communities
     """
-    options = '--two-level -z' + ' -N ' + n_trials
+    if hierarchical:
+        options = '-z'
+    else:
+        options = '--two-level -z'
     print('Number of trials: {}'.format(n_trials), log_type='info')
 
+    if workers > 1 and int(n_trials) > 1:
+        # Run the trials as independent processes and keep the one with the lowest code length
+        print('Running trials in {} worker processes.....'.format(workers), log_type='info')
+        # Link networks are written once, every trial reads the same link list file
+        link_file = write_link_file(edges) if input_type == 'links' else None
+        pool = multiprocessing.Pool(processes=workers, initializer=share_edges,
+                                    initargs=(link_file if link_file else edges,))
+        seeds = [seed + trial for trial in range(int(n_trials))]
+        try:
+            trial_arguments = [(options, trial_seed, tree_file, paths_file, input_type) for trial_seed in seeds]
+            best = None
+            for result in pool.imap_unordered(infomap_trial, trial_arguments):
+                if best is None or result[0] < best[0]:
+                    best, result = result, best
+                # Drop the outputs of the worse trial right away
+                if result is not None:
+                    for trial_file in result[4].values():
+                        os.remove(trial_file)
+            codelength, total_communities, nodes, membership, best_files = best
+            print('Best trial code length: {}'.format(codelength), log_type='info')
+            for output_file, trial_file in best_files.items():
+                print('Saving: {}'.format(output_file), log_type='info')
+                os.rename(trial_file, output_file)
+        finally:
+            pool.terminate()
+            pool.join()
+            # Trial outputs left behind by a failed or interrupted run, and the shared link list file
+            trial_files = ['{}.{}'.format(output_file, trial_seed) for output_file in [tree_file, paths_file]
+                           if output_file for trial_seed in seeds]
+            for trial_file in trial_files + ([link_file] if link_file else []):
+                if os.path.isfile(trial_file):
+                    os.remove(trial_file)
+
+        # Return
+        return total_communities, nodes, membership
+
     # Create Infomap wrapper
-    infomap_wrapper = infomap.Infomap(options)
+    infomap_wrapper = build_infomap(options + ' -N ' + n_trials + ' --seed ' + str(seed), edges, input_type)
 
-    # print("Building Infomap network from a NetworkX graph.....", log_type='info')
-    # for e in graph.edges():
-    #     infomap_wrapper.addLink(*e)
+    tree = run_algorithm(infomap_wrapper)
 
-    print('Building Infomap network from the input file.....', log_type='info')
+    # Find communities (top level modules) in bulk
+    nodes, membership = native_converter.infomap_membership(tree, 1, zero_based=True)
 
-    infomap_wrapper.readInputData(input_file)
+    for output_file in save_tree_outputs(tree, tree_file, paths_file):
+        print('Saving: {}'.format(output_file), log_type='info')
 
-    tree = run_algorithm(infomap_wrapper)
+    # return number of modules found
+    return tree.numTopModules(), nodes, membership
 
-    # Find communities
-    communities = {}
-    for node in tree.leafIter():
-        communities[node.originalLeafIndex] = node.moduleIndex()
 
-    # nx.set_node_attributes(graph, name='community', values=communities)
+# Find communities from edge arrays
+def infomap_communities_from_arrays(edges, n_trials='1'):
+    """
+    This function finds two-level Infomap communities of a graph given as edge arrays (used for per component
+    detection)
+    :param edges: Edge arrays (sources, targets, weights)
+    :param n_trials: Number of trials options for infomap
+    :return: numpy arrays of nodes and their communities
+    """
+    _, nodes, membership = infomap_find_communities(edges, n_trials)
 
-    # return number of modules found
-    return tree.numTopModules(), communities
+    # Return
+    return nodes, membership
 
 
 # Create a function to run infomap
-def run_infomap(input_file=None, delimiter=None, weighted=None, trials=None, output=None):
+def run_infomap(input_file=None, delimiter=None, weighted=None, trials=None, output=None, cache=None, workers=1,
+                save_tree=None, hierarchical=None, input_type='links', components=None, min_component_size=10,
+                fold=None, kcore=None, duplicates=None, intern_ids=None, output_dir=None, metrics=None,
+                previous=None, quotient=None, subgraphs=None, refine=None, refine_depth=3):
     """
     This function runs the infomap algorithm
     :param input_file: Input file with edges of the graph
@@ -90,35 +361,196 @@ def run_infomap(input_file=None, delimiter=None, weighted=None, trials=None, out
     :param weighted: are the edges weighted?
     :param trials: number of trials/run to find out community
     :param output: whether output file will be created or not (boolean - yes/no)
+    :param cache: whether a binary edge file is kept/reused next to the input file (boolean - yes/no)
+    :param workers: number of worker processes running the trials in parallel
+    :param save_tree: whether the full Infomap tree (.bftree) will be saved or not (boolean - yes/no)
+    :param hierarchical: whether multi-level modules and their paths (.paths.npy) are created (boolean - yes/no)
+    :param input_type: links/trigram/states/multiplex, the columns of the input file
+    :param components: whether communities are detected per connected component (boolean - yes/no)
+    :param min_component_size: Smaller components become one community without running Infomap
+    :param fold: None, 'pendants' or 'chains' (pendants and degree-2 chains) to fold before detection
+    :param kcore: If provided, detect communities on the k-core only, attach the peeled nodes and save core numbers
+    :param duplicates: If provided, drop self loops and merge duplicate edges keeping the sum/max/first weight
+    :param intern_ids: Boolean, yes/no if node identifiers are arbitrary (e.g. strings) and mapped to dense integers
+    :param output_dir: Output directory, required when the input is the standard input (-)
+    :param metrics: Boolean, yes/no if partition quality metrics are reported (and saved as .metrics/.cmetrics)
+    :param previous: Community (.npz/.pkl) file of a previous run, matching communities keep its ids
+    :param quotient: Boolean, yes/no if the community level graph is saved as a binary edge file (.npz)
+    :param subgraphs: None, 'indexed' (one indexed .npz file) or 'files' (one .npz file per community) to
+                      export the induced subgraph of every community
+    :param refine: If provided, communities with more nodes are detected again on their induced subgraph
+    :param refine_depth: Maximum number of refinement levels
     :return: <> file object <>
     """
-    # Create a graph from dataset
-    # ntx_graph = graph_composer.compose_ntx_graph(input_file, delimiter, weighted)
+    # Create edge arrays from dataset (sanity check included)
+    use_cache = cache == 'Yes' or cache == 'Y' or cache == 'y' or cache == 'yes'
+    use_interning = intern_ids == 'Yes' or intern_ids == 'Y' or intern_ids == 'y' or intern_ids == 'yes'
+    if use_interning:
+        # Every column of links and trigrams is a physical node, states and layers are not interned
+        if input_type not in ('links', 'trigram'):
+            print('Node identifiers can be interned for links and trigrams only!', log_type='error')
+            sys.exit(1)
+        edges, node_ids = graph_composer.compose_interned_edge_arrays(input_file, delimiter, weighted,
+                                                                      INPUT_TYPES[input_type][1], duplicates)
+    else:
+        edges = graph_composer.compose_edge_arrays(input_file, delimiter, weighted, cache=use_cache,
+                                                   node_columns=INPUT_TYPES[input_type][1], duplicates=duplicates)
+        node_ids = None
+
+    # Binary tree file next to the other output files
+    output_file = file_operations.generate_output_filename(input_file, prefix='infomap', output_dir=output_dir)
+    if save_tree == 'Yes' or save_tree == 'Y' or save_tree == 'y' or save_tree == 'yes':
+        tree_file = output_file.rsplit('.', 1)[0] + '.bftree'
+    else:
+        tree_file = None
+    is_hierarchical = hierarchical == 'Yes' or hierarchical == 'Y' or hierarchical == 'y' or hierarchical == 'yes'
+    if is_hierarchical:
+        paths_file = output_file.rsplit('.', 1)[0] + '.paths.npy'
+    else:
+        paths_file = None
+
+    # Trees and module paths hold dense nodes, keep the identifier table next to them
+    if node_ids is not None and (tree_file or paths_file):
+        ids_file = output_file.rsplit('.', 1)[0] + '.ids'
+        print('Creating node identifier (.ids) file.....', log_type='info')
+        pd.Series(node_ids).to_csv(ids_file, header=False, index=False)
+
+    # Metrics are defined for link networks
+    report_metrics = metrics == 'Yes' or metrics == 'Y' or metrics == 'y' or metrics == 'yes'
+    save_quotient = quotient == 'Yes' or quotient == 'Y' or quotient == 'y' or quotient == 'yes'
+    if (report_metrics or save_quotient or subgraphs or refine or previous) and input_type != 'links':
+        print('Partition metrics, quotient graphs, subgraphs, refinement and previous run ids support link networks '
+              'only!', log_type='error')
+        sys.exit(1)
+    if refine and paths_file:
+        print('Refinement saves its own community levels (.paths.npy), use it without hierarchical mode!',
+              log_type='error')
+        sys.exit(1)
 
-    # Sanity check and created infomap Network from the input file
-    # Check sanity status of input
-    sanity_status = file_operations.sanity_check(input_file, delimiter, weighted)
+    # Find Communities from the graph
+    per_component = components == 'Yes' or components == 'Y' or components == 'y' or components == 'yes'
+    if per_component or fold or kcore:
+        if input_type != 'links' or tree_file or paths_file:
+            print('Per component detection, folding and k-core mode support two-level link networks only!',
+                  log_type='error')
+            sys.exit(1)
+        core_file = output_file.rsplit('.', 1)[0] + '.core' if kcore else None
+        # Workers go to the components, trials of a component run sequentially
+        nodes, membership = graph_composer.detect_communities(edges, partial(infomap_communities_from_arrays,
+                                                                             n_trials=trials),
+                                                              per_component, min_component_size, workers, fold,
+                                                              kcore, core_file, node_ids)
+        total_communities = len(np.unique(membership))
+    else:
+        total_communities, nodes, membership = infomap_find_communities(edges, trials, workers, tree_file=tree_file,
+                                                                        hierarchical=is_hierarchical,
+                                                                        paths_file=paths_file,
+                                                                        input_type=input_type)
+
+    # Detect communities again inside the oversized communities
+    if refine:
+        nodes, membership, levels = graph_composer.refine_communities(edges, nodes, membership,
+                                                                      partial(infomap_communities_from_arrays,
+                                                                              n_trials=trials),
+                                                                      refine, workers, refine_depth)
+        total_communities = len(np.unique(membership))
+
+    # Reuse the community ids of a previous run
+    if previous:
+        membership = partition_comparison.relabel_to_previous(nodes, membership, previous, node_ids)
+
+    # Partition quality metrics
+    if report_metrics:
+        quality = partition_metrics.partition_metrics(edges, nodes, membership)
+        partition_metrics.print_metrics(quality)
+
+    # Create output file
+    if output is None or output == 'Yes' or output == 'Y' or output == 'y' or output == 'yes':
+        file_operations.create_community_file(output_file=output_file, nodes=nodes, membership=membership,
+                                              node_ids=node_ids)
+        if report_metrics:
+            partition_metrics.write_metrics(quality, output_file)
+    else:
+        pass
 
-    if sanity_status == 1:
-        # Find Communities from the graph
-        total_communities, infomap_communities = infomap_find_communities(input_file, trials)
+    # Requested outputs are written even without the community files
+    if save_quotient:
+        graph_composer.save_edge_arrays(output_file.rsplit('.', 1)[0] + '_quotient.npz',
+                                        *graph_composer.quotient_edges(edges, nodes, membership))
+    if subgraphs:
+        graph_composer.export_community_subgraphs(output_file, edges, nodes, membership, subgraphs, workers,
+                                                  node_ids)
+    if refine:
+        graph_composer.save_community_levels(output_file, nodes, levels, node_ids)
+
+    print('Total communities found with INFOMAP algorithm: ', color='green', log_type='info', end='')
+    print('{}'.format(total_communities), color='cyan', text_format='bold')
 
-        # Create output file
-        if output is None or output == 'Yes' or output == 'Y' or output == 'y' or output == 'yes':
-            output_file = file_operations.generate_output_filename(input_file, prefix='infomap')
-            file_operations.create_community_file(infomap_communities, output_file)
-        else:
-            pass
 
-        print('Total communities found with INFOMAP algorithm: ', color='green', log_type='info', end='')
-        print('{}'.format(total_communities), color='cyan', text_format='bold')
+# Query a saved Infomap tree
+def query_infomap_tree(tree_file=None, depth=1, output=None, output_dir=None):
+    """
+    This function reloads a saved Infomap tree (or module path file) and extracts the modules at any depth without
+    rerunning Infomap
+    :param tree_file: Binary tree file (.bftree) saved with --save-tree, or module path file (.paths.npy) saved with
+                      --hierarchical or --refine
+    :param depth: Module depth in the tree (1 is the top level)
+    :param output: whether output file will be created or not (boolean - yes/no)
+    :param output_dir: Output directory instead of the directory of the tree file
+    :return: <> file object <>
+    """
+    if tree_file.endswith('.paths.npy'):
+        # Module paths are memory mapped, rows of <node> <module at level 1> <module at level 2> ...
+        tree_file = tree_file[:-len('.npy')]
+        base_name = tree_file[:-len('.paths')]
+        try:
+            paths = np.load(tree_file + '.npy', mmap_mode='r')
+        except Exception as e:
+            print('Can not load module path file! ERROR: {}'.format(e), log_type='error')
+            sys.exit(1)
+        if depth < 1 or depth >= paths.shape[1]:
+            print('Module path file has {} levels! Can not query depth {}'.format(paths.shape[1] - 1, depth),
+                  log_type='error')
+            sys.exit(1)
+        nodes, membership = native_converter.path_membership(paths, depth)
     else:
-        print('Sanity check failed!', log_type='error', color='red')
-        sys.exit(1)
+        base_name = tree_file.rsplit('.', 1)[0]
+        tree = load_infomap_tree(tree_file)
+        # Leaves sit one level below the deepest modules
+        if depth < 1 or depth >= tree.maxDepth():
+            print('Tree has {} module levels! Can not query depth {}'.format(tree.maxDepth() - 1, depth),
+                  log_type='error')
+            sys.exit(1)
+
+        # Find communities at the requested depth in bulk
+        nodes, membership = native_converter.infomap_membership(tree, depth, zero_based=True)
+
+    # Trees of interned networks have their identifier table next to them
+    ids_file = base_name + '.ids'
+    if os.path.isfile(ids_file):
+        node_ids = pd.read_csv(ids_file, header=None, dtype=str)[0].values
+    else:
+        node_ids = None
+
+    # Create output file
+    if output is None or output == 'Yes' or output == 'Y' or output == 'y' or output == 'yes':
+        output_file = file_operations.generate_output_filename(tree_file, prefix='depth{}'.format(depth),
+                                                               output_dir=output_dir)
+        file_operations.create_community_file(output_file=output_file, nodes=nodes, membership=membership,
+                                              node_ids=node_ids)
+    else:
+        pass
+
+    print('Total communities found at depth {}: '.format(depth), color='green', log_type='info', end='')
+    print('{}'.format(len(np.unique(membership))), color='cyan', text_format='bold')
 
 
 # Command Center
-def command_center(input_file=None, delimiter=None, weighted=None, trials=None, output=None):
+def command_center(input_file=None, delimiter=None, weighted=None, trials=None, output=None, cache=None, workers=1,
+                   save_tree=None, load_tree=None, depth=1, hierarchical=None, input_type='links', components=None,
+                   min_component_size=10, fold=None, kcore=None, duplicates=None, intern_ids=None,
+                   output_dir=None, metrics=None, previous=None, quotient=None, subgraphs=None,
+                   refine=None, refine_depth=3):
     """
     This function controls the other functions
     :param input_file: Input file with edges of the graph
@@ -126,10 +558,36 @@ def command_center(input_file=None, delimiter=None, weighted=None, trials=None,
     :param weighted: are the edges weighted?
     :param trials: number of trials/run to find out community
     :param output: whether output file will be created or not (boolean - yes/no)
+    :param cache: whether a binary edge file is kept/reused next to the input file (boolean - yes/no)
+    :param workers: number of worker processes running the trials in parallel
+    :param save_tree: whether the full Infomap tree (.bftree) will be saved or not (boolean - yes/no)
+    :param load_tree: saved Infomap tree (.bftree) or module path file (.paths.npy) to query instead of running Infomap
+    :param depth: module depth to extract from a loaded tree
+    :param hierarchical: whether multi-level modules and their paths (.paths.npy) are created (boolean - yes/no)
+    :param input_type: links/trigram/states/multiplex, the columns of the input file
+    :param components: whether communities are detected per connected component (boolean - yes/no)
+    :param min_component_size: Smaller components become one community without running Infomap
+    :param fold: None, 'pendants' or 'chains' (pendants and degree-2 chains) to fold before detection
+    :param kcore: If provided, detect communities on the k-core only, attach the peeled nodes and save core numbers
+    :param duplicates: If provided, drop self loops and merge duplicate edges keeping the sum/max/first weight
+    :param intern_ids: Boolean, yes/no if node identifiers are arbitrary (e.g. strings) and mapped to dense integers
+    :param output_dir: Output directory, required when the input is the standard input (-)
+    :param metrics: Boolean, yes/no if partition quality metrics are reported (and saved as .metrics/.cmetrics)
+    :param previous: Community (.npz/.pkl) file of a previous run, matching communities keep its ids
+    :param quotient: Boolean, yes/no if the community level graph is saved as a binary edge file (.npz)
+    :param subgraphs: None, 'indexed' (one indexed .npz file) or 'files' (one .npz file per community) to
+                      export the induced subgraph of every community
+    :param refine: If provided, communities with more nodes are detected again on their induced subgraph
+    :param refine_depth: Maximum number of refinement levels
     :return: NULL
     """
     print('Initializing.....', log_type='info')
-    run_infomap(input_file, delimiter, weighted, trials, output)
+    if load_tree:
+        query_infomap_tree(load_tree, depth, output, output_dir)
+    else:
+        run_infomap(input_file, delimiter, weighted, trials, output, cache, workers, save_tree, hierarchical,
+                    input_type, components, min_component_size, fold, kcore, duplicates, intern_ids, output_dir,
+                    metrics, previous, quotient, subgraphs, refine, refine_depth)
 
 
 # Standard boilerplate for running this source code file as a standalone segment
@@ -153,8 +611,10 @@ if __name__ == '__main__':
                                      epilog='',
                                      add_help=True)
 
-    parser.add_argument('-i', '--input-file', action='store', dest='input', required=True,
-                        help='Input file absolute path. E.g. /home/user/data/input/file_name.txt/.csv/.dat etc.')
+    parser.add_argument('-i', '--input-file', action='store', dest='input', required=False,
+                        help='Input file absolute path. E.g. /home/user/data/input/file_name.txt/.csv/.dat etc. '
+                             'Use - to read from standard input (needs --output-dir). A directory or a quoted glob '
+                             'pattern (e.g. "/data/parts/part-*") reads all shards')
     parser.add_argument('-d', '--delimiter', action='store', dest='delimiter', required=False,
                         help='Separator for the input and output file. E.g. (,)/(";" need to be quoted)/tab/space.'
                              'Default is comma (,)')
@@ -164,9 +624,69 @@ if __name__ == '__main__':
                         help='Options for the Infomap algorithm (in a quoted string [no spaces])')
     parser.add_argument('-o', '--output', action='store', dest='output', required=False,
                         help='Boolean - yes/no (To create output file or not)')
+    parser.add_argument('-c', '--cache', action='store', dest='cache', required=False,
+                        help='Boolean - yes/no (Keep and reuse a binary (.npz) edge file next to the input file)')
+    parser.add_argument('--workers', action='store', dest='workers', required=False, type=int,
+                        help='Number of worker processes running independent trials. Default is 1 (sequential)')
+    parser.add_argument('--save-tree', action='store', dest='save_tree', required=False,
+                        help='Boolean - yes/no (Save the full Infomap tree in binary (.bftree) format)')
+    parser.add_argument('--load-tree', action='store', dest='load_tree', required=False,
+                        help='Saved Infomap tree (.bftree) or module path file (.paths.npy, see --hierarchical and '
+                             '--refine) absolute path. Queries it instead of running Infomap')
+    parser.add_argument('--depth', action='store', dest='depth', required=False, type=int,
+                        help='Module depth to extract from a loaded tree or module path file (1 is the top level). '
+                             'Default is 1')
+    parser.add_argument('--hierarchical', action='store', dest='hierarchical', required=False,
+                        help='Boolean - yes/no (Find multi-level modules and save the module path of every node)')
+    parser.add_argument('--input-type', action='store', dest='input_type', required=False,
+                        choices=sorted(INPUT_TYPES.keys()),
+                        help='Columns of the input file. links: <n1> <n2>, trigram: <n1> <n2> <n3>, '
+                             'states: <n1 prior> <n1> <n2 prior> <n2>, multiplex: <layer1> <n1> <layer2> <n2> '
+                             '(followed by weight if weighted). Default is links')
+    parser.add_argument('--components', action='store', dest='components', required=False,
+                        help='Boolean - yes/no (Detect communities per connected component, --workers then run '
+                             'components in parallel)')
+    parser.add_argument('--min-component-size', action='store', dest='min_component_size', required=False,
+                        type=int, help='Smaller components become one community without running Infomap. '
+                                       'Default is 10')
+    parser.add_argument('--fold', action='store', dest='fold', required=False, choices=['pendants', 'chains'],
+                        help='Fold pendant nodes (pendants) or pendant nodes and degree-2 chains (chains) into their '
+                             'neighbors before detection and re-expand the communities afterwards')
+    parser.add_argument('--kcore', action='store', dest='kcore', required=False, type=int,
+                        help='Detect communities on the k-core only, attach the other nodes to the community of '
+                             'their majority neighbor and save core numbers (.core)')
+    parser.add_argument('--duplicates', action='store', dest='duplicates', required=False,
+                        choices=['sum', 'max', 'first'],
+                        help='Drop self loops and merge duplicate edges, keeping the sum, max or first weight')
+    parser.add_argument('--intern-ids', action='store', dest='intern_ids', required=False,
+                        help='Boolean - yes/no (Node ids are arbitrary, e.g. strings, map them to dense integers)')
+    parser.add_argument('--output-dir', action='store', dest='output_dir', required=False,
+                        help='Output directory. Default is the directory of the input file')
+    parser.add_argument('--metrics', action='store', dest='metrics', required=False,
+                        help='Boolean - yes/no (Report modularity, coverage, performance and conductance)')
+    parser.add_argument('--previous', action='store', dest='previous', required=False,
+                        help='Community (.npz/.pkl) file of a previous run. Communities take the id of the previous '
+                             'community they overlap most, so ids stay stable across runs')
+    parser.add_argument('--quotient', action='store', dest='quotient', required=False,
+                        help='Boolean - yes/no (Save the community level graph with summed weights as a binary '
+                             'edge file, <output>_quotient.npz)')
+    parser.add_argument('--subgraphs', action='store', dest='subgraphs', required=False, choices=['indexed', 'files'],
+                        help='Export the induced subgraph of every community, as one indexed binary file '
+                             '(<output>_subgraphs.npz) or as one binary edge file per community '
+                             '(<output>_subgraphs/community_<id>.npz, written by --workers processes)')
+    parser.add_argument('--refine', action='store', dest='refine', required=False, type=int,
+                        help='Detect communities again on the induced subgraph of every community with more '
+                             'nodes than this, level by level in --workers processes. Community levels are saved '
+                             '(.paths.npy)')
+    parser.add_argument('--refine-depth', action='store', dest='refine_depth', required=False, type=int,
+                        help='Maximum number of refinement levels. Default is 3')
 
     # Parse arguments
     args = parser.parse_args()
+    if not args.input and not args.load_tree:
+        parser.error('one of the arguments -i/--input-file or --load-tree is required')
+    if args.input == file_operations.STDIN and not args.output_dir:
+        parser.error('the argument --output-dir is required when reading from standard input (-i -)')
 
     # Double checking the arguments
     if args.delimiter:
@@ -189,5 +709,49 @@ if __name__ == '__main__':
     else:
         print('No output parameter provided! Using default (Yes).....', log_type='info')
         _output = 'Yes'
+    if args.cache:
+        _cache = args.cache
+    else:
+        _cache = 'No'
+    if args.workers:
+        _workers = args.workers
+    else:
+        _workers = 1
+    if args.save_tree:
+        _save_tree = args.save_tree
+    else:
+        _save_tree = 'No'
+    if args.depth:
+        _depth = args.depth
+    else:
+        _depth = 1
+    if args.hierarchical:
+        _hierarchical = args.hierarchical
+    else:
+        _hierarchical = 'No'
+    if args.input_type:
+        _input_type = args.input_type
+    else:
+        _input_type = 'links'
+    if args.components:
+        _components = args.components
+    else:
+        _components = 'No'
+    if args.min_component_size:
+        _min_component_size = args.min_component_size
+    else:
+        _min_component_size = 10
+    if args.refine_depth:
+        _refine_depth = args.refine_depth
+    else:
+        _refine_depth = 3
+
     # Command Center
-    command_center(input_file=args.input, delimiter=_delimiter, weighted=_weighted, trials=n, output=_output)
+    command_center(input_file=args.input, delimiter=_delimiter, weighted=_weighted, trials=n, output=_output,
+                   cache=_cache, workers=_workers, save_tree=_save_tree, load_tree=args.load_tree, depth=_depth,
+                   hierarchical=_hierarchical, input_type=_input_type, components=_components,
+                   min_component_size=_min_component_size, fold=args.fold, kcore=args.kcore,
+                   duplicates=args.duplicates, intern_ids=args.intern_ids,
+                   output_dir=args.output_dir, metrics=args.metrics, previous=args.previous,
+                   quotient=args.quotient, subgraphs=args.subgraphs, refine=args.refine,
+                   refine_depth=_refine_depth)
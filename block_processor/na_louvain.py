@@ -10,6 +10,7 @@ import textwrap
 import argparse
 import time
 import datetime
+import numpy as np
 # Import custom libraries
 try:
     from pyrainbowterm import *
@@ -27,13 +28,19 @@ import graph_composer
 # Import file_operations
 import file_operations
 
+# Import partition metrics
+import partition_metrics
+
+# Import partition comparison
+import partition_comparison
+
 # Source code meta data
 __author__ = 'Dalwar Hossain'
 __email__ = 'dalwar.hossain@protonmail.com'
 
 
 # Find communities
-@profile  # Uncomment to profile this function for memory usage with 'mprof'
+# @profile  # Uncomment to profile this function for memory usage with 'mprof'
 def louvain_find_communities(ntx_graph):
     """
     This function finds communities in a graph using louvain community detection algorithm
@@ -56,8 +63,24 @@ def louvain_find_communities(ntx_graph):
     return louvain_communities
 
 
+# Find communities from edge arrays
+def louvain_communities_from_arrays(edges):
+    """
+    This function finds communities of a graph given as edge arrays (used for per component detection)
+    :param edges: Edge arrays (sources, targets, weights)
+    :return: numpy arrays of nodes and their communities
+    """
+    ntx_graph = graph_composer.compose_ntx_graph_from_arrays(edges)
+    louvain_communities = louvain_find_communities(ntx_graph)
+
+    # Return
+    return file_operations.dict_to_arrays(louvain_communities)
+
+
 # Create a function to run louvain method algorithm
-def run_louvain(input_file=None, delimiter=None, weighted=None, output=None):
+def run_louvain(input_file=None, delimiter=None, weighted=None, output=None, components=None, min_component_size=10,
+                workers=1, fold=None, kcore=None, duplicates=None, intern_ids=None, output_dir=None, metrics=None,
+                previous=None, quotient=None, subgraphs=None, refine=None, refine_depth=3):
     """
     This function finds community structures in graphs using louvain method
     :param input_file: Input file path
@@ -65,39 +88,126 @@ def run_louvain(input_file=None, delimiter=None, weighted=None, output=None):
     :param weighted: Is the file has a weight column? (yes/no)
     :param output: Boolean, yes/no if the output file will be created or not
     :param output: yes/no, output will be created at the same directory
+    :param components: Boolean, yes/no if communities are detected per connected component
+    :param min_component_size: Smaller components become one community without running louvain
+    :param workers: Number of worker processes for per component detection
+    :param fold: None, 'pendants' or 'chains' (pendants and degree-2 chains) to fold before detection
+    :param kcore: If provided, detect communities on the k-core only, attach the peeled nodes and save core numbers
+    :param duplicates: If provided, drop self loops and merge duplicate edges keeping the sum/max/first weight
+    :param intern_ids: Boolean, yes/no if node identifiers are arbitrary (e.g. strings) and mapped to dense integers
+    :param output_dir: Output directory, required when the input is the standard input (-)
+    :param metrics: Boolean, yes/no if partition quality metrics are reported (and saved as .metrics/.cmetrics)
+    :param previous: Community (.npz/.pkl) file of a previous run, matching communities keep its ids
+    :param quotient: Boolean, yes/no if the community level graph is saved as a binary edge file (.npz)
+    :param subgraphs: None, 'indexed' (one indexed .npz file) or 'files' (one .npz file per community) to
+                      export the induced subgraph of every community
+    :param refine: If provided, communities with more nodes are detected again on their induced subgraph
+    :param refine_depth: Maximum number of refinement levels
     :return: file object/stdIO
     """
-    # Create a graph from dataset
-    ntx_graph = graph_composer.compose_ntx_graph(input_file, delimiter, weighted)
+    per_component = components == 'Yes' or components == 'Y' or components == 'y' or components == 'yes'
+    use_interning = intern_ids == 'Yes' or intern_ids == 'Y' or intern_ids == 'y' or intern_ids == 'yes'
+    node_ids = None
+    report_metrics = metrics == 'Yes' or metrics == 'Y' or metrics == 'y' or metrics == 'yes'
+    save_quotient = quotient == 'Yes' or quotient == 'Y' or quotient == 'y' or quotient == 'yes'
+    if per_component or fold or kcore or use_interning or report_metrics or save_quotient or subgraphs or refine:
+        # Detect communities on edge arrays with the optional stages
+        if use_interning:
+            edges, node_ids = graph_composer.compose_interned_edge_arrays(input_file, delimiter, weighted,
+                                                                          duplicates=duplicates)
+        else:
+            edges = graph_composer.compose_edge_arrays(input_file, delimiter, weighted, duplicates=duplicates)
+        if kcore:
+            core_file = file_operations.generate_output_filename(input_file, prefix='Louvain',
+                                                                 output_dir=output_dir)
+            core_file = core_file.rsplit('.', 1)[0] + '.core'
+        else:
+            core_file = None
+        nodes, membership = graph_composer.detect_communities(edges, louvain_communities_from_arrays, per_component,
+                                                              min_component_size, workers, fold,
+                                                              kcore, core_file, node_ids)
+    else:
+        # Create a graph from dataset
+        ntx_graph = graph_composer.compose_ntx_graph(input_file, delimiter, weighted, duplicates)
 
-    # Find Communities from the graph
-    louvain_communities = louvain_find_communities(ntx_graph)
+        # Find Communities from the graph
+        louvain_communities = louvain_find_communities(ntx_graph)
+        nodes, membership = file_operations.dict_to_arrays(louvain_communities)
+
+    # Detect communities again inside the oversized communities
+    if refine:
+        nodes, membership, levels = graph_composer.refine_communities(edges, nodes, membership,
+                                                                      louvain_communities_from_arrays, refine,
+                                                                      workers, refine_depth)
+
+    # Reuse the community ids of a previous run
+    if previous:
+        membership = partition_comparison.relabel_to_previous(nodes, membership, previous, node_ids)
+
+    # Partition quality metrics
+    if report_metrics:
+        quality = partition_metrics.partition_metrics(edges, nodes, membership)
+        partition_metrics.print_metrics(quality)
 
     # Create output files (.grp and .pkl)
-    if output is None or output == 'Yes' or output == 'Y' or output == 'y' or output == 'yes':
-        output_file = file_operations.generate_output_filename(input_file, prefix='Louvain')
-        file_operations.create_community_file(louvain_communities, output_file)
+    create_output = output is None or output == 'Yes' or output == 'Y' or output == 'y' or output == 'yes'
+    if create_output or save_quotient or subgraphs or refine:
+        output_file = file_operations.generate_output_filename(input_file, prefix='Louvain', output_dir=output_dir)
+    if create_output:
+        file_operations.create_community_file(output_file=output_file, nodes=nodes, membership=membership,
+                                              node_ids=node_ids)
+        if report_metrics:
+            partition_metrics.write_metrics(quality, output_file)
     else:
         pass
 
+    # Requested outputs are written even without the community files
+    if save_quotient:
+        graph_composer.save_edge_arrays(output_file.rsplit('.', 1)[0] + '_quotient.npz',
+                                        *graph_composer.quotient_edges(edges, nodes, membership))
+    if subgraphs:
+        graph_composer.export_community_subgraphs(output_file, edges, nodes, membership, subgraphs, workers,
+                                                  node_ids)
+    if refine:
+        graph_composer.save_community_levels(output_file, nodes, levels, node_ids)
+
     # Print information about detected communities
-    total_communities = len(list(set(louvain_communities.values())))
+    total_communities = len(np.unique(membership))
     print('Total communities found with LOUVAIN method algorithm: ', color='green', log_type='info', end='')
     print('{}'.format(total_communities), color='cyan', text_format='bold')
 
 
 # Command Center
-def command_center(input_file=None, delimiter=None, weighted=None, output=None):
+def command_center(input_file=None, delimiter=None, weighted=None, output=None, components=None,
+                   min_component_size=10, workers=1, fold=None, kcore=None, duplicates=None, intern_ids=None,
+                   output_dir=None, metrics=None, previous=None, quotient=None, subgraphs=None,
+                   refine=None, refine_depth=3):
     """
     This function controls the other functions
     :param input_file: Input file path
     :param delimiter: Column separator
     :param weighted: Is the file has a weight column? (yes/no)
     :param output: Boolean, yes/no if the output file will be created or not
+    :param components: Boolean, yes/no if communities are detected per connected component
+    :param min_component_size: Smaller components become one community without running louvain
+    :param workers: Number of worker processes for per component detection
+    :param fold: None, 'pendants' or 'chains' (pendants and degree-2 chains) to fold before detection
+    :param kcore: If provided, detect communities on the k-core only, attach the peeled nodes and save core numbers
+    :param duplicates: If provided, drop self loops and merge duplicate edges keeping the sum/max/first weight
+    :param intern_ids: Boolean, yes/no if node identifiers are arbitrary (e.g. strings) and mapped to dense integers
+    :param output_dir: Output directory, required when the input is the standard input (-)
+    :param metrics: Boolean, yes/no if partition quality metrics are reported (and saved as .metrics/.cmetrics)
+    :param previous: Community (.npz/.pkl) file of a previous run, matching communities keep its ids
+    :param quotient: Boolean, yes/no if the community level graph is saved as a binary edge file (.npz)
+    :param subgraphs: None, 'indexed' (one indexed .npz file) or 'files' (one .npz file per community) to
+                      export the induced subgraph of every community
+    :param refine: If provided, communities with more nodes are detected again on their induced subgraph
+    :param refine_depth: Maximum number of refinement levels
     :return: <>
     """
     print('Initializing.....', log_type='info')
-    run_louvain(input_file, delimiter, weighted, output)
+    run_louvain(input_file, delimiter, weighted, output, components, min_component_size, workers, fold, kcore,
+                duplicates, intern_ids, output_dir, metrics, previous, quotient, subgraphs, refine, refine_depth)
 
 
 # Standard boilerplate for running this source code file as a standalone segment
@@ -120,7 +230,9 @@ if __name__ == '__main__':
                                      add_help=True)
 
     parser.add_argument('-i', '--input-file', action='store', dest='input', required=True,
-                        help='Input file absolute path. E.g. /home/user/data/input/file_name.txt/.csv/.dat etc.')
+                        help='Input file absolute path. E.g. /home/user/data/input/file_name.txt/.csv/.dat etc. '
+                             'Use - to read from standard input (needs --output-dir). A directory or a quoted glob '
+                             'pattern (e.g. "/data/parts/part-*") reads all shards')
     parser.add_argument('-d', '--delimiter', action='store', dest='delimiter', required=False,
                         help='Separator for the input and output file. E.g. (,)/(";" need to be quoted)/tab/space.'
                              'Default is comma (,)')
@@ -128,9 +240,49 @@ if __name__ == '__main__':
                         help='Boolean - yes/no if the file has weight column')
     parser.add_argument('-o', '--output', action='store', dest='output', required=False,
                         help='Boolean - yes/no (To create output file or not)')
+    parser.add_argument('--components', action='store', dest='components', required=False,
+                        help='Boolean - yes/no (Detect communities per connected component)')
+    parser.add_argument('--min-component-size', action='store', dest='min_component_size', required=False,
+                        type=int, help='Smaller components become one community without running the algorithm. '
+                                       'Default is 10')
+    parser.add_argument('--workers', action='store', dest='workers', required=False, type=int,
+                        help='Number of worker processes for per component detection. Default is 1')
+    parser.add_argument('--fold', action='store', dest='fold', required=False, choices=['pendants', 'chains'],
+                        help='Fold pendant nodes (pendants) or pendant nodes and degree-2 chains (chains) into their '
+                             'neighbors before detection and re-expand the communities afterwards')
+    parser.add_argument('--kcore', action='store', dest='kcore', required=False, type=int,
+                        help='Detect communities on the k-core only, attach the other nodes to the community of '
+                             'their majority neighbor and save core numbers (.core)')
+    parser.add_argument('--duplicates', action='store', dest='duplicates', required=False,
+                        choices=['sum', 'max', 'first'],
+                        help='Drop self loops and merge duplicate edges, keeping the sum, max or first weight')
+    parser.add_argument('--intern-ids', action='store', dest='intern_ids', required=False,
+                        help='Boolean - yes/no (Node ids are arbitrary, e.g. strings, map them to dense integers)')
+    parser.add_argument('--output-dir', action='store', dest='output_dir', required=False,
+                        help='Output directory. Default is the directory of the input file')
+    parser.add_argument('--metrics', action='store', dest='metrics', required=False,
+                        help='Boolean - yes/no (Report modularity, coverage, performance and conductance)')
+    parser.add_argument('--previous', action='store', dest='previous', required=False,
+                        help='Community (.npz/.pkl) file of a previous run. Communities take the id of the previous '
+                             'community they overlap most, so ids stay stable across runs')
+    parser.add_argument('--quotient', action='store', dest='quotient', required=False,
+                        help='Boolean - yes/no (Save the community level graph with summed weights as a binary '
+                             'edge file, <output>_quotient.npz)')
+    parser.add_argument('--subgraphs', action='store', dest='subgraphs', required=False, choices=['indexed', 'files'],
+                        help='Export the induced subgraph of every community, as one indexed binary file '
+                             '(<output>_subgraphs.npz) or as one binary edge file per community '
+                             '(<output>_subgraphs/community_<id>.npz, written by --workers processes)')
+    parser.add_argument('--refine', action='store', dest='refine', required=False, type=int,
+                        help='Detect communities again on the induced subgraph of every community with more '
+                             'nodes than this, level by level in --workers processes. Community levels are saved '
+                             '(.paths.npy)')
+    parser.add_argument('--refine-depth', action='store', dest='refine_depth', required=False, type=int,
+                        help='Maximum number of refinement levels. Default is 3')
 
     # Parse arguments
     args = parser.parse_args()
+    if args.input == file_operations.STDIN and not args.output_dir:
+        parser.error('the argument --output-dir is required when reading from standard input (-i -)')
 
     # Double checking the arguments
     if args.delimiter:
@@ -148,6 +300,28 @@ if __name__ == '__main__':
     else:
         print('No output parameter provided! Using default (Yes).....', log_type='info')
         _output = 'Yes'
+    if args.components:
+        _components = args.components
+    else:
+        _components = 'No'
+    if args.min_component_size:
+        _min_component_size = args.min_component_size
+    else:
+        _min_component_size = 10
+    if args.workers:
+        _workers = args.workers
+    else:
+        _workers = 1
+    if args.refine_depth:
+        _refine_depth = args.refine_depth
+    else:
+        _refine_depth = 3
 
     # Command Center
-    command_center(input_file=args.input, delimiter=_delimiter, weighted=_weighted, output=_output)
+    command_center(input_file=args.input, delimiter=_delimiter, weighted=_weighted, output=_output,
+                   components=_components, min_component_size=_min_component_size, workers=_workers,
+                   fold=args.fold, kcore=args.kcore,
+                   duplicates=args.duplicates, intern_ids=args.intern_ids,
+                   output_dir=args.output_dir, metrics=args.metrics, previous=args.previous,
+                   quotient=args.quotient, subgraphs=args.subgraphs, refine=args.refine,
+                   refine_depth=_refine_depth)
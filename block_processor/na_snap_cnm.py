@@ -8,6 +8,7 @@ import os
 import sys
 import textwrap
 import argparse
+import numpy as np
 try:
     from pyrainbowterm import *
 except ImportError:
@@ -24,6 +25,15 @@ import graph_composer
 # Import file_operations
 import file_operations
 
+# Import partition metrics
+import partition_metrics
+
+# Import partition comparison
+import partition_comparison
+
+# Import native_converter
+import native_converter
+
 # Source code meta data
 __author__ = 'Dalwar Hossain'
 __email__ = 'dalwar.hossain@protonmail.com'
@@ -50,41 +60,164 @@ def cnm_find_communities(snap_graph):
     """
     This function detects community structures in a graph using Clauset-Newman-Moore algorithm
     :param snap_graph: A graph created with SNAP's snap.py module
-    :return: Total number of community, a python dictionary with detected communities, modularity of the network
+    :return: Total number of community, numpy arrays of nodes and their communities, modularity of the network
     """
     print('Finding communities with CNM.....', log_type='info')
     community_vector = snap.TCnComV()
     modularity, community_vector = run_algorithm(snap_graph, community_vector)
     total_communities = len(community_vector)
-    # Create python dictionary of communities
-    community_id = 0
-    cnm_communities = {}
-    for community in community_vector:
-        for NI in community:
-            cnm_communities[NI] = community_id
-        community_id += 1
+    # Create flat arrays (node -> community) of detected communities
+    nodes, membership = native_converter.snap_membership(community_vector)
+
+    # Return
+    return total_communities, nodes, membership, modularity
+
+
+# Find communities from edge arrays
+def cnm_communities_from_arrays(edges):
+    """
+    This function finds communities of a graph given as edge arrays (used for per component detection)
+    :param edges: Edge arrays (sources, targets, weights)
+    :return: numpy arrays of nodes and their communities
+    """
+    snap_graph = graph_composer.compose_snap_graph_from_arrays(edges)
+    _, nodes, membership, _ = cnm_find_communities(snap_graph)
 
     # Return
-    return total_communities, cnm_communities, modularity
+    return nodes, membership
+
+
+# Create a function to run CNM algorithm
+def run_cnm(input_file=None, delimiter=None, weighted=None, output=None, components=None, min_component_size=10,
+            workers=1, fold=None, kcore=None, duplicates=None, intern_ids=None, output_dir=None, metrics=None,
+            previous=None, quotient=None, subgraphs=None, refine=None, refine_depth=3):
+    """
+    This function finds community structures in graphs using SNAP's CNM algorithm
+    :param input_file: Input file with edges of the graph
+    :param delimiter: Field separator
+    :param weighted: are the edges weighted?
+    :param output: whether output file will be created or not (boolean - yes/no)
+    :param components: whether communities are detected per connected component (boolean - yes/no)
+    :param min_component_size: Smaller components become one community without running the algorithm
+    :param workers: Number of worker processes for per component detection
+    :param fold: Not supported (SNAP graphs are unweighted), any value is rejected
+    :param kcore: If provided, detect communities on the k-core only, attach the peeled nodes and save core numbers
+    :param duplicates: If provided, drop self loops and merge duplicate edges keeping the sum/max/first weight
+    :param intern_ids: Boolean, yes/no if node identifiers are arbitrary (e.g. strings) and mapped to dense integers
+    :param output_dir: Output directory, required when the input is the standard input (-)
+    :param metrics: Boolean, yes/no if partition quality metrics are reported (and saved as .metrics/.cmetrics)
+    :param previous: Community (.npz/.pkl) file of a previous run, matching communities keep its ids
+    :param quotient: Boolean, yes/no if the community level graph is saved as a binary edge file (.npz)
+    :param subgraphs: None, 'indexed' (one indexed .npz file) or 'files' (one .npz file per community) to
+                      export the induced subgraph of every community
+    :param refine: If provided, communities with more nodes are detected again on their induced subgraph
+    :param refine_depth: Maximum number of refinement levels
+    :return: <> file object <>
+    """
+    per_component = components == 'Yes' or components == 'Y' or components == 'y' or components == 'yes'
+    use_interning = intern_ids == 'Yes' or intern_ids == 'Y' or intern_ids == 'y' or intern_ids == 'yes'
+    node_ids = None
+    report_metrics = metrics == 'Yes' or metrics == 'Y' or metrics == 'y' or metrics == 'yes'
+    save_quotient = quotient == 'Yes' or quotient == 'Y' or quotient == 'y' or quotient == 'yes'
+    # Folded nodes are kept as edge weights, SNAP graphs have none
+    if fold:
+        print('Folding is not supported by the (unweighted) SNAP CNM algorithm!', log_type='error')
+        sys.exit(1)
+    if per_component or fold or kcore or use_interning or report_metrics or save_quotient or subgraphs or refine:
+        # Detect communities on edge arrays with the optional stages
+        if use_interning:
+            edges, node_ids = graph_composer.compose_interned_edge_arrays(input_file, delimiter, weighted,
+                                                                          duplicates=duplicates)
+        else:
+            edges = graph_composer.compose_edge_arrays(input_file, delimiter, weighted, duplicates=duplicates)
+        if kcore:
+            core_file = file_operations.generate_output_filename(input_file, prefix='CNM', output_dir=output_dir)
+            core_file = core_file.rsplit('.', 1)[0] + '.core'
+        else:
+            core_file = None
+        nodes, membership = graph_composer.detect_communities(edges, cnm_communities_from_arrays, per_component,
+                                                              min_component_size, workers, fold,
+                                                              kcore, core_file, node_ids)
+        total_communities = len(np.unique(membership))
+    else:
+        # Create SNAP graph
+        snap_graph = graph_composer.compose_snap_graph(input_file, delimiter, weighted, duplicates)
+        # Detect communities
+        total_communities, nodes, membership, modularity = cnm_find_communities(snap_graph)
+
+    # Detect communities again inside the oversized communities
+    if refine:
+        nodes, membership, levels = graph_composer.refine_communities(edges, nodes, membership,
+                                                                      cnm_communities_from_arrays, refine,
+                                                                      workers, refine_depth)
+        total_communities = len(np.unique(membership))
+
+    # Reuse the community ids of a previous run
+    if previous:
+        membership = partition_comparison.relabel_to_previous(nodes, membership, previous, node_ids)
+
+    # Partition quality metrics
+    if report_metrics:
+        quality = partition_metrics.partition_metrics(edges, nodes, membership)
+        partition_metrics.print_metrics(quality)
+
+    # Create output files (.grp and .pkl)
+    create_output = output is None or output == 'Yes' or output == 'Y' or output == 'y' or output == 'yes'
+    if create_output or save_quotient or subgraphs or refine:
+        output_file = file_operations.generate_output_filename(input_file, prefix='CNM', output_dir=output_dir)
+    if create_output:
+        file_operations.create_community_file(output_file=output_file, nodes=nodes, membership=membership,
+                                              node_ids=node_ids)
+        if report_metrics:
+            partition_metrics.write_metrics(quality, output_file)
+    else:
+        pass
+
+    # Requested outputs are written even without the community files
+    if save_quotient:
+        graph_composer.save_edge_arrays(output_file.rsplit('.', 1)[0] + '_quotient.npz',
+                                        *graph_composer.quotient_edges(edges, nodes, membership))
+    if subgraphs:
+        graph_composer.export_community_subgraphs(output_file, edges, nodes, membership, subgraphs, workers,
+                                                  node_ids)
+    if refine:
+        graph_composer.save_community_levels(output_file, nodes, levels, node_ids)
+
+    print('Total communities found with CNM algorithm: ', color='green', log_type='info', end='')
+    print('{}'.format(total_communities), color='cyan', text_format='bold')
 
 
 # Command Center
-def command_center(input_file=None, delimiter=None, weighted=None):
+def command_center(input_file=None, delimiter=None, weighted=None, output=None, components=None,
+                   min_component_size=10, workers=1, fold=None, kcore=None, duplicates=None, intern_ids=None,
+                   output_dir=None, metrics=None, previous=None, quotient=None, subgraphs=None,
+                   refine=None, refine_depth=3):
     """
     This function controls the other functions
     :param input_file: Input file with edges of the graph
     :param delimiter: Field separator
     :param weighted: are the edges weighted?
+    :param output: whether output file will be created or not (boolean - yes/no)
+    :param components: whether communities are detected per connected component (boolean - yes/no)
+    :param min_component_size: Smaller components become one community without running the algorithm
+    :param workers: Number of worker processes for per component detection
+    :param fold: None, 'pendants' or 'chains' (pendants and degree-2 chains) to fold before detection
+    :param kcore: If provided, detect communities on the k-core only, attach the peeled nodes and save core numbers
+    :param duplicates: If provided, drop self loops and merge duplicate edges keeping the sum/max/first weight
+    :param intern_ids: Boolean, yes/no if node identifiers are arbitrary (e.g. strings) and mapped to dense integers
+    :param output_dir: Output directory, required when the input is the standard input (-)
+    :param metrics: Boolean, yes/no if partition quality metrics are reported (and saved as .metrics/.cmetrics)
+    :param previous: Community (.npz/.pkl) file of a previous run, matching communities keep its ids
+    :param quotient: Boolean, yes/no if the community level graph is saved as a binary edge file (.npz)
+    :param subgraphs: None, 'indexed' (one indexed .npz file) or 'files' (one .npz file per community) to
+                      export the induced subgraph of every community
+    :param refine: If provided, communities with more nodes are detected again on their induced subgraph
+    :param refine_depth: Maximum number of refinement levels
     :return: <>
     """
     print('Initializing.....', log_type='info')
-    # Create SNAP graph
-    snap_graph = graph_composer.compose_snap_graph(input_file, delimiter, weighted)
-    # Detect communities
-    total_communities, cnm_communities, modularity = cnm_find_communities(snap_graph)
-
-    print('Total communities found with CNM algorithm: ', color='green', log_type='info', end='')
-    print('{}'.format(total_communities), color='cyan', text_format='bold')
+    run_cnm(input_file, delimiter, weighted, output, components, min_component_size, workers, fold, kcore,
+            duplicates, intern_ids, output_dir, metrics, previous, quotient, subgraphs, refine, refine_depth)
 
 
 if __name__ == '__main__':
@@ -105,15 +238,59 @@ if __name__ == '__main__':
                                      add_help=True)
 
     parser.add_argument('-i', '--input-file', action='store', dest='input', required=True,
-                        help='Input file absolute path. E.g. /home/user/data/input/file_name.txt/.csv/.dat etc.')
+                        help='Input file absolute path. E.g. /home/user/data/input/file_name.txt/.csv/.dat etc. '
+                             'Use - to read from standard input (needs --output-dir). A directory or a quoted glob '
+                             'pattern (e.g. "/data/parts/part-*") reads all shards')
     parser.add_argument('-d', '--delimiter', action='store', dest='delimiter', required=False,
                         help='Separator for the input and output file. E.g. (,)/(";" need to be quoted)/tab/space.'
                              'Default is comma (,)')
     parser.add_argument('-w', '--weighted', action='store', dest='weighted', required=False,
                         help='Boolean - yes/no if the file has weight column')
+    parser.add_argument('-o', '--output', action='store', dest='output', required=False,
+                        help='Boolean - yes/no (To create output file or not)')
+    parser.add_argument('--components', action='store', dest='components', required=False,
+                        help='Boolean - yes/no (Detect communities per connected component)')
+    parser.add_argument('--min-component-size', action='store', dest='min_component_size', required=False,
+                        type=int, help='Smaller components become one community without running the algorithm. '
+                                       'Default is 10')
+    parser.add_argument('--workers', action='store', dest='workers', required=False, type=int,
+                        help='Number of worker processes for per component detection. Default is 1')
+    parser.add_argument('--fold', action='store', dest='fold', required=False, choices=['pendants', 'chains'],
+                        help='Not supported by SNAP CNM (folded nodes are kept as edge weights, SNAP graphs are '
+                             'unweighted). Use na_fast_greedy.py --fold for the same algorithm')
+    parser.add_argument('--kcore', action='store', dest='kcore', required=False, type=int,
+                        help='Detect communities on the k-core only, attach the other nodes to the community of '
+                             'their majority neighbor and save core numbers (.core)')
+    parser.add_argument('--duplicates', action='store', dest='duplicates', required=False,
+                        choices=['sum', 'max', 'first'],
+                        help='Drop self loops and merge duplicate edges, keeping the sum, max or first weight')
+    parser.add_argument('--intern-ids', action='store', dest='intern_ids', required=False,
+                        help='Boolean - yes/no (Node ids are arbitrary, e.g. strings, map them to dense integers)')
+    parser.add_argument('--output-dir', action='store', dest='output_dir', required=False,
+                        help='Output directory. Default is the directory of the input file')
+    parser.add_argument('--metrics', action='store', dest='metrics', required=False,
+                        help='Boolean - yes/no (Report modularity, coverage, performance and conductance)')
+    parser.add_argument('--previous', action='store', dest='previous', required=False,
+                        help='Community (.npz/.pkl) file of a previous run. Communities take the id of the previous '
+                             'community they overlap most, so ids stay stable across runs')
+    parser.add_argument('--quotient', action='store', dest='quotient', required=False,
+                        help='Boolean - yes/no (Save the community level graph with summed weights as a binary '
+                             'edge file, <output>_quotient.npz)')
+    parser.add_argument('--subgraphs', action='store', dest='subgraphs', required=False, choices=['indexed', 'files'],
+                        help='Export the induced subgraph of every community, as one indexed binary file '
+                             '(<output>_subgraphs.npz) or as one binary edge file per community '
+                             '(<output>_subgraphs/community_<id>.npz, written by --workers processes)')
+    parser.add_argument('--refine', action='store', dest='refine', required=False, type=int,
+                        help='Detect communities again on the induced subgraph of every community with more '
+                             'nodes than this, level by level in --workers processes. Community levels are saved '
+                             '(.paths.npy)')
+    parser.add_argument('--refine-depth', action='store', dest='refine_depth', required=False, type=int,
+                        help='Maximum number of refinement levels. Default is 3')
 
     # Parse arguments
     args = parser.parse_args()
+    if args.input == file_operations.STDIN and not args.output_dir:
+        parser.error('the argument --output-dir is required when reading from standard input (-i -)')
 
     # Double checking the arguments
     if args.delimiter:
@@ -126,6 +303,33 @@ if __name__ == '__main__':
     else:
         print('No weighted parameter provided! Using default (No).....', log_type='info')
         _weighted = 'No'
+    if args.output:
+        _output = args.output
+    else:
+        print('No output parameter provided! Using default (Yes).....', log_type='info')
+        _output = 'Yes'
+    if args.components:
+        _components = args.components
+    else:
+        _components = 'No'
+    if args.min_component_size:
+        _min_component_size = args.min_component_size
+    else:
+        _min_component_size = 10
+    if args.workers:
+        _workers = args.workers
+    else:
+        _workers = 1
+    if args.refine_depth:
+        _refine_depth = args.refine_depth
+    else:
+        _refine_depth = 3
 
     # Command Center
-    command_center(input_file=args.input, delimiter=_delimiter, weighted=_weighted)
+    command_center(input_file=args.input, delimiter=_delimiter, weighted=_weighted, output=_output,
+                   components=_components, min_component_size=_min_component_size, workers=_workers,
+                   fold=args.fold, kcore=args.kcore,
+                   duplicates=args.duplicates, intern_ids=args.intern_ids,
+                   output_dir=args.output_dir, metrics=args.metrics, previous=args.previous,
+                   quotient=args.quotient, subgraphs=args.subgraphs, refine=args.refine,
+                   refine_depth=_refine_depth)
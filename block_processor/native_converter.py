@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+# Import python libraries
+import os
+import sys
+import tempfile
+
+# Import custom python libraries
+try:
+    from pyrainbowterm import *
+except ImportError:
+    print('Can not import pyrainbowterm!', log_type='error')
+    print('Try: pip install pyrainbowterm', log_type='hint')
+    sys.exit(1)
+
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError as e:
+    print('Can not import python numpy/pandas library! ERROR: {}'.format(e), log_type='error')
+    sys.exit(1)
+
+# Import file_operations
+import file_operations
+
+# Source code meta data
+__author__ = 'Dalwar Hossain'
+__email__ = 'dalwar.hossain@protonmail.com'
+
+
+# Create a temporary file path for native writers
+def temporary_file(suffix=None):
+    """
+    This function creates an empty temporary file that native (C++) writers can fill
+    :param suffix: Suffix (extension) of the temporary file
+    :return: temporary file path
+    """
+    file_descriptor, temp_file = tempfile.mkstemp(suffix=suffix, prefix='block_processor_')
+    os.close(file_descriptor)
+
+    # Return
+    return temp_file
+
+
+# Decode SNAP's TCnCom.SaveTxt() output
+def read_snap_communities(community_file=None):
+    """
+    This function reads the text written by TCnCom.SaveTxt(), one community per line as <size> <node> <node>...
+    :param community_file: File written by TCnCom.SaveTxt()
+    :return: numpy array of nodes, numpy array of community ids
+    """
+    # Skip the comment lines and parse every remaining number in one go
+    with open(community_file) as f:
+        body = ''.join(line for line in f if not line.startswith('#'))
+    tokens = np.fromstring(body, dtype=np.int64, sep=' ') if body.strip() else np.empty(0, dtype=np.int64)
+
+    # Locate the size token of every community (one step per community, not per node)
+    size_positions = []
+    position = 0
+    while position < len(tokens):
+        size_positions.append(position)
+        position += tokens[position] + 1
+    size_positions = np.asarray(size_positions, dtype=np.int64)
+
+    # Everything that is not a size token is a node
+    is_node = np.ones(len(tokens), dtype=bool)
+    is_node[size_positions] = False
+    nodes = tokens[is_node]
+    membership = np.repeat(np.arange(len(size_positions), dtype=np.int64), tokens[size_positions])
+
+    # Return
+    return nodes, membership
+
+
+# Extract membership arrays from SNAP community vector
+def snap_membership(community_vector=None):
+    """
+    This function extracts nodes and community ids from a SNAP TCnComV in bulk
+    :param community_vector: SNAP TCnComV (e.g. filled by snap.CommunityCNM)
+    :return: numpy array of nodes, numpy array of community ids
+    """
+    # Import snap (Stanford SNAP python program for network analysis)
+    from sanppy import snap
+
+    temp_file = temporary_file(suffix='.cmty')
+    try:
+        # Let SNAP write the whole vector natively and parse it back with numpy
+        snap.TCnCom.SaveTxt(community_vector, temp_file, 'block_processor')
+        nodes, membership = read_snap_communities(temp_file)
+    except AttributeError:
+        # Older snap.py builds do not expose SaveTxt, walk the vector instead
+        print('TCnCom.SaveTxt() is not available! Converting element by element.....', log_type='warn')
+        nodes, membership = file_operations.communities_to_arrays(community_vector)
+    finally:
+        os.remove(temp_file)
+
+    # Return
+    return nodes, membership
+
+
+# Decode Infomap's .clu output
+def read_infomap_clu(clu_file=None, node_offset=1):
+    """
+    This function reads a .clu file written by HierarchicalNetwork.writeClu()
+    :param clu_file: File written by writeClu()
+    :param node_offset: Index offset of the node column (0 for zero based node numbers, 1 otherwise)
+    :return: numpy array of nodes, numpy array of module ids (zero based)
+    """
+    # Count the comment (#) and pajek (*Vertices) lines on top of the file
+    skip_rows = 0
+    with open(clu_file) as f:
+        for line in f:
+            if line.startswith('#') or line.startswith('*'):
+                skip_rows += 1
+            else:
+                break
+
+    try:
+        clu = pd.read_csv(clu_file, sep=r'\s+', header=None, skiprows=skip_rows).values
+    except pd.errors.EmptyDataError:
+        clu = np.empty((0, 2), dtype=np.int64)
+
+    # Pajek style files only list the module of every node, newer ones list <node> <module> <flow>
+    if clu.shape[1] == 1:
+        nodes = np.arange(len(clu), dtype=np.int64)
+        membership = clu[:, 0].astype(np.int64) - 1
+    else:
+        nodes = clu[:, 0].astype(np.int64) - node_offset
+        membership = clu[:, 1].astype(np.int64) - 1
+
+    # Return
+    return nodes, membership
+
+
+# Extract membership arrays from an Infomap tree
+def infomap_membership(tree=None, module_index_depth=1, zero_based=True):
+    """
+    This function extracts nodes and module ids from an Infomap tree in bulk
+    :param tree: Infomap HierarchicalNetwork (e.g. infomap_wrapper.tree)
+    :param module_index_depth: Depth of the modules in the tree (1 is the top level)
+    :param zero_based: Was the network built with zero based node numbers (-z)?
+    :return: numpy array of nodes, numpy array of module ids
+    """
+    temp_file = temporary_file(suffix='.clu')
+    try:
+        # Let Infomap write the partition natively and parse it back with pandas
+        tree.writeClu(temp_file, module_index_depth)
+        nodes, membership = read_infomap_clu(temp_file, node_offset=0 if zero_based else 1)
+    except (AttributeError, RuntimeError):
+        print('Can not write .clu from Infomap tree! Converting leaf by leaf.....', log_type='warn')
+        leaves = tree.numLeafNodes()
+        nodes = np.empty(leaves, dtype=np.int64)
+        membership = np.empty(leaves, dtype=np.int64)
+        for i, node in enumerate(tree.leafIter(module_index_depth)):
+            nodes[i] = node.originalLeafIndex
+            membership[i] = node.moduleIndex()
+    finally:
+        os.remove(temp_file)
+
+    # Return
+    return nodes, membership
+
+
+# Stream the module path of every leaf of an Infomap tree
+def write_infomap_paths(tree=None, paths_file=None, chunk_size=65536):
+    """
+    This function walks the Infomap tree once and streams the module path of every leaf into a columnar .npy file
+    Row layout: <node> <module at level 1> <module at level 2> ... (-1 where a leaf sits higher in the tree)
+    Module indices are relative to the parent module, as in TreeIterator.path()
+    :param tree: Infomap HierarchicalNetwork
+    :param paths_file: Output file path (.npy)
+    :param chunk_size: Number of rows buffered before writing
+    :return: Number of module levels written
+    """
+    levels = max(tree.maxDepth() - 1, 1)
+    leaves = tree.numLeafNodes()
+
+    # Rows go straight to disk, nothing per level is kept in memory
+    paths = np.lib.format.open_memmap(paths_file, mode='w+', dtype=np.int64, shape=(leaves, levels + 1))
+    buffer = np.full((chunk_size, levels + 1), -1, dtype=np.int64)
+    row = 0
+    filled = 0
+    for node in tree.treeIter():
+        if not node.isLeafNode():
+            continue
+        # The last path entry is the position of the leaf inside its module
+        path = tuple(node.path())[:-1]
+        buffer[filled, 0] = node.originalLeafIndex
+        buffer[filled, 1:len(path) + 1] = path
+        filled += 1
+        if filled == chunk_size:
+            paths[row:row + filled] = buffer
+            buffer.fill(-1)
+            row += filled
+            filled = 0
+    paths[row:row + filled] = buffer[:filled]
+    paths.flush()
+    del paths
+
+    # Return
+    return levels
+
+
+# Membership at one level of a module path file
+def path_membership(paths=None, depth=1):
+    """
+    This function turns the relative module paths written by write_infomap_paths() into global module ids at a depth
+    :param paths: numpy array (or memory map) of module paths
+    :param depth: Module depth (1 is the top level)
+    :return: numpy array of nodes, numpy array of module ids
+    """
+    # Modules are identified by their full path prefix
+    _, membership = np.unique(paths[:, 1:depth + 1], axis=0, return_inverse=True)
+
+    # Return
+    return np.asarray(paths[:, 0]), membership.ravel()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+# Import python libraries
+import os
+import sys
+import argparse
+
+# Import custom python libraries
+try:
+    from pyrainbowterm import *
+except ImportError:
+    print('Can not import pyrainbowterm!', log_type='error')
+    print('Try: pip install pyrainbowterm', log_type='hint')
+    sys.exit(1)
+
+try:
+    import numpy as np
+except ImportError as e:
+    print('Can not import python numpy library! ERROR: {}'.format(e), log_type='error')
+    sys.exit(1)
+
+# Import file_operations
+import file_operations
+
+# Source code meta data
+__author__ = 'Dalwar Hossain'
+__email__ = 'dalwar.hossain@protonmail.com'
+
+
+# Align two partitions on their common nodes
+def align_partitions(first=None, second=None):
+    """
+    This function keeps the nodes present in both partitions and puts the two memberships in the same node order
+    :param first: (nodes, membership) of the first partition
+    :param second: (nodes, membership) of the second partition
+    :return: common nodes, membership in the first partition, membership in the second partition
+    """
+    first_nodes, first_membership = first
+    second_nodes, second_membership = second
+    common, first_index, second_index = np.intersect1d(first_nodes, second_nodes, assume_unique=True,
+                                                       return_indices=True)
+    if len(common) < len(first_nodes) or len(common) < len(second_nodes):
+        print('Only {} nodes are in both partitions ({} only in the first, {} only in the second)'.format(
+            len(common), len(first_nodes) - len(common), len(second_nodes) - len(common)), log_type='warn')
+
+    # Return
+    return common, np.asarray(first_membership)[first_index], np.asarray(second_membership)[second_index]
+
+
+# Sparse contingency table of two partitions
+def contingency_table(first_membership=None, second_membership=None):
+    """
+    This function counts the nodes shared by every pair of communities, only the non empty cells are kept
+    :param first_membership: numpy array of community ids (first partition)
+    :param second_membership: numpy array of community ids (second partition), same node order
+    :return: row (first community), column (second community) and count of every non empty cell,
+             sizes of the first and second communities (dense community ids)
+    """
+    _, rows = np.unique(first_membership, return_inverse=True)
+    second_ids, columns = np.unique(second_membership, return_inverse=True)
+    rows = rows.ravel().astype(np.int64)
+    columns = columns.ravel().astype(np.int64)
+
+    # One key per (row, column) pair, counted with a single sort
+    cells, counts = np.unique(rows * len(second_ids) + columns, return_counts=True)
+    first_sizes = np.bincount(rows)
+    second_sizes = np.bincount(columns)
+
+    # Return
+    return cells // len(second_ids), cells % len(second_ids), counts, first_sizes, second_sizes
+
+
+# Entropy of a size distribution
+def entropy(sizes=None, n=None):
+    """
+    This function computes the entropy (natural logarithm) of a partition from its community sizes
+    :param sizes: numpy array of community sizes
+    :param n: Number of nodes
+    :return: entropy
+    """
+    p = sizes[sizes > 0] / float(n)
+
+    # Return
+    return float(-(p * np.log(p)).sum())
+
+
+# Pairs of a count
+def pairs(counts=None):
+    """
+    This function computes the number of unordered pairs (n choose 2) of every count
+    :param counts: numpy array of counts
+    :return: total number of pairs
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+
+    # Return
+    return float((counts * (counts - 1) / 2.0).sum())
+
+
+# Compare two partitions
+def compare_partitions(first_membership=None, second_membership=None):
+    """
+    This function compares two partitions of the same nodes with normalized mutual information (arithmetic mean
+    normalization), adjusted rand index and variation of information, all from the sparse contingency table
+    :param first_membership: numpy array of community ids (first partition)
+    :param second_membership: numpy array of community ids (second partition), same node order
+    :return: python dictionary of scores
+    """
+    n = len(first_membership)
+    if n == 0:
+        print('The partitions have no node in common!', log_type='error')
+        sys.exit(1)
+    rows, columns, counts, first_sizes, second_sizes = contingency_table(first_membership, second_membership)
+
+    # Information theoretic scores
+    first_entropy = entropy(first_sizes, n)
+    second_entropy = entropy(second_sizes, n)
+    mutual_information = float((counts / float(n) * np.log(counts * float(n) /
+                                                           (first_sizes[rows] * second_sizes[columns]))).sum())
+    mutual_information = max(0.0, mutual_information)
+    if first_entropy + second_entropy > 0:
+        nmi = 2 * mutual_information / (first_entropy + second_entropy)
+    else:
+        nmi = 1.0
+    vi = max(0.0, first_entropy + second_entropy - 2 * mutual_information)
+
+    # Pair counting score
+    index = pairs(counts)
+    first_pairs = pairs(first_sizes)
+    second_pairs = pairs(second_sizes)
+    all_pairs = n * (n - 1) / 2.0
+    expected = first_pairs * second_pairs / all_pairs if all_pairs else 0.0
+    maximum = (first_pairs + second_pairs) / 2.0
+    ari = (index - expected) / (maximum - expected) if maximum != expected else 1.0
+
+    scores = {
+        'nodes': n,
+        'first_communities': len(first_sizes),
+        'second_communities': len(second_sizes),
+        'nmi': nmi,
+        'ari': ari,
+        'vi': vi,
+        'normalized_vi': float(vi / np.log(n)) if n > 1 else 0.0,
+    }
+
+    # Return
+    return scores
+
+
+# Print comparison scores
+def print_scores(scores=None):
+    """
+    This function prints the scores returned by compare_partitions()
+    :param scores: python dictionary of scores
+    :return: NULL
+    """
+    print('--------------- Comparison ----------------')
+    print('Common nodes: {}, communities: {} vs {}'.format(scores['nodes'], scores['first_communities'],
+                                                         scores['second_communities']), log_type='info')
+    for name, label in [('nmi', 'NMI'), ('ari', 'ARI'), ('vi', 'VI'), ('normalized_vi', 'VI / log(n)')]:
+        print('{}: '.format(label), log_type='info', end='')
+        print('{:.6f}'.format(scores[name]), color='cyan', text_format='bold')
+    print('-------------------------------------------')
+
+
+# Match communities to the communities of a previous partition
+def match_communities(rows=None, columns=None, counts=None, n_rows=None, n_columns=None):
+    """
+    This function pairs communities of two partitions one to one by maximum overlap, the largest overlaps are taken
+    first (greedy matching). Every round pairs the free cells that are the largest of both their row and their column
+    among the free cells (the greedy algorithm takes them all), until no free cell is left
+    :param rows: row (new community) of every non empty contingency cell
+    :param columns: column (previous community) of every non empty contingency cell
+    :param counts: overlap (shared nodes) of every non empty contingency cell
+    :param n_rows: Number of rows (new communities)
+    :param n_columns: Number of columns (previous communities)
+    :return: numpy array with the matched column of every row (-1 if not matched)
+    """
+    # Largest overlaps first, ties broken by row and column so the result is deterministic
+    order = np.lexsort((columns, rows, -counts))
+    rows = rows[order]
+    columns = columns[order]
+    matched = np.full(n_rows, -1, dtype=np.int64)
+    taken = np.zeros(n_columns, dtype=bool)
+    while True:
+        free = np.flatnonzero((matched[rows] < 0) & ~taken[columns])
+        if not len(free):
+            break
+        free_rows = rows[free]
+        free_columns = columns[free]
+
+        # Best cell of every free row and of every free column (first in overlap order), pair the common ones
+        _, row_best = np.unique(free_rows, return_index=True)
+        _, column_best = np.unique(free_columns, return_index=True)
+        mutual = np.intersect1d(row_best, column_best, assume_unique=True)
+        matched[free_rows[mutual]] = free_columns[mutual]
+        taken[free_columns[mutual]] = True
+
+    # Return
+    return matched
+
+
+# Relabel communities with the ids of a previous partition
+def relabel_membership(nodes=None, membership=None, previous_nodes=None, previous_membership=None):
+    """
+    This function gives every community the id of the previous community it overlaps most (one to one), the other
+    communities get new ids above the largest previous id
+    :param nodes: numpy array of nodes
+    :param membership: numpy array of community ids of the nodes
+    :param previous_nodes: numpy array of nodes of the previous partition
+    :param previous_membership: numpy array of community ids of the previous partition
+    :return: numpy array of relabeled community ids (same order as nodes)
+    """
+    membership = np.asarray(membership)
+    previous_membership = np.asarray(previous_membership, dtype=np.int64)
+    community_ids, inverse = np.unique(membership, return_inverse=True)
+    inverse = inverse.ravel()
+    _, index, previous_index = np.intersect1d(nodes, previous_nodes, assume_unique=True, return_indices=True)
+
+    # Sparse overlap matrix between new and previous communities
+    previous_ids, columns = np.unique(previous_membership[previous_index], return_inverse=True)
+    rows = inverse[index].astype(np.int64)
+    columns = columns.ravel().astype(np.int64)
+    cells, counts = np.unique(rows * len(previous_ids) + columns, return_counts=True)
+    matched = match_communities(cells // max(len(previous_ids), 1), cells % max(len(previous_ids), 1), counts,
+                                len(community_ids), len(previous_ids))
+
+    # Matched communities take the previous id, the others are numbered after the largest previous id
+    labels = np.empty(len(community_ids), dtype=np.int64)
+    is_matched = matched >= 0
+    labels[is_matched] = previous_ids[matched[is_matched]]
+    first_new_id = int(previous_membership.max()) + 1 if len(previous_membership) else 0
+    labels[~is_matched] = np.arange(first_new_id, first_new_id + int((~is_matched).sum()), dtype=np.int64)
+    print('Community ids reused from the previous run: {} of {} ({} new)'.format(
+        int(is_matched.sum()), len(community_ids), int((~is_matched).sum())), log_type='info')
+
+    # Return
+    return labels[inverse]
+
+
+# Relabel communities with the ids of a previous run
+def relabel_to_previous(nodes=None, membership=None, previous_file=None, node_ids=None):
+    """
+    This function relabels the communities of a run with the ids of a previous run (see relabel_membership())
+    :param nodes: numpy array of nodes
+    :param membership: numpy array of community ids of the nodes
+    :param previous_file: Community (.npz/.pkl) file of the previous run
+    :param node_ids: Original node identifiers of interned (dense 0..n-1) nodes, see graph_composer.intern_nodes()
+    :return: numpy array of relabeled community ids (same order as nodes)
+    """
+    previous_nodes, previous_membership = file_operations.read_community_file(previous_file)
+    if node_ids is not None:
+        nodes = np.asarray(node_ids)[nodes]
+
+    # Return
+    return relabel_membership(nodes, membership, previous_nodes, previous_membership)
+
+
+# Command Center
+def command_center(first_file=None, second_file=None):
+    """
+    This function controls the other functions
+    :param first_file: Community (.npz/.pkl) file of the first partition
+    :param second_file: Community (.npz/.pkl) file of the second partition
+    :return: python dictionary of scores
+    """
+    print('Initializing.....', log_type='info')
+    first = file_operations.read_community_file(first_file)
+    second = file_operations.read_community_file(second_file)
+    _, first_membership, second_membership = align_partitions(first, second)
+    scores = compare_partitions(first_membership, second_membership)
+    print_scores(scores)
+
+    # Return
+    return scores
+
+
+# Standard boilerplate for running this source code file as a standalone segment
+if __name__ == '__main__':
+    """
+    Parse arguments and follow through to mission control
+    """
+    # Initial message
+    file_operations.initial_message(os.path.basename(__file__), 'partition comparison')
+
+    # Create parser
+    parser = argparse.ArgumentParser(prog='partition_comparison.py',
+                                     usage='python %(prog)s <community_file> <community_file>',
+                                     description='Compare two detected partitions (NMI, ARI, VI)',
+                                     add_help=True)
+
+    parser.add_argument('first', action='store',
+                        help='Community (.npz/.pkl) file of the first partition. E.g. /home/user/data/Louvain_x.pkl')
+    parser.add_argument('second', action='store',
+                        help='Community (.npz/.pkl) file of the second partition. E.g. /home/user/data/Infomap_x.pkl')
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    # Command Center
+    command_center(first_file=args.first, second_file=args.second)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+# Import python libraries
+import os
+import sys
+import argparse
+
+# Import custom python libraries
+try:
+    from pyrainbowterm import *
+except ImportError:
+    print('Can not import pyrainbowterm!', log_type='error')
+    print('Try: pip install pyrainbowterm', log_type='hint')
+    sys.exit(1)
+
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError as e:
+    print('Can not import python numpy/pandas library! ERROR: {}'.format(e), log_type='error')
+    sys.exit(1)
+
+# Import file_operations
+import file_operations
+
+# Import partition comparison
+import partition_comparison
+
+# Source code meta data
+__author__ = 'Dalwar Hossain'
+__email__ = 'dalwar.hossain@protonmail.com'
+
+# Community events, in the order they are reported
+EVENTS = ['split', 'merge', 'birth', 'death']
+
+
+# Moved nodes of two partitions
+def moved_nodes(nodes=None, previous_membership=None, membership=None, previous_ids=None, community_ids=None,
+                rows=None, columns=None, counts=None):
+    """
+    This function finds the nodes whose community changed. Communities are paired one to one by maximum overlap
+    (see partition_comparison.match_communities()), a node moved if its current community is not the partner of
+    its previous community
+    :param nodes: numpy array of common nodes
+    :param previous_membership: numpy array of dense previous community of the nodes
+    :param membership: numpy array of dense current community of the nodes
+    :param previous_ids: numpy array of previous community ids (dense index -> id)
+    :param community_ids: numpy array of current community ids (dense index -> id)
+    :param rows: previous community of every non empty overlap cell
+    :param columns: current community of every non empty overlap cell
+    :param counts: overlap of every non empty overlap cell
+    :return: pandas DataFrame of moved nodes (node, previous, current)
+    """
+    partner = partition_comparison.match_communities(rows, columns, counts, len(previous_ids), len(community_ids))
+    moved = partner[previous_membership] != membership
+    moved_table = pd.DataFrame({'node': nodes[moved], 'previous': previous_ids[previous_membership[moved]],
+                                'current': community_ids[membership[moved]]},
+                               columns=['node', 'previous', 'current'])
+
+    # Return
+    return moved_table
+
+
+# Community events of two partitions
+def community_events(previous_ids=None, community_ids=None, rows=None, columns=None, counts=None,
+                     previous_sizes=None, sizes=None, min_share=0.1):
+    """
+    This function classifies community changes from the non empty overlap cells. An overlap is significant for a
+    community when it holds at least min_share of the community's nodes
+    split: a previous community with significant overlaps in two or more current communities
+    merge: a current community with significant overlaps from two or more previous communities
+    birth: a current community without any significant overlap
+    death: a previous community without any significant overlap (or without any remaining node)
+    :param previous_ids: numpy array of previous community ids (dense index -> id)
+    :param community_ids: numpy array of current community ids (dense index -> id)
+    :param rows: previous community of every non empty overlap cell
+    :param columns: current community of every non empty overlap cell
+    :param counts: overlap of every non empty overlap cell
+    :param previous_sizes: numpy array of previous community sizes (all previous nodes)
+    :param sizes: numpy array of current community sizes (all current nodes)
+    :param min_share: Smallest share of a community that counts as a significant overlap
+    :return: pandas DataFrame of events (event, previous, current, overlap), -1 where there is no counterpart
+    """
+    previous_significant = counts >= min_share * previous_sizes[rows]
+    significant = counts >= min_share * sizes[columns]
+    previous_parts = np.bincount(rows[previous_significant], minlength=len(previous_ids))
+    parts = np.bincount(columns[significant], minlength=len(community_ids))
+
+    # One row per significant overlap of a split or merged community, one row per birth and death
+    splits = previous_significant & (previous_parts[rows] > 1)
+    merges = significant & (parts[columns] > 1)
+    births = np.flatnonzero(parts == 0)
+    deaths = np.flatnonzero(previous_parts == 0)
+    no_counterpart = np.full(len(births) + len(deaths), -1, dtype=np.int64)
+    events = pd.DataFrame({
+        'event': np.repeat(EVENTS, [splits.sum(), merges.sum(), len(births), len(deaths)]),
+        'previous': np.concatenate([previous_ids[rows[splits]], previous_ids[rows[merges]],
+                                    no_counterpart[:len(births)], previous_ids[deaths]]),
+        'current': np.concatenate([community_ids[columns[splits]], community_ids[columns[merges]],
+                                   community_ids[births], no_counterpart[len(births):]]),
+        'overlap': np.concatenate([counts[splits], counts[merges], np.zeros(len(births) + len(deaths),
+                                                                            dtype=counts.dtype)]),
+    }, columns=['event', 'previous', 'current', 'overlap'])
+
+    # Return
+    return events
+
+
+# Diff two partitions
+def diff_partitions(previous=None, current=None, min_share=0.1):
+    """
+    This function lists the moved nodes and the community events between two partitions
+    :param previous: (nodes, membership) of the previous partition
+    :param current: (nodes, membership) of the current partition
+    :param min_share: Smallest share of a community that counts as a significant overlap
+    :return: pandas DataFrame of moved nodes, pandas DataFrame of events, python dictionary of summary counts
+    """
+    previous_nodes, previous_membership = previous
+    current_nodes, current_membership = current
+    previous_ids, previous_dense = np.unique(previous_membership, return_inverse=True)
+    community_ids, current_dense = np.unique(current_membership, return_inverse=True)
+    previous_dense = previous_dense.ravel().astype(np.int64)
+    current_dense = current_dense.ravel().astype(np.int64)
+    common, previous_index, current_index = np.intersect1d(previous_nodes, current_nodes, assume_unique=True,
+                                                           return_indices=True)
+
+    # Sparse overlap matrix of the common nodes (previous communities are rows)
+    cells, counts = np.unique(previous_dense[previous_index] * len(community_ids) + current_dense[current_index],
+                              return_counts=True)
+    rows = cells // max(len(community_ids), 1)
+    columns = cells % max(len(community_ids), 1)
+
+    moved = moved_nodes(common, previous_dense[previous_index], current_dense[current_index], previous_ids,
+                        community_ids, rows, columns, counts)
+    events = community_events(previous_ids, community_ids, rows, columns, counts, np.bincount(previous_dense),
+                              np.bincount(current_dense), min_share)
+    summary = {
+        'common_nodes': len(common),
+        'added_nodes': len(current_nodes) - len(common),
+        'removed_nodes': len(previous_nodes) - len(common),
+        'moved_nodes': len(moved),
+    }
+    for event in EVENTS:
+        community_column = 'current' if event in ('merge', 'birth') else 'previous'
+        summary[event] = int(events.loc[events['event'] == event, community_column].nunique())
+
+    # Return
+    return moved, events, summary
+
+
+# Print diff summary
+def print_summary(summary=None):
+    """
+    This function prints the summary returned by diff_partitions()
+    :param summary: python dictionary of summary counts
+    :return: NULL
+    """
+    print('--------------- Diff ----------------------')
+    print('Nodes: {} common, {} added, {} removed'.format(summary['common_nodes'], summary['added_nodes'],
+                                                         summary['removed_nodes']), log_type='info')
+    print('Moved nodes: ', log_type='info', end='')
+    print('{}'.format(summary['moved_nodes']), color='cyan', text_format='bold')
+    print('Communities: {} split, {} merged, {} born, {} died'.format(summary['split'], summary['merge'],
+                                                                     summary['birth'], summary['death']),
+          log_type='info')
+    print('-------------------------------------------')
+
+
+# Write diff files
+def write_diff(moved=None, events=None, output_file=None):
+    """
+    This function writes the moved nodes (.moved) and the community events (.events) as csv files
+    :param moved: pandas DataFrame of moved nodes
+    :param events: pandas DataFrame of events
+    :param output_file: name and location of the output files, the extension is replaced
+    :return: <> file object <>
+    """
+    base_name = output_file.rsplit('.', 1)[0]
+    try:
+        print('Creating diff (.moved/.events) files.....', log_type='info')
+        moved.to_csv(base_name + '.moved', index=False)
+        events.to_csv(base_name + '.events', index=False)
+    except Exception as e:
+        print('Can not create diff files! ERROR: {}'.format(e), log_type='error')
+        sys.exit(1)
+
+
+# Command Center
+def command_center(previous_file=None, current_file=None, min_share=0.1, output=None):
+    """
+    This function controls the other functions
+    :param previous_file: Community (.npz/.pkl) file of the previous run
+    :param current_file: Community (.npz/.pkl) file of the current run
+    :param min_share: Smallest share of a community that counts as a significant overlap
+    :param output: Boolean, yes/no if the diff files are created next to the current community file
+    :return: python dictionary of summary counts
+    """
+    print('Initializing.....', log_type='info')
+    previous = file_operations.read_community_file(previous_file)
+    current = file_operations.read_community_file(current_file)
+    moved, events, summary = diff_partitions(previous, current, min_share)
+    print_summary(summary)
+    if output is None or output == 'Yes' or output == 'Y' or output == 'y' or output == 'yes':
+        write_diff(moved, events, current_file)
+
+    # Return
+    return summary
+
+
+# Standard boilerplate for running this source code file as a standalone segment
+if __name__ == '__main__':
+    """
+    Parse arguments and follow through to mission control
+    """
+    # Initial message
+    file_operations.initial_message(os.path.basename(__file__), 'partition diff')
+
+    # Create parser
+    parser = argparse.ArgumentParser(prog='partition_diff.py',
+                                     usage='python %(prog)s <previous_community_file> <community_file> <options>',
+                                     description='Moved nodes and split/merged/born/dead communities between '
+                                                 'two runs',
+                                     add_help=True)
+
+    parser.add_argument('previous', action='store',
+                        help='Community (.npz/.pkl) file of the previous run. E.g. /home/user/data/old/Louvain_x.pkl')
+    parser.add_argument('current', action='store',
+                        help='Community (.npz/.pkl) file of the current run. E.g. /home/user/data/Louvain_x.pkl')
+    parser.add_argument('--min-share', action='store', dest='min_share', required=False, type=float,
+                        help='Smallest share of a community that counts as a significant overlap. Default is 0.1')
+    parser.add_argument('-o', '--output', action='store', dest='output', required=False,
+                        help='Boolean - yes/no (To create the .moved/.events files next to the current community '
+                             'file)')
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    # Double checking the arguments
+    if args.min_share is not None:
+        _min_share = args.min_share
+    else:
+        _min_share = 0.1
+    if args.output:
+        _output = args.output
+    else:
+        _output = 'Yes'
+
+    # Command Center
+    command_center(previous_file=args.previous, current_file=args.current, min_share=_min_share, output=_output)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+# Import python libraries
+import os
+import sys
+import json
+import argparse
+
+# Import custom python libraries
+try:
+    from pyrainbowterm import *
+except ImportError:
+    print('Can not import pyrainbowterm!', log_type='error')
+    print('Try: pip install pyrainbowterm', log_type='hint')
+    sys.exit(1)
+
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError as e:
+    print('Can not import python numpy/pandas library! ERROR: {}'.format(e), log_type='error')
+    sys.exit(1)
+
+# Import file_operations
+import file_operations
+
+# Source code meta data
+__author__ = 'Dalwar Hossain'
+__email__ = 'dalwar.hossain@protonmail.com'
+
+
+# Dense node indices of the edge endpoints
+def edge_node_index(nodes=None, sources=None, targets=None):
+    """
+    This function locates the endpoints of every edge in the (sorted) node array
+    :param nodes: numpy array of nodes
+    :param sources: numpy array of source nodes
+    :param targets: numpy array of target nodes
+    :return: sort order of nodes, index (into the sorted nodes) of sources and targets
+    """
+    order = np.argsort(nodes, kind='mergesort')
+    sorted_nodes = nodes[order]
+    source_index = np.searchsorted(sorted_nodes, sources)
+    target_index = np.searchsorted(sorted_nodes, targets)
+    last = len(sorted_nodes) - 1
+    if not len(sorted_nodes) or (sorted_nodes[np.minimum(source_index, last)] != sources).any() or \
+            (sorted_nodes[np.minimum(target_index, last)] != targets).any():
+        print('Some nodes of the graph have no community!', log_type='error')
+        sys.exit(1)
+
+    # Return
+    return order, source_index, target_index
+
+
+# Partition quality metrics
+def partition_metrics(edges=None, nodes=None, membership=None):
+    """
+    This function computes the quality of a partition with a few bincounts over the edge arrays: modularity, coverage,
+    performance, and size, internal weight, volume, cut and conductance of every community
+    Weights are used for modularity, coverage and conductance, performance counts distinct node pairs.
+    :param edges: Edge arrays (sources, targets, weights)
+    :param nodes: numpy array of nodes
+    :param membership: numpy array of community ids of the nodes
+    :return: python dictionary of metrics (per community metrics as a pandas DataFrame under 'community_table')
+    """
+    sources, targets, weights = edges
+    nodes = np.asarray(nodes)
+    community_ids, membership = np.unique(np.asarray(membership), return_inverse=True)
+    membership = membership.ravel()
+    n_communities = len(community_ids)
+    order, source_index, target_index = edge_node_index(nodes, sources, targets)
+    sorted_membership = membership[order]
+    source_communities = sorted_membership[source_index]
+    target_communities = sorted_membership[target_index]
+    weights = np.ones(len(sources)) if weights is None else weights.astype(np.float64)
+    total_weight = weights.sum()
+
+    # Weight inside every community and volume (sum of degrees) of every community
+    intra = source_communities == target_communities
+    internal = np.bincount(source_communities[intra], weights=weights[intra], minlength=n_communities)
+    volume = np.bincount(source_communities, weights=weights, minlength=n_communities) + \
+        np.bincount(target_communities, weights=weights, minlength=n_communities)
+    cut = volume - 2 * internal
+    sizes = np.bincount(membership, minlength=n_communities)
+
+    if total_weight > 0:
+        modularity = (internal / total_weight - (volume / (2 * total_weight)) ** 2).sum()
+        coverage = internal.sum() / total_weight
+    else:
+        modularity = coverage = 0.0
+    denominator = np.minimum(volume, 2 * total_weight - volume)
+    conductance = np.zeros(n_communities)
+    np.divide(cut, denominator, out=conductance, where=denominator > 0)
+
+    # Performance: correctly classified node pairs (intra edges and inter non-edges) over all pairs
+    n_nodes = len(nodes)
+    simple = source_index != target_index
+    low = np.minimum(source_index[simple], target_index[simple]).astype(np.int64)
+    high = np.maximum(source_index[simple], target_index[simple]).astype(np.int64)
+    pairs = np.unique(low * n_nodes + high)
+    intra_pairs = int((sorted_membership[pairs // n_nodes] == sorted_membership[pairs % n_nodes]).sum())
+    inter_pairs = len(pairs) - intra_pairs
+    all_pairs = n_nodes * (n_nodes - 1) / 2.0
+    possible_intra_pairs = (sizes * (sizes - 1) / 2.0).sum()
+    performance = (intra_pairs + all_pairs - possible_intra_pairs - inter_pairs) / all_pairs if all_pairs else 1.0
+
+    communities = pd.DataFrame({'community': community_ids, 'size': sizes, 'internal_weight': internal,
+                                'volume': volume, 'cut': cut, 'conductance': conductance},
+                               columns=['community', 'size', 'internal_weight', 'volume', 'cut', 'conductance'])
+    metrics = {
+        'nodes': n_nodes,
+        'edges': len(sources),
+        'communities': n_communities,
+        'community_table': communities,
+        'modularity': float(modularity),
+        'coverage': float(coverage),
+        'performance': float(performance),
+        'mean_conductance': float(conductance.mean()) if n_communities else 0.0,
+        'size_distribution': {
+            'min': int(sizes.min()) if n_communities else 0,
+            'max': int(sizes.max()) if n_communities else 0,
+            'mean': float(sizes.mean()) if n_communities else 0.0,
+            'median': float(np.median(sizes)) if n_communities else 0.0,
+            'singletons': int((sizes == 1).sum()),
+        },
+    }
+
+    # Return
+    return metrics
+
+
+# Print partition metrics
+def print_metrics(metrics=None):
+    """
+    This function prints the summary of partition metrics
+    :param metrics: python dictionary returned by partition_metrics()
+    :return: NULL
+    """
+    print('--------------- Metrics -------------------')
+    for name in ['modularity', 'coverage', 'performance', 'mean_conductance']:
+        print('{}: '.format(name.replace('_', ' ').capitalize()), log_type='info', end='')
+        print('{:.6f}'.format(metrics[name]), color='cyan', text_format='bold')
+    sizes = metrics['size_distribution']
+    print('Community sizes: min {} / median {} / mean {:.2f} / max {}, {} singletons'.format(
+        sizes['min'], sizes['median'], sizes['mean'], sizes['max'], sizes['singletons']), log_type='info')
+    print('-------------------------------------------')
+
+
+# Write partition metrics
+def write_metrics(metrics=None, output_file=None):
+    """
+    This function writes the summary (.metrics, json) and the per community metrics (.cmetrics, csv)
+    :param metrics: python dictionary returned by partition_metrics()
+    :param output_file: name and location of the output files, the extension is replaced
+    :return: <> file object <>
+    """
+    base_name = output_file.rsplit('.', 1)[0]
+    summary = dict((name, value) for name, value in metrics.items() if name != 'community_table')
+    try:
+        print('Creating metrics (.metrics/.cmetrics) files.....', log_type='info')
+        with open(base_name + '.metrics', 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+        metrics['community_table'].to_csv(base_name + '.cmetrics', index=False)
+    except Exception as e:
+        print('Can not create metrics files! ERROR: {}'.format(e), log_type='error')
+
+
+# Command Center
+def command_center(input_file=None, delimiter=None, weighted=None, community_file=None, output=None):
+    """
+    This function controls the other functions
+    :param input_file: Input file with edges of the graph
+    :param delimiter: Column separator
+    :param weighted: Is the file has a weight column? (yes/no)
+    :param community_file: Community (.pkl) file created by one of the na_* scripts
+    :param output: Boolean, yes/no if the metrics files will be created or not
+    :return: <>
+    """
+    # Import graph composer
+    import graph_composer
+
+    print('Initializing.....', log_type='info')
+    edges = graph_composer.compose_edge_arrays(input_file, delimiter, weighted)
+    nodes, membership = file_operations.read_community_file(community_file)
+    metrics = partition_metrics(edges, nodes, membership)
+    print_metrics(metrics)
+    if output is None or output == 'Yes' or output == 'Y' or output == 'y' or output == 'yes':
+        write_metrics(metrics, community_file)
+
+
+# Standard boilerplate for running this source code file as a standalone segment
+if __name__ == '__main__':
+    """
+    Parse arguments and follow through to mission control
+    """
+    # Initial message
+    file_operations.initial_message(os.path.basename(__file__), 'partition metrics')
+
+    # Create parser
+    parser = argparse.ArgumentParser(prog='partition_metrics.py',
+                                     usage='python %(prog)s <input_file> <community_file> <options>',
+                                     description='Quality metrics of a detected partition',
+                                     add_help=True)
+
+    parser.add_argument('-i', '--input-file', action='store', dest='input', required=True,
+                        help='Input file absolute path. E.g. /home/user/data/input/file_name.txt/.csv/.dat etc.')
+    parser.add_argument('-c', '--community-file', action='store', dest='community_file', required=True,
+                        help='Community (.pkl) file of the input file. E.g. /home/user/data/Louvain_file_name.pkl')
+    parser.add_argument('-d', '--delimiter', action='store', dest='delimiter', required=False,
+                        help='Separator for the input file. E.g. (,)/(";" need to be quoted)/tab/space.'
+                             'Default is whitespace')
+    parser.add_argument('-w', '--weighted', action='store', dest='weighted', required=False,
+                        help='Boolean - yes/no if the file has weight column')
+    parser.add_argument('-o', '--output', action='store', dest='output', required=False,
+                        help='Boolean - yes/no (To create the .metrics/.cmetrics files next to the community file)')
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    # Double checking the arguments
+    if args.delimiter:
+        _delimiter = args.delimiter
+    else:
+        print('No delimiter provided! Using default (whitespace).....', log_type='info')
+        _delimiter = None
+    if args.weighted:
+        _weighted = args.weighted
+    else:
+        print('No weighted parameter provided! Using default (No).....', log_type='info')
+        _weighted = 'No'
+    if args.output:
+        _output = args.output
+    else:
+        _output = 'Yes'
+
+    # Command Center
+    command_center(input_file=args.input, delimiter=_delimiter, weighted=_weighted,
+                   community_file=args.community_file, output=_output)